@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks for the FM transmit DSP path. Runs without an SDR attached.
+
+Usage:
+    python benchmark_dsp.py precision [--seconds 60]
+    python benchmark_dsp.py nco [--seconds 60] [--table-sizes 1024 4096 65536]
+    python benchmark_dsp.py engines [--seconds 60]
+    python benchmark_dsp.py plans [--quality standard]
+    python benchmark_dsp.py txformat [--seconds 60]
+    python benchmark_dsp.py txplan [--messages 10] [--seconds 2]
+    python benchmark_dsp.py channels [--seconds 10] [--counts 1 2 4 8]
+    python benchmark_dsp.py parallel [--seconds 60] [--workers 2 4 8] [--modulators exact lut fixed]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from scipy.signal import welch
+
+from fm_dsp import (ChannelMixer, FMModulator, NCOModulator, ResamplingPlan, create_modulator, get_resampling_plan,
+                    clear_resampling_plans, BLOCK_SIZE, MODULATOR_MODES, RESAMPLING_QUALITIES, DEFAULT_QUALITY)
+from parallel_fm import create_executor, parallel_fm_signal_blocks
+from sdr_session import PlutoSession
+from threaded_transmitter import ThreadedTransmitter
+from transmit_fm import (TransmitPlan, even_channel_offsets, fm_signal_blocks, normalization_gain, transmit_audio, FM_DEVIATION, AUDIO_TARGET_RATE, SAMPLE_RATE, FM_ENGINES,
+                         CENTER_FREQ, TX_GAIN, CHUNK_SIZE, DAC_SCALE)
+
+# --- Parameters ---
+DEFAULT_SECONDS = 60.0   # Message length to benchmark
+DEFAULT_AUDIO_RATE = 22050 # Typical TTS output rate
+ACCURACY_SECONDS = 5.0   # Length used for sample-by-sample accuracy comparisons
+NCO_TABLE_SIZES = (256, 1024, 4096, 65536) # Lookup table sizes compared by the nco benchmark
+SPUR_TEST_LENGTH = 2**16 # FFT length of the constant-tone spur measurement
+PURITY_SECONDS = 5.0     # Length of the output analysed for spectral purity
+PLAN_MESSAGES = 10       # Messages sent by the txplan benchmark
+PLAN_MESSAGE_SECONDS = 2.0 # Length of each of them
+CHANNEL_SECONDS = 10.0   # Message length per channel for the channels benchmark
+CHANNEL_COUNTS = (1, 2, 4, 8) # Numbers of simultaneous FM channels compared
+PARALLEL_WORKERS = (2, 4, 8) # Worker counts compared with the serial path
+PARALLEL_TOLERANCE = {"exact": 1e-4, "lut": 1e-2, "fixed": 1e-2} # Max deviation from serial, of full scale;
+                                                                  # lookup tables quantize the segment phase offsets
+PLAN_RATE_PAIRS = ((22050, 48000), (24000, 48000), (44100, 48000), (48000, 1e6),
+                   (22050, 1e6), (44100, 1e6), (48000, 2.4e6)) # Conversions compared by the plans benchmark
+
+def synthetic_audio(seconds, rate=DEFAULT_AUDIO_RATE, seed=0):
+    """
+    Generates a speech-like test signal: a few voiced harmonics plus noise.
+
+    Args:
+        seconds (float): Duration in seconds.
+        rate (int): Sample rate in Hz.
+        seed (int): Random seed for the noise component.
+
+    Returns:
+        np.ndarray: Mono float32 samples peak-normalized to 1.0.
+    """
+    t = np.arange(int(seconds * rate)) / rate
+    rng = np.random.default_rng(seed)
+    audio = sum(np.sin(2 * np.pi * f * t) / (i + 1) for i, f in enumerate((180, 360, 720, 1400, 2900)))
+    audio = audio * (0.6 + 0.4 * np.sin(2 * np.pi * 3 * t)) + 0.05 * rng.standard_normal(len(t))
+    return (audio / np.max(np.abs(audio))).astype(np.float32)
+
+def measure(make_blocks):
+    """
+    Runs a block generator to completion, once for time and once for memory.
+
+    Args:
+        make_blocks (callable): Returns a fresh iterable of output blocks.
+
+    Returns:
+        dict: 'seconds' (wall time), 'peak_bytes' (tracemalloc peak while running),
+              'samples' and 'dtype' of the output.
+    """
+    start = time.perf_counter()
+    samples = 0
+    dtype = None
+    for block in make_blocks():
+        samples += len(block)
+        dtype = block.dtype
+    seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    for block in make_blocks():
+        pass
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'seconds': seconds, 'peak_bytes': peak_bytes, 'samples': samples, 'dtype': dtype}
+
+def benchmark_precision(seconds):
+    """Compares the float64 and float32 DSP paths for time, memory and accuracy."""
+    audio = synthetic_audio(seconds)
+    print(f"--- DSP precision benchmark: {seconds:.0f}s message, "
+          f"{DEFAULT_AUDIO_RATE} Hz -> {AUDIO_TARGET_RATE / 1e3:.0f} kHz -> {SAMPLE_RATE / 1e6:.1f} MS/s ---")
+
+    results = {}
+    for name, dtype in (("float64", np.float64), ("float32", np.float32)):
+        results[name] = measure(lambda: fm_signal_blocks(audio, DEFAULT_AUDIO_RATE, dtype=dtype))
+
+    # Sample-by-sample comparison on a shorter excerpt
+    excerpt = audio[:int(ACCURACY_SECONDS * DEFAULT_AUDIO_RATE)]
+    reference = np.concatenate(list(fm_signal_blocks(excerpt, DEFAULT_AUDIO_RATE, dtype=np.float64)))
+    single = np.concatenate(list(fm_signal_blocks(excerpt, DEFAULT_AUDIO_RATE, dtype=np.float32)))
+    full_scale = 0.5 * (2**15)
+    max_error = np.max(np.abs(single - reference)) / full_scale
+    error_db = 20 * np.log10(np.sqrt(np.mean(np.abs(single - reference)**2)) / full_scale)
+
+    print(f"{'path':<10}{'time (s)':>10}{'x realtime':>12}{'peak MB':>10}{'IQ type':>12}{'IQ MB total':>13}")
+    for name, r in results.items():
+        iq_mb = r['samples'] * r['dtype'].itemsize / 1e6
+        print(f"{name:<10}{r['seconds']:>10.2f}{seconds / r['seconds']:>12.1f}"
+              f"{r['peak_bytes'] / 1e6:>10.1f}{str(r['dtype']):>12}{iq_mb:>13.0f}")
+    saved = 1 - results['float32']['seconds'] / results['float64']['seconds']
+    print(f"float32 saves {saved * 100:.0f}% of DSP time and "
+          f"{results['float64']['peak_bytes'] / max(results['float32']['peak_bytes'], 1):.1f}x peak working memory.")
+    print(f"A whole-message IQ array would need {results['float64']['samples'] * 16 / 1e6:.0f} MB as complex128 "
+          f"vs {results['float32']['samples'] * 8 / 1e6:.0f} MB as complex64.")
+    print(f"float32 vs float64 output over {ACCURACY_SECONDS:.0f}s: max error {max_error:.2e} of full scale "
+          f"(RMS {error_db:.0f} dBFS)")
+
+def run_modulator(modulator, audio, block_size=BLOCK_SIZE):
+    """
+    Modulates audio block by block.
+
+    Returns:
+        tuple: (seconds, output) with the wall time spent in process() and the
+               concatenated complex output.
+    """
+    blocks = []
+    start = time.perf_counter()
+    for i in range(0, len(audio), block_size):
+        blocks.append(modulator.process(audio[i:i + block_size]))
+    seconds = time.perf_counter() - start
+    return seconds, np.concatenate(blocks)
+
+def spur_free_dynamic_range(signal, exclude_bins=32):
+    """
+    Measures the SFDR of a single-tone complex signal.
+
+    Args:
+        signal (np.ndarray): Complex samples of one carrier.
+        exclude_bins (int): Bins either side of the carrier treated as its main lobe.
+
+    Returns:
+        float: Carrier power over the strongest other spectral component, in dB.
+    """
+    spectrum = np.abs(np.fft.fft(signal * np.kaiser(len(signal), 20.0)))**2
+    peak = int(np.argmax(spectrum))
+    bins = (np.arange(len(spectrum)) - peak) % len(spectrum)
+    spurs = spectrum[(bins > exclude_bins) & (bins < len(spectrum) - exclude_bins)]
+    return 10 * np.log10(spectrum[peak] / max(np.max(spurs), 1e-300))
+
+def benchmark_nco(seconds, table_sizes):
+    """Compares the lookup-table NCO modulators with the exact cos/sin path."""
+    rate = AUDIO_TARGET_RATE
+    audio = synthetic_audio(seconds, int(rate))
+    # A constant input gives a single carrier offset, so phase quantization spurs stand out
+    tone = np.full(SPUR_TEST_LENGTH, 0.371, dtype=np.float32)
+    print(f"--- FM modulator benchmark: {seconds:.0f}s at {rate / 1e3:.0f} kHz, "
+          f"{FM_DEVIATION / 1e3:.1f} kHz deviation, blocks of {BLOCK_SIZE} ---")
+
+    candidates = [("exact float64", lambda: FMModulator(FM_DEVIATION, rate, dtype=np.float64)),
+                  ("exact float32", lambda: FMModulator(FM_DEVIATION, rate))]
+    for size in table_sizes:
+        candidates.append((f"lut {size}", lambda size=size: NCOModulator(FM_DEVIATION, rate, table_size=size)))
+        candidates.append((f"fixed {size}", lambda size=size: NCOModulator(FM_DEVIATION, rate, table_size=size,
+                                                                           fixed_point=True)))
+
+    reference = None
+    print(f"{'modulator':<16}{'MS/s':>8}{'speedup':>9}{'max error':>12}{'RMS error':>12}{'SFDR':>9}{'end phase err':>15}")
+    for name, make in candidates:
+        modulator = make()
+        elapsed, output = run_modulator(modulator, audio)
+        end_phase = modulator.phase
+        sfdr = spur_free_dynamic_range(run_modulator(make(), tone)[1])
+        if reference is None:
+            reference, reference_time, reference_phase = output, elapsed, end_phase
+        error = np.abs(output - reference)
+        rms = np.sqrt(np.mean(error**2))
+        rms_db = f"{20 * np.log10(rms):.0f} dBc" if rms > 0 else "-"
+        phase_error = abs((end_phase - reference_phase + np.pi) % (2 * np.pi) - np.pi)
+        print(f"{name:<16}{len(audio) / elapsed / 1e6:>8.1f}{reference_time / elapsed:>8.1f}x"
+              f"{np.max(error):>12.2e}{rms_db:>12}{sfdr:>6.0f} dB{phase_error:>15.1e}")
+    print("Errors are against the exact float64 modulator. SFDR is measured on a constant "
+          "carrier offset; the exact path is limited by the FFT window.")
+
+def spectral_purity(iq, sample_rate, occupied_half_width):
+    """
+    Summarizes how much of an FM signal lands outside its channel.
+
+    Args:
+        iq (np.ndarray): Complex baseband samples.
+        sample_rate (float): Sample rate in Hz.
+        occupied_half_width (float): Half of the expected occupied bandwidth in Hz.
+
+    Returns:
+        tuple: (out_of_channel_dbc, far_spur_db): power outside +/- occupied_half_width
+               relative to the total, and the strongest PSD bin beyond twice that
+               offset relative to the PSD peak.
+    """
+    freqs, psd = welch(iq, fs=sample_rate, nperseg=8192, return_onesided=False, scaling="spectrum")
+    offset = np.abs(freqs)
+    outside = np.sum(psd[offset > occupied_half_width]) / np.sum(psd)
+    far = np.max(psd[offset > 2 * occupied_half_width]) / np.max(psd)
+    return 10 * np.log10(max(outside, 1e-300)), 10 * np.log10(max(far, 1e-300))
+
+def benchmark_engines(seconds):
+    """Compares the two-stage and direct-at-SDR-rate modulation engines."""
+    audio = synthetic_audio(seconds)
+    excerpt = audio[:int(PURITY_SECONDS * DEFAULT_AUDIO_RATE)]
+    # Carson's rule with the highest audio frequency the source can hold
+    half_width = FM_DEVIATION + DEFAULT_AUDIO_RATE / 2
+    print(f"--- FM engine benchmark: {seconds:.0f}s message, {DEFAULT_AUDIO_RATE} Hz audio -> "
+          f"{SAMPLE_RATE / 1e6:.1f} MS/s, channel +/-{half_width / 1e3:.1f} kHz ---")
+    print(f"{'engine':<12}{'modulator':<11}{'time (s)':>10}{'x realtime':>12}{'out of channel':>16}{'far spurs':>11}")
+    baseline = None
+    for engine in FM_ENGINES:
+        modulation_rate = SAMPLE_RATE if engine == "direct" else AUDIO_TARGET_RATE
+        for mode in ("exact", "lut"):
+            def blocks(signal):
+                modulator = create_modulator(mode, FM_DEVIATION, modulation_rate)
+                return fm_signal_blocks(signal, DEFAULT_AUDIO_RATE, modulator=modulator, engine=engine)
+            start = time.perf_counter()
+            for block in blocks(audio):
+                pass
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            out_dbc, far_db = spectral_purity(np.concatenate(list(blocks(excerpt))), SAMPLE_RATE, half_width)
+            print(f"{engine:<12}{mode:<11}{elapsed:>10.2f}{seconds / elapsed:>12.1f}"
+                  f"{out_dbc:>12.1f} dBc{far_db:>8.1f} dB   ({baseline / elapsed:.2f}x)")
+    print("Out of channel: power beyond Carson's bandwidth over the total. Far spurs: strongest "
+          "PSD bin beyond twice that offset, relative to the PSD peak.")
+
+def benchmark_plans(quality):
+    """Times resampling plan design against cache hits and reports the cost of each plan."""
+    print(f"--- Resampling plan benchmark ({quality} quality) ---")
+    print(f"{'conversion':<24}{'stages':<18}{'taps':>7}{'MACs/out':>10}{'design ms':>11}{'disk ms':>9}{'hit us':>8}")
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for in_rate, out_rate in PLAN_RATE_PAIRS:
+            clear_resampling_plans()
+            start = time.perf_counter()
+            plan = get_resampling_plan(in_rate, out_rate, quality, cache_dir) # Designs and saves
+            design = time.perf_counter() - start
+            clear_resampling_plans()
+            start = time.perf_counter()
+            get_resampling_plan(in_rate, out_rate, quality, cache_dir) # Loads from disk
+            disk = time.perf_counter() - start
+            start = time.perf_counter()
+            get_resampling_plan(in_rate, out_rate, quality, cache_dir) # In-memory hit
+            hit = time.perf_counter() - start
+            stages = " -> ".join(f"{up}/{down}" for up, down, _ in plan.stages)
+            print(f"{f'{in_rate:g} -> {out_rate:g}':<24}{stages:<18}{plan.num_taps:>7}{plan.macs_per_output:>10.1f}"
+                  f"{design * 1e3:>11.2f}{disk * 1e3:>9.2f}{hit * 1e6:>8.1f}")
+            single = ResamplingPlan(in_rate, out_rate, quality, max_taps=2**31)
+            if len(plan.stages) > 1:
+                print(f"{'':<24}{'(single stage)':<18}{single.num_taps:>7}{single.macs_per_output:>10.1f}")
+
+def benchmark_tx_format(seconds):
+    """Compares complex TX buffers converted by the driver with pre-converted int16 buffers."""
+    blocks = list(fm_signal_blocks(synthetic_audio(seconds), DEFAULT_AUDIO_RATE))
+    print(f"--- TX buffer format benchmark: {seconds:.0f}s message, chunks of {CHUNK_SIZE} samples, null: sink ---")
+    results = {}
+    for name, dtype in (("complex64", np.complex64), ("int16 I/Q", np.int16)):
+        with PlutoSession("null:", CENTER_FREQ, SAMPLE_RATE, TX_GAIN) as session:
+            transmitter = ThreadedTransmitter(session, CHUNK_SIZE, dtype=dtype)
+            transmitter.transmit(blocks)
+            results[name] = dict(transmitter.stats)
+    print(f"{'buffers':<12}{'tx() avg us':>13}{'tx() max us':>13}{'producer conversion us':>24}")
+    for name, stats in results.items():
+        buffers = max(stats['buffers'], 1)
+        print(f"{name:<12}{stats['tx_seconds'] / buffers * 1e6:>13.1f}{stats['max_tx_seconds'] * 1e6:>13.1f}"
+              f"{stats['convert_seconds'] / buffers * 1e6:>24.1f}")
+    print("tx() time is spent in the TX thread; the null: sink converts complex buffers the way pyadi-iio does.")
+
+def benchmark_tx_plan(messages, seconds):
+    """Compares one transmit_audio() call per message with one TransmitPlan reused for all of them."""
+    audio = synthetic_audio(seconds)
+    print(f"--- Transmit plan benchmark: {messages} messages of {seconds:g}s, null: sink ---")
+    clear_resampling_plans()
+    with contextlib.redirect_stdout(io.StringIO()): # Per-message logging would dominate the timings
+        start = time.perf_counter()
+        for _ in range(messages):
+            transmit_audio(audio, sdr_uri="null:", audio_rate=DEFAULT_AUDIO_RATE)
+        per_call = (time.perf_counter() - start) / messages
+        clear_resampling_plans()
+        start = time.perf_counter()
+        with TransmitPlan("null:") as plan:
+            plan.open()
+            setup = time.perf_counter() - start
+            start = time.perf_counter()
+            for _ in range(messages):
+                plan.transmit(audio, DEFAULT_AUDIO_RATE)
+            per_message = (time.perf_counter() - start) / messages
+    print(f"transmit_audio() per message:        {per_call * 1e3:7.1f} ms (setup and teardown every time)")
+    print(f"TransmitPlan setup, once:            {setup * 1e3:7.1f} ms "
+          f"({plan.stats['design_seconds'] * 1e3:.1f} ms design, {plan.stats['open_seconds'] * 1e3:.1f} ms connect)")
+    print(f"TransmitPlan.transmit() per message: {per_message * 1e3:7.1f} ms "
+          f"({plan.stats['first_tx_delay'] / messages * 1e3:.1f} ms to first buffer)")
+
+def benchmark_channels(seconds, counts):
+    """Measures the CPU cost of frequency-multiplexed transmission against the number of channels."""
+    print(f"--- Multi-channel benchmark: {seconds:g}s per channel at {SAMPLE_RATE / 1e6:.1f} MS/s ---")
+    print(f"{'channels':>8}{'total s':>10}{'x realtime':>12}{'per channel s':>15}{'mixer s':>10}{'mixer share':>13}")
+    with contextlib.redirect_stdout(io.StringIO()):
+        plan = TransmitPlan("null:")
+    for count in counts:
+        messages = [(synthetic_audio(seconds, seed=index), DEFAULT_AUDIO_RATE) for index in range(count)]
+        offsets = even_channel_offsets(count)
+        with contextlib.redirect_stdout(io.StringIO()):
+            blocks = plan.multichannel_blocks(messages, offsets)
+        start = time.perf_counter()
+        samples = sum(len(block) for block in blocks)
+        total = time.perf_counter() - start
+        # The mixing stage alone, on blocks of the same shape
+        mixer = ChannelMixer(offsets, SAMPLE_RATE)
+        block = np.ones((count, CHUNK_SIZE * 16), dtype=np.complex64)
+        start = time.perf_counter()
+        for _ in range(samples // block.shape[1]):
+            mixer.process(block)
+        mixing = time.perf_counter() - start
+        airtime = samples / SAMPLE_RATE
+        print(f"{count:>8}{total:>10.2f}{airtime / total:>12.1f}{total / count:>15.2f}"
+              f"{mixing:>10.2f}{mixing / total:>12.0%}")
+    print("Per channel: total time over the channel count; the FM path of each channel dominates, "
+          "the mixer adds one complex multiply-add per sample per channel.")
+
+def benchmark_parallel(seconds, worker_counts, modes):
+    """
+    Compares serial modulation of a long message with the segmented multi-core path.
+
+    Every worker count runs on a process pool and on a thread pool, and each
+    output is checked against fm_signal_blocks() within PARALLEL_TOLERANCE.
+
+    Returns:
+        bool: True if every parallel output matched the serial one.
+    """
+    audio = synthetic_audio(seconds)
+    gain = normalization_gain(audio)
+    audio_plan = get_resampling_plan(DEFAULT_AUDIO_RATE, AUDIO_TARGET_RATE)
+    sdr_plan = get_resampling_plan(AUDIO_TARGET_RATE, SAMPLE_RATE)
+    print(f"--- Parallel DSP benchmark: {seconds:g}s message at {SAMPLE_RATE / 1e6:.1f} MS/s, "
+          f"{os.cpu_count()} cores ---")
+    print(f"{'engine':<12}{'modulator':<11}{'pool':<9}{'workers':>8}{'time (s)':>10}{'speedup':>9}"
+          f"{'max error':>12}  check")
+    matched = True
+    for engine in FM_ENGINES:
+        modulation_rate = SAMPLE_RATE if engine == "direct" else AUDIO_TARGET_RATE
+        for mode in modes:
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                reference = np.concatenate(list(fm_signal_blocks(
+                    audio, DEFAULT_AUDIO_RATE, modulator=create_modulator(mode, FM_DEVIATION, modulation_rate),
+                    engine=engine)))
+                serial = time.perf_counter() - start
+            print(f"{engine:<12}{mode:<11}{'serial':<9}{1:>8}{serial:>10.2f}{1.0:>8.2f}x")
+            for workers in worker_counts:
+                for use_threads in (False, True):
+                    start = time.perf_counter()
+                    with create_executor(workers, use_threads) as pool:
+                        modulator = create_modulator(mode, FM_DEVIATION, modulation_rate)
+                        iq = np.concatenate(list(parallel_fm_signal_blocks(
+                            audio, DEFAULT_AUDIO_RATE, gain, audio_plan, sdr_plan, modulator, engine, DAC_SCALE,
+                            workers, executor=pool)))
+                    elapsed = time.perf_counter() - start
+                    error = (np.max(np.abs(iq - reference)) / DAC_SCALE if len(iq) == len(reference)
+                             else float('inf'))
+                    ok = error <= PARALLEL_TOLERANCE[mode]
+                    matched = matched and ok
+                    print(f"{'':<23}{'thread' if use_threads else 'process':<9}{workers:>8}{elapsed:>10.2f}"
+                          f"{serial / elapsed:>8.2f}x{error:>12.1e}  {'ok' if ok else 'MISMATCH'}")
+    print("Max error: largest deviation from the serial output, relative to full scale; "
+          "times include starting the worker pool.")
+    return matched
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the FM transmit DSP path.")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    precision = subparsers.add_parser("precision", help="float64 vs float32 DSP path")
+    precision.add_argument("--seconds", type=float, default=DEFAULT_SECONDS,
+                           help=f"Message length in seconds (default: {DEFAULT_SECONDS:.0f})")
+    nco = subparsers.add_parser("nco", help="lookup-table NCO vs exact cos/sin modulator")
+    nco.add_argument("--seconds", type=float, default=DEFAULT_SECONDS,
+                     help=f"Audio length in seconds (default: {DEFAULT_SECONDS:.0f})")
+    nco.add_argument("--table-sizes", type=int, nargs="+", default=list(NCO_TABLE_SIZES),
+                     help="Lookup table sizes to compare (powers of two)")
+    engines = subparsers.add_parser("engines", help="two-stage vs direct-at-SDR-rate modulation")
+    engines.add_argument("--seconds", type=float, default=DEFAULT_SECONDS,
+                         help=f"Message length in seconds (default: {DEFAULT_SECONDS:.0f})")
+    plans = subparsers.add_parser("plans", help="resampling plan design cost and MACs per output sample")
+    plans.add_argument("--quality", choices=list(RESAMPLING_QUALITIES), default=DEFAULT_QUALITY,
+                       help=f"Filter design to plan (default: {DEFAULT_QUALITY})")
+    txformat = subparsers.add_parser("txformat", help="complex vs pre-converted int16 TX buffers")
+    txformat.add_argument("--seconds", type=float, default=DEFAULT_SECONDS,
+                          help=f"Message length in seconds (default: {DEFAULT_SECONDS:.0f})")
+    txplan = subparsers.add_parser("txplan", help="per-message transmit_audio() vs a reused TransmitPlan")
+    txplan.add_argument("--messages", type=int, default=PLAN_MESSAGES,
+                        help=f"Number of messages (default: {PLAN_MESSAGES})")
+    txplan.add_argument("--seconds", type=float, default=PLAN_MESSAGE_SECONDS,
+                        help=f"Length of each message in seconds (default: {PLAN_MESSAGE_SECONDS:g})")
+    channels = subparsers.add_parser("channels", help="CPU cost of multi-channel FM against the channel count")
+    channels.add_argument("--seconds", type=float, default=CHANNEL_SECONDS,
+                          help=f"Message length per channel in seconds (default: {CHANNEL_SECONDS:g})")
+    channels.add_argument("--counts", type=int, nargs="+", default=list(CHANNEL_COUNTS),
+                          help="Channel counts to compare")
+    parallel = subparsers.add_parser("parallel", help="serial vs multi-core segmented modulation")
+    parallel.add_argument("--seconds", type=float, default=DEFAULT_SECONDS,
+                          help=f"Message length in seconds (default: {DEFAULT_SECONDS:.0f})")
+    parallel.add_argument("--workers", type=int, nargs="+", default=list(PARALLEL_WORKERS),
+                          help="Worker counts to compare with the serial path")
+    parallel.add_argument("--modulators", choices=MODULATOR_MODES, nargs="+", default=list(MODULATOR_MODES),
+                          help="Modulators to check (default: all)")
+    args = parser.parse_args()
+
+    if args.benchmark == "precision":
+        benchmark_precision(args.seconds)
+    elif args.benchmark == "nco":
+        benchmark_nco(args.seconds, args.table_sizes)
+    elif args.benchmark == "engines":
+        benchmark_engines(args.seconds)
+    elif args.benchmark == "plans":
+        benchmark_plans(args.quality)
+    elif args.benchmark == "txformat":
+        benchmark_tx_format(args.seconds)
+    elif args.benchmark == "txplan":
+        benchmark_tx_plan(args.messages, args.seconds)
+    elif args.benchmark == "channels":
+        benchmark_channels(args.seconds, args.counts)
+    elif args.benchmark == "parallel":
+        if not benchmark_parallel(args.seconds, args.workers, args.modulators):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,659 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Streaming DSP building blocks for the FM transmitter.
+
+Each stage processes audio block by block and keeps its state between calls,
+so memory use does not grow with message length and the first block of
+output is available as soon as the first block of input has been processed.
+"""
+
+import itertools
+import math
+import os
+import threading
+from fractions import Fraction
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import firwin
+
+# --- Parameters ---
+BLOCK_SIZE = 4096 # Default number of input samples processed per block
+# Sample precision of the DSP path. Only the FM phase accumulator stays in
+# float64, where single precision would drift on long messages.
+DSP_DTYPE = np.float32
+LUT_SIZE = 4096      # Default number of entries in the NCO sin/cos table (power of two)
+NCO_PHASE_BITS = 32  # Width of the fixed-point NCO phase accumulator
+MODULATOR_MODES = ("exact", "lut", "fixed") # Choices for create_modulator()
+# Resampling filter designs: (half length in taps per unit of max(up, down), window).
+# "standard" is the design scipy.signal.resample_poly uses.
+RESAMPLING_QUALITIES = {
+    "low": (5, ('kaiser', 5.0)),
+    "standard": (10, ('kaiser', 5.0)),
+    "high": (20, ('kaiser', 8.0)),
+}
+DEFAULT_QUALITY = "standard"
+MAX_FILTER_TAPS = 16384 # Longer single-stage filters are split into several stages
+DEFAULT_PLAN_CACHE_DIR = None # Set to a directory to persist resampling plans as .npz
+
+class FMModulator:
+    """
+    Frequency modulator that carries the carrier phase across blocks.
+
+    Feeding a signal through process() in blocks of any size produces the same
+    output as modulating it in one go, and consecutive messages modulated with
+    the same instance join without a phase jump.
+    """
+
+    def __init__(self, fm_deviation, sample_rate, phase=0.0, dtype=DSP_DTYPE):
+        """
+        Args:
+            fm_deviation (float): FM frequency deviation in Hz for a full-scale input.
+            sample_rate (float): Sample rate of the audio fed to process(), in Hz.
+            phase (float): Initial carrier phase in radians.
+            dtype: Real sample type of the output; np.float32 gives complex64 output.
+        """
+        self.dtype = np.dtype(dtype)
+        self.complex_dtype = np.result_type(self.dtype, np.complex64)
+        self.fm_deviation = fm_deviation
+        self.sample_rate = sample_rate
+        # Sensitivity factor (radians per sample per unit of input)
+        self.sensitivity = 2.0 * np.pi * fm_deviation / sample_rate
+        self.phase = float(phase)
+
+    def reset(self, phase=0.0):
+        """Restarts the modulator at the given carrier phase."""
+        self.phase = float(phase)
+
+    def process(self, audio_block):
+        """
+        Modulates one block of audio.
+
+        Args:
+            audio_block (np.ndarray): Real samples, nominally in [-1.0, 1.0].
+
+        Returns:
+            np.ndarray: Complex baseband samples (complex64 by default), one per input sample.
+        """
+        if len(audio_block) == 0:
+            return np.zeros(0, dtype=self.complex_dtype)
+        # Integrate audio signal for phase modulation, continuing from the last block.
+        # The accumulator is float64 and wrapped, so it never loses precision.
+        phase = self.phase + self.sensitivity * np.cumsum(audio_block, dtype=np.float64)
+        self.phase = float(np.mod(phase[-1], 2.0 * np.pi))
+        # Wrapped phase is small enough for single-precision sin/cos
+        phase = np.mod(phase, 2.0 * np.pi).astype(self.dtype, copy=False)
+        # Generate complex FM signal e^(j*phase)
+        fm_signal = np.empty(len(phase), dtype=self.complex_dtype)
+        np.cos(phase, out=fm_signal.real)
+        np.sin(phase, out=fm_signal.imag)
+        return fm_signal
+
+    def modulate(self, audio, block_size=BLOCK_SIZE):
+        """
+        Yields the modulated signal block by block.
+
+        Args:
+            audio (np.ndarray): Real samples, nominally in [-1.0, 1.0].
+            block_size (int): Number of input samples per block.
+
+        Yields:
+            np.ndarray: Complex blocks of at most block_size samples.
+        """
+        for start in range(0, len(audio), block_size):
+            yield self.process(audio[start:start + block_size])
+
+class NCOModulator(FMModulator):
+    """
+    FM modulator built as a numerically controlled oscillator.
+
+    The phase accumulator holds a fraction of a turn, either as a wrapped
+    float64 or, with fixed_point=True, as a phase_bits-wide integer that wraps
+    for free. I/Q samples are read from a precomputed table of table_size
+    complex exponentials instead of computing cos/sin per sample. Each
+    doubling of the table lowers the phase quantization spurs by about 6 dB.
+    """
+
+    def __init__(self, fm_deviation, sample_rate, phase=0.0, dtype=DSP_DTYPE,
+                 table_size=LUT_SIZE, fixed_point=False, phase_bits=NCO_PHASE_BITS):
+        """
+        Args:
+            fm_deviation (float): FM frequency deviation in Hz for a full-scale input.
+            sample_rate (float): Sample rate of the audio fed to process(), in Hz.
+            phase (float): Initial carrier phase in radians.
+            dtype: Real sample type of the output; np.float32 gives complex64 output.
+            table_size (int): Number of lookup table entries; must be a power of two.
+            fixed_point (bool): Use an integer phase accumulator instead of float64.
+            phase_bits (int): Width of the integer accumulator when fixed_point is set.
+        """
+        if table_size < 2 or table_size & (table_size - 1):
+            raise ValueError(f"table_size must be a power of two, got {table_size}")
+        if fixed_point and not table_size <= 2**phase_bits <= 2**62:
+            raise ValueError(f"phase_bits must be between log2(table_size) and 62, got {phase_bits}")
+        self.table_size = table_size
+        self.fixed_point = fixed_point
+        self.phase_bits = phase_bits
+        self._turns = 0.0 # Float accumulator, in turns [0, 1)
+        self._acc = 0     # Fixed-point accumulator, in units of 2**-phase_bits turns
+        super().__init__(fm_deviation, sample_rate, phase, dtype)
+        # Frequency step in turns per sample per unit of input
+        self.turns_per_unit = fm_deviation / sample_rate
+        self._acc_scale = self.turns_per_unit * 2**phase_bits
+        self._acc_mask = 2**phase_bits - 1
+        self._index_shift = phase_bits - int(math.log2(table_size))
+        self.table = np.exp(2j * np.pi * np.arange(table_size) / table_size).astype(self.complex_dtype)
+
+    @property
+    def phase(self):
+        """Current carrier phase in radians."""
+        turns = self._acc / 2**self.phase_bits if self.fixed_point else self._turns
+        return 2.0 * np.pi * turns
+
+    @phase.setter
+    def phase(self, value):
+        turns = (float(value) / (2.0 * np.pi)) % 1.0
+        self._turns = turns
+        self._acc = int(round(turns * 2**self.phase_bits)) & (2**self.phase_bits - 1)
+
+    def process(self, audio_block):
+        """
+        Modulates one block of audio.
+
+        Args:
+            audio_block (np.ndarray): Real samples, nominally in [-1.0, 1.0].
+
+        Returns:
+            np.ndarray: Complex baseband samples (complex64 by default), one per input sample.
+        """
+        if len(audio_block) == 0:
+            return np.zeros(0, dtype=self.complex_dtype)
+        if self.fixed_point:
+            steps = np.rint(np.multiply(audio_block, self._acc_scale, dtype=np.float64)).astype(np.int64)
+            acc = np.cumsum(steps)
+            acc += self._acc
+            acc &= self._acc_mask
+            self._acc = int(acc[-1])
+            # Round to the nearest table entry: add half an entry, then keep the top bits
+            index = acc + (1 << (self._index_shift - 1)) if self._index_shift else acc
+            index >>= self._index_shift
+        else:
+            turns = np.cumsum(audio_block, dtype=np.float64)
+            turns *= self.turns_per_unit
+            turns += self._turns
+            turns -= np.floor(turns)
+            self._turns = float(turns[-1])
+            turns *= self.table_size
+            turns += 0.5
+            index = turns.astype(np.int64)
+        index &= self.table_size - 1
+        return self.table.take(index)
+
+def create_modulator(mode, fm_deviation, sample_rate, phase=0.0, dtype=DSP_DTYPE, table_size=LUT_SIZE):
+    """
+    Creates an FM modulator by name.
+
+    Args:
+        mode (str): "exact" for FMModulator (cos/sin per sample), "lut" for an
+            NCOModulator with a float accumulator, "fixed" for an NCOModulator
+            with an integer accumulator.
+        fm_deviation (float): FM frequency deviation in Hz for a full-scale input.
+        sample_rate (float): Sample rate of the audio fed to the modulator, in Hz.
+        phase (float): Initial carrier phase in radians.
+        dtype: Real sample type of the output.
+        table_size (int): Lookup table size for the NCO modes.
+
+    Returns:
+        FMModulator: The modulator.
+    """
+    if mode == "exact":
+        return FMModulator(fm_deviation, sample_rate, phase, dtype)
+    if mode in ("lut", "fixed"):
+        return NCOModulator(fm_deviation, sample_rate, phase, dtype, table_size, fixed_point=(mode == "fixed"))
+    raise ValueError(f"Unknown modulator mode '{mode}', expected one of {MODULATOR_MODES}")
+
+class ChannelMixer:
+    """
+    Shifts N complex channels to their own frequency offsets and sums them.
+
+    Each channel gets a complex oscillator whose phase carries over between
+    blocks. The oscillator matrix for a block length is computed once and then
+    only rotated by each channel's current phase, so mixing costs one complex
+    multiply-add per sample per channel, with no trigonometry per sample.
+    """
+
+    MAX_CACHED_LENGTHS = 8 # Distinct block lengths to keep oscillator matrices for
+
+    def __init__(self, offsets, sample_rate, gains=None, dtype=DSP_DTYPE):
+        """
+        Args:
+            offsets (sequence): Frequency offset of each channel in Hz.
+            sample_rate (float): Sample rate of the channels in Hz.
+            gains (sequence): Amplitude of each channel in the sum. Defaults to
+                1/N, so the sum never exceeds the amplitude of a single channel.
+            dtype: Real sample type; np.float32 gives complex64 output.
+        """
+        self.offsets = np.asarray(offsets, dtype=np.float64)
+        self.sample_rate = sample_rate
+        self.complex_dtype = np.result_type(np.dtype(dtype), np.complex64)
+        num_channels = len(self.offsets)
+        if num_channels == 0:
+            raise ValueError("ChannelMixer needs at least one channel")
+        self.gains = (np.full(num_channels, 1.0 / num_channels) if gains is None
+                      else np.asarray(gains, dtype=np.float64))
+        self._step = 2.0 * np.pi * self.offsets / sample_rate # Radians per sample
+        self._oscillators = {}
+        self.reset()
+
+    def reset(self):
+        """Restarts every oscillator at phase 0."""
+        self._phase = np.zeros(len(self.offsets))
+
+    def _oscillator(self, length):
+        """Returns the (channels, length) matrix of e^(j*step*n) for n in [0, length)."""
+        oscillator = self._oscillators.get(length)
+        if oscillator is None:
+            if len(self._oscillators) >= self.MAX_CACHED_LENGTHS:
+                self._oscillators.clear()
+            oscillator = np.exp(1j * np.outer(self._step, np.arange(length))).astype(self.complex_dtype)
+            self._oscillators[length] = oscillator
+        return oscillator
+
+    def process(self, channels):
+        """
+        Mixes one block of every channel.
+
+        Args:
+            channels (np.ndarray): (channels, samples) complex baseband samples.
+
+        Returns:
+            np.ndarray: The frequency-multiplexed sum, one sample per input column.
+        """
+        length = channels.shape[1]
+        rotation = (self.gains * np.exp(1j * self._phase)).astype(self.complex_dtype)
+        self._phase = np.mod(self._phase + self._step * length, 2.0 * np.pi)
+        mixed = channels * self._oscillator(length)
+        return rotation @ mixed
+
+def design_resampling_filter(up, down, window=('kaiser', 5.0), half_len_factor=10):
+    """
+    Designs the anti-aliasing/anti-imaging FIR for a rational resampler.
+
+    With the default arguments this is the filter scipy.signal.resample_poly uses.
+
+    Args:
+        up (int): Upsampling factor (already reduced by the gcd).
+        down (int): Downsampling factor (already reduced by the gcd).
+        window: Window passed to scipy.signal.firwin.
+        half_len_factor (int): Half length of the filter per unit of max(up, down).
+
+    Returns:
+        np.ndarray: float64 taps scaled by up, of length 2 * half_len_factor * max(up, down) + 1.
+    """
+    if up == down == 1:
+        return np.ones(1)
+    max_rate = max(up, down)
+    half_len = half_len_factor * max_rate
+    return firwin(2 * half_len + 1, 1.0 / max_rate, window=window) * up
+
+class StreamingResampler:
+    """
+    Polyphase rational resampler that keeps filter history between blocks.
+
+    Uses the same Kaiser FIR design and output alignment as
+    scipy.signal.resample_poly, so process() over any block split followed by
+    flush() reproduces the one-shot result to numerical precision, without the
+    edge transients of resampling each block independently.
+    """
+
+    def __init__(self, up, down, window=('kaiser', 5.0), dtype=DSP_DTYPE, filter_taps=None):
+        """
+        Args:
+            up (int): Upsampling factor.
+            down (int): Downsampling factor.
+            window: Window passed to scipy.signal.firwin, as in resample_poly.
+            filter_taps (np.ndarray): Precomputed odd-length prototype filter (see
+                design_resampling_filter), e.g. from a ResamplingPlan. Overrides window.
+            dtype: Real type of the taps and filter history. With np.float32, real
+                input stays float32 and complex input stays complex64.
+
+        Complex input is filtered as separate real and imaginary planes, which
+        keeps the inner products on real BLAS kernels at either precision.
+        """
+        self.dtype = np.dtype(dtype)
+        g = math.gcd(int(up), int(down))
+        self.up = int(up) // g
+        self.down = int(down) // g
+
+        # Filter design and padding mirror scipy.signal.resample_poly
+        if filter_taps is None:
+            filter_taps = design_resampling_filter(self.up, self.down, window)
+        h = np.asarray(filter_taps, dtype=np.float64)
+        if self.up == self.down == 1:
+            self._n_pre_remove = 0 # Rates already match; pass samples through
+        else:
+            half_len = (len(h) - 1) // 2
+            n_pre_pad = self.down - half_len % self.down
+            self._n_pre_remove = (half_len + n_pre_pad) // self.down
+            h = np.concatenate((np.zeros(n_pre_pad), h))
+
+        # Split into one sub-filter per phase: taps[p, j] = h[p + j * up]
+        self.num_taps = -(-len(h) // self.up)
+        h = np.concatenate((h, np.zeros(self.num_taps * self.up - len(h))))
+        # Taps are designed in float64 and only then rounded to the working precision
+        self.taps = h.reshape(self.num_taps, self.up).T.astype(self.dtype)
+        self._taps_reversed = np.ascontiguousarray(self.taps[:, ::-1]) # Oldest input first
+        self.reset()
+
+    @classmethod
+    def from_rates(cls, in_rate, out_rate, window=('kaiser', 5.0), dtype=DSP_DTYPE):
+        """Creates a resampler converting in_rate to out_rate (both in Hz)."""
+        return cls(int(out_rate), int(in_rate), window, dtype)
+
+    def reset(self):
+        """Clears the filter history so the next block starts a new signal."""
+        self._history = np.zeros((1, self.num_taps - 1), dtype=self.dtype) # One row per real plane
+        self._complex = False
+        self._history_start = -(self.num_taps - 1) # Absolute input index of _history[0]
+        self._inputs = 0   # Input samples received since reset
+        self._outputs = 0  # Output samples produced since reset
+
+    def _emit(self, available):
+        """Produces every output whose newest input index is below `available`."""
+        last = (available * self.up - 1) // self.down - self._n_pre_remove
+        count = last - self._outputs + 1
+        out_dtype = np.result_type(self.dtype, np.complex64) if self._complex else self.dtype
+        if count <= 0:
+            return np.zeros(0, dtype=out_dtype)
+
+        # Output m sits at t = (m + n_pre_remove) * down on the upsampled grid and is
+        # sub-filter t % up applied to the inputs ending at t // up. Outputs `up` apart
+        # share a sub-filter and their inputs step by `down`, so each phase is one
+        # strided matrix-vector product over a sliding-window view of the history.
+        y = np.empty(count, dtype=out_dtype)
+        planes = (y.real, y.imag) if self._complex else (y,)
+        for y_plane, history in zip(planes, self._history):
+            windows = sliding_window_view(history, self.num_taps)
+            for r in range(min(self.up, count)):
+                t = (self._outputs + r + self._n_pre_remove) * self.down
+                start = t // self.up - self._history_start - (self.num_taps - 1)
+                n = len(range(r, count, self.up))
+                y_plane[r::self.up] = windows[start:start + (n - 1) * self.down + 1:self.down] @ self._taps_reversed[t % self.up]
+        self._outputs = last + 1
+
+        # Keep only the history the next output can still reach
+        next_newest = ((self._outputs + self._n_pre_remove) * self.down) // self.up
+        drop = max(0, next_newest - (self.num_taps - 1) - self._history_start)
+        if drop:
+            self._history = self._history[:, drop:]
+            self._history_start += drop
+        return y
+
+    def process(self, block):
+        """
+        Resamples one block of input.
+
+        Args:
+            block (np.ndarray): Real or complex input samples.
+
+        Returns:
+            np.ndarray: All output samples that are complete so far.
+        """
+        block = np.asarray(block)
+        if np.iscomplexobj(block) and not self._complex:
+            # First complex block: add an imaginary plane to the (so far real) history
+            self._history = np.concatenate((self._history, np.zeros_like(self._history)))
+            self._complex = True
+        planes = np.stack((block.real, np.imag(block))) if self._complex else block[np.newaxis]
+        self._history = np.concatenate((self._history, planes.astype(self.dtype, copy=False)), axis=1)
+        self._inputs += len(block)
+        return self._emit(self._history_start + self._history.shape[1])
+
+    def flush(self):
+        """
+        Returns the tail of the signal, as if it were followed by zeros.
+
+        The total output length matches resample_poly: ceil(inputs * up / down).
+        The resampler is reset afterwards.
+
+        Returns:
+            np.ndarray: The remaining output samples.
+        """
+        total = -(-self._inputs * self.up // self.down)
+        needed_input = ((total - 1 + self._n_pre_remove) * self.down) // self.up + 1
+        available = self._history_start + self._history.shape[1]
+        if needed_input > available:
+            padding = np.zeros((len(self._history), needed_input - available), dtype=self.dtype)
+            self._history = np.concatenate((self._history, padding), axis=1)
+        remaining = max(0, total - self._outputs)
+        y = self._emit(needed_input)[:remaining]
+        self.reset()
+        return y
+
+class ResamplerChain:
+    """
+    Several StreamingResamplers applied in series.
+
+    Has the same process()/flush()/reset() interface as a single resampler.
+    """
+
+    def __init__(self, resamplers):
+        """
+        Args:
+            resamplers (list): StreamingResampler stages, in signal order.
+        """
+        self.resamplers = list(resamplers)
+        ratio = Fraction(1)
+        for resampler in self.resamplers:
+            ratio *= Fraction(resampler.up, resampler.down)
+        self.up = ratio.numerator
+        self.down = ratio.denominator
+
+    def reset(self):
+        """Clears the filter history of every stage."""
+        for resampler in self.resamplers:
+            resampler.reset()
+
+    def process(self, block):
+        """Resamples one block through all stages and returns the completed output."""
+        for resampler in self.resamplers:
+            block = resampler.process(block)
+        return block
+
+    def flush(self):
+        """Flushes each stage in turn, pushing its tail through the stages after it."""
+        tail = self.resamplers[0].flush()
+        for resampler in self.resamplers[1:]:
+            tail = np.concatenate((resampler.process(tail), resampler.flush()))
+        return tail
+
+def _prime_factors(n):
+    """Returns the prime factors of n in ascending order, with repetition."""
+    factors = []
+    p = 2
+    while p * p <= n:
+        while n % p == 0:
+            factors.append(p)
+            n //= p
+        p += 1
+    if n > 1:
+        factors.append(n)
+    return factors
+
+def _pack_factors(n, limit):
+    """Groups the prime factors of n into as few products <= limit as first-fit allows."""
+    bins = []
+    for factor in sorted(_prime_factors(n), reverse=True):
+        for i, product in enumerate(bins):
+            if product * factor <= limit:
+                bins[i] *= factor
+                break
+        else:
+            bins.append(factor)
+    return bins
+
+def _stage_macs(up, down, half_len_factor):
+    """Multiply-accumulates per output sample of one polyphase stage."""
+    if up == down == 1:
+        return 0
+    half_len = half_len_factor * max(up, down)
+    n_pre_pad = down - half_len % down
+    return -(-(2 * half_len + 1 + n_pre_pad) // up)
+
+def _plan_macs(ratios, in_rate, out_rate, half_len_factor):
+    """MACs per final output sample of a chain of (up, down) stages, or None if it loses bandwidth."""
+    rate = Fraction(in_rate)
+    floor = min(Fraction(in_rate), Fraction(out_rate))
+    macs = 0.0
+    for up, down in ratios:
+        rate = rate * up / down
+        if rate < floor:
+            return None # An intermediate rate below both ends would cut into the signal band
+        macs += _stage_macs(up, down, half_len_factor) * float(rate / Fraction(out_rate))
+    return macs
+
+def _plan_ratios(in_rate, out_rate, half_len_factor, max_taps):
+    """Chooses the (up, down) stages for a conversion, splitting it if one filter gets too long."""
+    ratio = Fraction(out_rate) / Fraction(in_rate)
+    up, down = ratio.numerator, ratio.denominator
+    limit = (max_taps - 1) // (2 * half_len_factor)
+    if max(up, down) <= limit:
+        return [(up, down)]
+    up_bins, down_bins = _pack_factors(up, limit), _pack_factors(down, limit)
+    if max(up_bins + down_bins) > limit:
+        return [(up, down)] # A prime factor is too large to split out; accept the long filter
+    stages = max(len(up_bins), len(down_bins))
+    up_bins += [1] * (stages - len(up_bins))
+    down_bins += [1] * (stages - len(down_bins))
+
+    best, best_macs = [(up, down)], None
+    for ups in set(itertools.permutations(up_bins)):
+        for downs in set(itertools.permutations(down_bins)):
+            ratios = [(u // math.gcd(u, d), d // math.gcd(u, d)) for u, d in zip(ups, downs)]
+            macs = _plan_macs(ratios, in_rate, out_rate, half_len_factor)
+            if macs is not None and (best_macs is None or macs < best_macs):
+                best, best_macs = ratios, macs
+    return best
+
+class ResamplingPlan:
+    """
+    Precomputed filters for converting one sample rate to another.
+
+    A plan is one or more polyphase stages, each an (up, down) ratio with its
+    prototype filter. Designing the filters is the expensive part, so plans
+    are built once per (in_rate, out_rate, quality) by get_resampling_plan()
+    and only the cheap per-message filter state is created each time.
+    """
+
+    def __init__(self, in_rate, out_rate, quality=DEFAULT_QUALITY, max_taps=MAX_FILTER_TAPS, stages=None):
+        """
+        Args:
+            in_rate (float): Input sample rate in Hz.
+            out_rate (float): Output sample rate in Hz.
+            quality (str): Filter design, a key of RESAMPLING_QUALITIES.
+            max_taps (int): Longest single-stage filter before the conversion is split into stages.
+            stages (list): Precomputed (up, down, taps) stages, e.g. loaded from disk.
+        """
+        if quality not in RESAMPLING_QUALITIES:
+            raise ValueError(f"Unknown resampling quality '{quality}', expected one of {list(RESAMPLING_QUALITIES)}")
+        self.in_rate = in_rate
+        self.out_rate = out_rate
+        self.quality = quality
+        self.half_len_factor, self.window = RESAMPLING_QUALITIES[quality]
+        if stages is None:
+            ratios = _plan_ratios(int(in_rate), int(out_rate), self.half_len_factor, max_taps)
+            stages = [(up, down, design_resampling_filter(up, down, self.window, self.half_len_factor))
+                      for up, down in ratios]
+        self.stages = stages
+
+    @property
+    def macs_per_output(self):
+        """Estimated real multiply-accumulates per output sample (per I/Q plane for complex input)."""
+        return _plan_macs([(up, down) for up, down, _ in self.stages], int(self.in_rate), int(self.out_rate),
+                          self.half_len_factor) or 0.0
+
+    @property
+    def num_taps(self):
+        """Total prototype filter length over all stages."""
+        return sum(len(taps) for _, _, taps in self.stages)
+
+    def describe(self):
+        """Returns a one-line summary of the stages and their cost."""
+        ratios = " -> ".join(f"{up}/{down}" for up, down, _ in self.stages)
+        return (f"{self.in_rate:g} Hz -> {self.out_rate:g} Hz: {ratios} in {len(self.stages)} stage(s), "
+                f"{self.num_taps} taps, ~{self.macs_per_output:.1f} MACs per output sample")
+
+    def create_resampler(self, dtype=DSP_DTYPE):
+        """
+        Creates fresh streaming filter state for one signal.
+
+        Returns:
+            StreamingResampler or ResamplerChain: The resampler for this plan.
+        """
+        resamplers = [StreamingResampler(up, down, dtype=dtype, filter_taps=taps) for up, down, taps in self.stages]
+        return resamplers[0] if len(resamplers) == 1 else ResamplerChain(resamplers)
+
+    def save(self, path):
+        """Writes the plan to an .npz file."""
+        arrays = {f"taps{i}": taps for i, (_, _, taps) in enumerate(self.stages)}
+        np.savez(path, rates=np.array([self.in_rate, self.out_rate], dtype=np.float64),
+                 quality=np.array(self.quality), ratios=np.array([(up, down) for up, down, _ in self.stages]),
+                 **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """Reads a plan written by save()."""
+        with np.load(path) as data:
+            ratios = data["ratios"]
+            stages = [(int(up), int(down), data[f"taps{i}"]) for i, (up, down) in enumerate(ratios)]
+            in_rate, out_rate = (float(rate) for rate in data["rates"])
+            return cls(in_rate, out_rate, str(data["quality"]), stages=stages)
+
+# --- Resampling Plan Cache ---
+# Plans keyed by (in_rate, out_rate, quality). Only a handful of rate pairs
+# occur in practice, so filters are designed once per process (or once ever,
+# with a cache directory) instead of once per message.
+_PLAN_CACHE = {}
+_PLAN_LOCK = threading.Lock()
+
+def _plan_cache_path(cache_dir, in_rate, out_rate, quality):
+    """Returns the .npz path used to persist a plan on disk."""
+    return os.path.join(cache_dir, f"resampling-{in_rate:g}-{out_rate:g}-{quality}.npz")
+
+def get_resampling_plan(in_rate, out_rate, quality=DEFAULT_QUALITY, cache_dir=DEFAULT_PLAN_CACHE_DIR):
+    """
+    Returns the resampling plan for a rate pair, designing it only on a cache miss.
+
+    Args:
+        in_rate (float): Input sample rate in Hz.
+        out_rate (float): Output sample rate in Hz.
+        quality (str): Filter design, a key of RESAMPLING_QUALITIES.
+        cache_dir (str): Optional directory for the on-disk .npz store.
+
+    Returns:
+        ResamplingPlan: The shared plan; create_resampler() gives per-signal state.
+    """
+    key = (float(in_rate), float(out_rate), quality)
+    with _PLAN_LOCK:
+        plan = _PLAN_CACHE.get(key)
+    if plan is not None:
+        return plan
+
+    disk_path = _plan_cache_path(cache_dir, *key) if cache_dir else None
+    if disk_path and os.path.exists(disk_path):
+        plan = ResamplingPlan.load(disk_path)
+    else:
+        plan = ResamplingPlan(*key)
+        if disk_path:
+            os.makedirs(cache_dir, exist_ok=True)
+            plan.save(disk_path)
+
+    with _PLAN_LOCK:
+        _PLAN_CACHE[key] = plan
+    return plan
+
+def clear_resampling_plans():
+    """Empties the in-memory plan cache (the on-disk store is kept)."""
+    with _PLAN_LOCK:
+        _PLAN_CACHE.clear()
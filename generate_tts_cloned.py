@@ -8,8 +8,13 @@ from a reference audio file.
 
 import os
 import argparse
+import hashlib
+import threading
+import time
+import numpy as np
 import torch
 from TTS.api import TTS
+from TTS.tts.utils.synthesis import synthesis, trim_silence
 
 # --- Parameters ---
 DEFAULT_TEXT = "saying this text in a voice"
@@ -19,57 +24,272 @@ DEFAULT_REFERENCE_VOICE = "kirill_sample_voice.wav"
 # See available models: https://github.com/coqui-ai/TTS/blob/dev/TTS/server/model_manager.py
 # Or run `tts --list_models` in your terminal after installing TTS
 DEFAULT_MODEL_NAME = "tts_models/multilingual/multi-dataset/your_tts"
+DEFAULT_LANGUAGE = "en"
+DEFAULT_EMBEDDING_CACHE_DIR = None # Set to a directory to persist speaker embeddings as .npy
 
-def generate_cloned_tts(text_to_speak, output_filename, reference_wav, model_name):
+# --- Model Registry ---
+# Loaded TTS models are kept resident for the lifetime of the process, keyed by
+# (model_name, device), so repeated calls skip the multi-second model load.
+_MODEL_REGISTRY = {}
+_MODEL_STATS = {}
+_REGISTRY_LOCK = threading.Lock()
+
+def get_default_device():
+    """Returns "cuda" if a GPU is available, otherwise "cpu"."""
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+def load_tts_model(model_name=DEFAULT_MODEL_NAME, device=None):
+    """
+    Returns a ready TTS model from the registry, loading it on first use.
+
+    Args:
+        model_name (str): The Coqui TTS model name to load.
+        device (str): Torch device ("cuda" or "cpu"). Defaults to the best available.
+
+    Returns:
+        TTS: The initialized model, moved to the requested device.
+    """
+    if device is None:
+        device = get_default_device()
+    key = (model_name, device)
+
+    with _REGISTRY_LOCK:
+        stats = _MODEL_STATS.setdefault(key, {'loads': 0, 'hits': 0, 'load_seconds': 0.0})
+        tts = _MODEL_REGISTRY.get(key)
+        if tts is not None:
+            stats['hits'] += 1
+            print(f"Using resident TTS model '{model_name}' on {device}.")
+            return tts
+
+        print(f"Loading TTS model '{model_name}' on {device} (may download model on first run)...")
+        start_time = time.perf_counter()
+        tts = TTS(model_name=model_name, progress_bar=True).to(device)
+        load_seconds = time.perf_counter() - start_time
+        _MODEL_REGISTRY[key] = tts
+        stats['loads'] += 1
+        stats['load_seconds'] += load_seconds
+        print(f"TTS model loaded in {load_seconds:.2f} seconds.")
+        return tts
+
+def unload_tts_model(model_name=DEFAULT_MODEL_NAME, device=None):
+    """
+    Drops a model from the registry so its memory can be reclaimed.
+
+    Args:
+        model_name (str): The Coqui TTS model name to unload.
+        device (str): Torch device the model was loaded on. Defaults to the best available.
+
+    Returns:
+        bool: True if a model was unloaded, False if it was not resident.
+    """
+    if device is None:
+        device = get_default_device()
+    with _REGISTRY_LOCK:
+        tts = _MODEL_REGISTRY.pop((model_name, device), None)
+    if tts is None:
+        return False
+    del tts
+    if device == "cuda":
+        torch.cuda.empty_cache()
+    print(f"Unloaded TTS model '{model_name}' from {device}.")
+    return True
+
+def get_model_stats():
+    """
+    Returns load-time metrics for every model the registry has handled.
+
+    Returns:
+        dict: Maps (model_name, device) to a dict with 'loads', 'hits',
+              'load_seconds' and 'resident' entries.
+    """
+    with _REGISTRY_LOCK:
+        return {key: dict(stats, resident=key in _MODEL_REGISTRY)
+                for key, stats in _MODEL_STATS.items()}
+
+def print_model_stats():
+    """Prints a short summary of model load times and reuse."""
+    for (model_name, device), stats in get_model_stats().items():
+        saved = stats['hits'] * stats['load_seconds'] / max(stats['loads'], 1)
+        print(f"TTS model '{model_name}' on {device}: {stats['loads']} load(s) "
+              f"in {stats['load_seconds']:.2f}s, {stats['hits']} reuse(s), "
+              f"~{saved:.2f}s of loading avoided")
+
+# --- Speaker Embedding Cache ---
+# Speaker embeddings (d-vectors) computed from a reference WAV, keyed by
+# (file content hash, model_name). The reference voice rarely changes, so the
+# speaker encoder only needs to run once per voice per model.
+_EMBEDDING_CACHE = {}
+_EMBEDDING_LOCK = threading.Lock()
+
+def _file_sha256(path):
+    """Returns the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _embedding_cache_path(cache_dir, model_name, content_hash):
+    """Returns the .npy path used to persist an embedding on disk."""
+    model_slug = model_name.replace('/', '--')
+    return os.path.join(cache_dir, f"{model_slug}-{content_hash}.npy")
+
+def get_speaker_embedding(tts, reference_wav, model_name, cache_dir=DEFAULT_EMBEDDING_CACHE_DIR):
+    """
+    Returns the speaker embedding for a reference WAV, computing it only on a cache miss.
+
+    Args:
+        tts (TTS): A loaded TTS model (see load_tts_model).
+        reference_wav (str): Path to the reference WAV file for voice cloning.
+        model_name (str): The Coqui TTS model name the embedding belongs to.
+        cache_dir (str): Optional directory for the on-disk .npy store.
+
+    Returns:
+        np.ndarray: The embedding as a [1 x embedding_dim] array, or None if the
+                    model has no speaker encoder to compute one with.
+    """
+    speaker_manager = getattr(tts.synthesizer.tts_model, 'speaker_manager', None)
+    if speaker_manager is None or getattr(speaker_manager, 'encoder', None) is None:
+        return None
+
+    key = (_file_sha256(reference_wav), model_name)
+    with _EMBEDDING_LOCK:
+        embedding = _EMBEDDING_CACHE.get(key)
+    if embedding is not None:
+        print("Using cached speaker embedding.")
+        return embedding
+
+    disk_path = _embedding_cache_path(cache_dir, model_name, key[0]) if cache_dir else None
+    if disk_path and os.path.exists(disk_path):
+        embedding = np.load(disk_path)
+        print(f"Loaded speaker embedding from '{disk_path}'.")
+    else:
+        print("Computing speaker embedding from reference voice...")
+        start_time = time.perf_counter()
+        embedding = np.array(speaker_manager.compute_embedding_from_clip(reference_wav))[None, :]
+        print(f"Speaker embedding computed in {time.perf_counter() - start_time:.2f} seconds.")
+        if disk_path:
+            os.makedirs(cache_dir, exist_ok=True)
+            np.save(disk_path, embedding)
+            print(f"Saved speaker embedding to '{disk_path}'.")
+
+    with _EMBEDDING_LOCK:
+        _EMBEDDING_CACHE[key] = embedding
+    return embedding
+
+def clear_speaker_embeddings():
+    """Empties the in-memory speaker embedding cache (the on-disk store is kept)."""
+    with _EMBEDDING_LOCK:
+        _EMBEDDING_CACHE.clear()
+
+def synthesize_with_embedding(tts, text, speaker_embedding, language=DEFAULT_LANGUAGE):
+    """
+    Synthesizes speech from a precomputed speaker embedding, skipping the speaker encoder.
+
+    Mirrors what TTS.utils.synthesizer.Synthesizer.tts does for a speaker_wav,
+    minus the per-call compute_embedding_from_clip.
+
+    Args:
+        tts (TTS): A loaded TTS model (see load_tts_model).
+        text (str): The text to convert to speech.
+        speaker_embedding (np.ndarray): Embedding from get_speaker_embedding.
+        language (str): Language name for multilingual models.
+
+    Returns:
+        np.ndarray: Float32 waveform at tts.synthesizer.output_sample_rate.
     """
-    Generates speech from text using a cloned voice and saves it to a WAV file.
+    synthesizer = tts.synthesizer
+    model = synthesizer.tts_model
+    language_id = None
+    language_manager = getattr(model, 'language_manager', None)
+    if language_manager is not None and language_manager.name_to_id:
+        language_id = language_manager.name_to_id[language]
+    use_cuda = next(model.parameters()).is_cuda
+
+    wavs = []
+    for sentence in synthesizer.split_into_sentences(text):
+        outputs = synthesis(
+            model=model,
+            text=sentence,
+            CONFIG=synthesizer.tts_config,
+            use_cuda=use_cuda,
+            d_vector=speaker_embedding,
+            language_id=language_id,
+        )
+        waveform = np.asarray(outputs["wav"], dtype=np.float32).squeeze()
+        if synthesizer.tts_config.audio.get("do_trim_silence", False):
+            waveform = trim_silence(waveform, model.ap)
+        wavs.append(waveform)
+        wavs.append(np.zeros(10000, dtype=np.float32)) # Same inter-sentence pause as Synthesizer.tts
+    if not wavs:
+        return np.zeros(0, dtype=np.float32)
+    return np.concatenate(wavs)
+
+def generate_cloned_tts(text_to_speak, output_filename, reference_wav, model_name,
+                        embedding_cache_dir=DEFAULT_EMBEDDING_CACHE_DIR):
+    """
+    Generates speech from text using a cloned voice, optionally saving it to a WAV file.
 
     Args:
         text_to_speak (str): The text to convert to speech.
-        output_filename (str): The path to save the output WAV file.
+        output_filename (str): The path to save the output WAV file, or None to
+            keep the audio in memory only (the file is mainly useful for debugging).
         reference_wav (str): Path to the reference WAV file for voice cloning.
         model_name (str): The Coqui TTS model name to use.
+        embedding_cache_dir (str): Optional directory to persist speaker embeddings in.
+
+    Returns:
+        tuple: (samples, sample_rate) with float32 samples in [-1.0, 1.0],
+               or None if an error occurs.
     """
     print("--- TTS Voice Cloning ---")
     print(f"Text: '{text_to_speak}'")
     print(f"Reference Voice: {reference_wav}")
-    print(f"Output File: {output_filename}")
+    print(f"Output File: {output_filename or '(in memory only)'}")
     print(f"TTS Model: {model_name}")
     print("-------------------------")
 
     # Check if reference voice file exists
     if not os.path.exists(reference_wav):
         print(f"Error: Reference voice file not found at '{reference_wav}'")
-        return False
+        return None
 
     # Check if GPU is available, otherwise use CPU
-    device = "cuda" if torch.cuda.is_available() else "cpu"
+    device = get_default_device()
     print(f"Using device: {device}")
     if device == "cpu":
         print("Warning: TTS processing will be slower on CPU.")
 
     try:
-        print("Initializing TTS model (may download model on first run)...")
-        # Init TTS
-        tts = TTS(model_name=model_name, progress_bar=True).to(device)
-        print("TTS model initialized.")
+        # Reuse the resident model if one is already loaded
+        tts = load_tts_model(model_name, device)
+
+        speaker_embedding = get_speaker_embedding(tts, reference_wav, model_name, embedding_cache_dir)
 
         print("Generating speech (this may take a moment)...")
         # Run TTS
         # Assumes English ('en') for the text. Change if needed for multilingual models.
-        tts.tts_to_file(
-            text=text_to_speak,
-            speaker_wav=reference_wav,
-            language="en", # Specify language for multilingual models
-            file_path=output_filename
-        )
-        print(f"Speech successfully generated and saved to '{output_filename}'")
-        return True
+        if speaker_embedding is not None:
+            wav = synthesize_with_embedding(tts, text_to_speak, speaker_embedding, DEFAULT_LANGUAGE)
+        else:
+            # Model has no speaker encoder; let Coqui handle the reference itself
+            wav = np.asarray(tts.tts(
+                text=text_to_speak,
+                speaker_wav=reference_wav,
+                language=DEFAULT_LANGUAGE, # Specify language for multilingual models
+            ), dtype=np.float32)
+        sample_rate = tts.synthesizer.output_sample_rate
+        print(f"Speech successfully generated ({len(wav) / sample_rate:.2f}s at {sample_rate} Hz)")
+
+        if output_filename:
+            tts.synthesizer.save_wav(wav=wav, path=output_filename)
+            print(f"Speech saved to '{output_filename}'")
+        return wav, sample_rate
 
     except FileNotFoundError as e:
          print(f"Error: Model file not found. It might need to be downloaded.")
          print(f"Check your internet connection and TTS installation. Details: {e}")
-         return False
+         return None
     except RuntimeError as e:
         if "module 'torchaudio.functional' has no attribute 'compute_kaldi_pitch'" in str(e):
              print(f"Error: Missing torchaudio dependency or version mismatch. {e}")
@@ -78,10 +298,10 @@ def generate_cloned_tts(text_to_speak, output_filename, reference_wav, model_nam
              print(f"Error: CUDA out of memory. Try using a smaller model or running on CPU.")
         else:
              print(f"Runtime Error during TTS generation: {e}")
-        return False
+        return None
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
-        return False
+        return None
 
 def main():
     parser = argparse.ArgumentParser(description="Generate a WAV file from text using voice cloning.")
@@ -93,6 +313,8 @@ def main():
                         help=f"Reference WAV file for voice cloning (default: '{DEFAULT_REFERENCE_VOICE}')")
     parser.add_argument("-m", "--model", default=DEFAULT_MODEL_NAME,
                         help=f"Coqui TTS model name to use (default: '{DEFAULT_MODEL_NAME}')")
+    parser.add_argument("--embedding-cache", default=DEFAULT_EMBEDDING_CACHE_DIR,
+                        help="Directory to persist speaker embeddings as .npy (default: memory only)")
     args = parser.parse_args()
 
     if not os.path.exists(args.reference):
@@ -100,7 +322,7 @@ def main():
          print("Please ensure the file exists and the path is correct.")
          return # Exit early if reference doesn't exist
 
-    if generate_cloned_tts(args.text, args.output, args.reference, args.model):
+    if generate_cloned_tts(args.text, args.output, args.reference, args.model, args.embedding_cache):
         print(f"Successfully created '{args.output}' with cloned voice.")
     else:
         print(f"Failed to create '{args.output}'")
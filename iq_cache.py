@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Content-addressed on-disk cache of modulated IQ.
+
+Resending an announcement with unchanged modulation settings does not need
+the DSP again. The baseband signal is kept as a SigMF recording (raw cf32
+.sigmf-data plus .sigmf-meta) named after a SHA-256 of the audio samples and
+of every parameter that shapes the signal, so a hit can be memory-mapped and
+streamed straight to the transmitter. Recordings are stored starting at
+carrier phase 0 and rotated on replay, which keeps consecutive messages
+phase-continuous. The least recently used recordings are evicted once the
+cache grows past its size cap.
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+from tx_backends import DAC_FULL_SCALE
+
+# --- Parameters ---
+DEFAULT_IQ_CACHE_DIR = None      # Set to a directory to keep modulated IQ for retransmissions
+IQ_CACHE_MAX_BYTES = 2 * 2**30   # Size cap; least recently used recordings go first
+IQ_CACHE_VERSION = 1             # Part of every key; bump when the DSP output for given inputs changes
+HASH_BLOCK_SIZE = 2**20          # Audio samples hashed at a time
+REPLAY_BLOCK_SIZE = 2**16        # IQ samples read from a cached recording at a time
+
+def content_key(audio_data, params):
+    """
+    Returns the cache key for a message.
+
+    Args:
+        audio_data (np.ndarray or WavStream): The prepared mono audio, read in blocks.
+        params (dict): Every setting that shapes the modulated signal (JSON-serializable).
+
+    Returns:
+        str: SHA-256 hex digest of the parameters and the audio samples.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps(dict(params, version=IQ_CACHE_VERSION), sort_keys=True).encode())
+    for start in range(0, len(audio_data), HASH_BLOCK_SIZE):
+        digest.update(np.ascontiguousarray(audio_data[start:start + HASH_BLOCK_SIZE]))
+    return digest.hexdigest()
+
+class IQCache:
+    """
+    A directory of modulated messages stored as SigMF recordings.
+
+    Usage:
+        cache = IQCache(cache_dir)
+        entry = cache.lookup(key)
+        blocks = cache.replay(entry, modulator) if entry else cache.record(key, blocks, rate, modulator)
+    """
+
+    def __init__(self, cache_dir, max_bytes=IQ_CACHE_MAX_BYTES):
+        """
+        Args:
+            cache_dir (str): Directory holding the recordings; created if missing.
+            max_bytes (int): Total size of the recordings to keep.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.stats = {'hits': 0, 'misses': 0, 'stored': 0, 'evictions': 0}
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _paths(self, key):
+        """Returns the (data, meta) paths of a recording."""
+        base = os.path.join(self.cache_dir, key)
+        return base + ".sigmf-data", base + ".sigmf-meta"
+
+    def lookup(self, key):
+        """
+        Opens a cached recording and marks it as recently used.
+
+        Args:
+            key (str): Key from content_key().
+
+        Returns:
+            tuple: (samples, meta) with the samples memory-mapped as complex64,
+                   or None on a miss.
+        """
+        data_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if os.path.getsize(data_path):
+                samples = np.memmap(data_path, dtype=np.complex64, mode='r')
+            else:
+                samples = np.zeros(0, dtype=np.complex64) # mmap cannot map an empty file
+            # Modification time doubles as the last-use time for eviction
+            os.utime(data_path)
+            os.utime(meta_path)
+        except (OSError, ValueError):
+            self.stats['misses'] += 1
+            return None
+        self.stats['hits'] += 1
+        return samples, meta
+
+    def replay(self, entry, modulator=None, block_size=REPLAY_BLOCK_SIZE):
+        """
+        Streams a cached recording scaled for the DAC.
+
+        Args:
+            entry (tuple): (samples, meta) from lookup().
+            modulator (FMModulator): Modulator whose phase the message continues
+                from; it is advanced past the message as if it had modulated it.
+            block_size (int): Samples per yielded block.
+
+        Yields:
+            np.ndarray: complex64 blocks of the baseband signal.
+        """
+        samples, meta = entry
+        phase = modulator.phase if modulator is not None else 0.0
+        scale = np.complex64(DAC_FULL_SCALE * np.exp(1j * phase))
+        for start in range(0, len(samples), block_size):
+            yield samples[start:start + block_size] * scale
+        if modulator is not None:
+            modulator.phase = np.mod(phase + meta['global']['transmit_fm:end_phase'], 2.0 * np.pi)
+
+    def record(self, key, blocks, sample_rate, modulator=None, params=None):
+        """
+        Passes blocks through while writing them to the cache.
+
+        The recording only becomes visible once every block has been written,
+        so an abandoned or failed message leaves nothing behind.
+
+        Args:
+            key (str): Key from content_key().
+            blocks (iterable): DAC-scaled complex blocks, e.g. from fm_signal_blocks().
+            sample_rate (float): Sample rate of the blocks in Hz.
+            modulator (FMModulator): The modulator producing the blocks; its phase
+                before and after the message is used to store it from phase 0.
+            params (dict): Parameters to note in the metadata.
+
+        Yields:
+            np.ndarray: The blocks, unchanged.
+        """
+        data_path, meta_path = self._paths(key)
+        temp_data, temp_meta = data_path + ".tmp", meta_path + ".tmp"
+        start_phase = modulator.phase if modulator is not None else 0.0
+        derotate = np.complex64(np.exp(-1j * start_phase) / DAC_FULL_SCALE)
+        complete = False
+        try:
+            with open(temp_data, "wb") as f:
+                for block in blocks:
+                    (block * derotate).astype(np.complex64, copy=False).tofile(f)
+                    yield block
+            end_phase = modulator.phase - start_phase if modulator is not None else 0.0
+            meta = {
+                "global": {
+                    "core:datatype": "cf32_le",
+                    "core:sample_rate": float(sample_rate),
+                    "core:version": "1.0.0",
+                    "core:description": "Modulated FM message cached by transmit_fm",
+                    "transmit_fm:end_phase": float(np.mod(end_phase, 2.0 * np.pi)),
+                    "transmit_fm:params": params or {},
+                },
+                "captures": [{"core:sample_start": 0}],
+                "annotations": [],
+            }
+            with open(temp_meta, "w") as f:
+                json.dump(meta, f, indent=2)
+            os.replace(temp_data, data_path)
+            os.replace(temp_meta, meta_path) # Written last: a recording is complete once its meta exists
+            complete = True
+            self.stats['stored'] += 1
+            print(f"Cached modulated IQ as '{data_path}'")
+        finally:
+            if not complete:
+                for path in (temp_data, temp_meta):
+                    if os.path.exists(path):
+                        os.remove(path)
+        self.evict()
+
+    def size(self):
+        """Returns the total size of the cached recordings in bytes."""
+        return sum(size for _, size, _ in self._entries())
+
+    def _entries(self):
+        """Lists (last use, size, key) of every complete recording."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".sigmf-meta"):
+                continue
+            key = name[:-len(".sigmf-meta")]
+            data_path, meta_path = self._paths(key)
+            try:
+                entries.append((os.path.getmtime(meta_path),
+                                os.path.getsize(data_path) + os.path.getsize(meta_path), key))
+            except OSError:
+                continue # Removed concurrently
+        return entries
+
+    def evict(self):
+        """Removes the least recently used recordings until the cache fits in max_bytes."""
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, key in entries:
+                if total <= self.max_bytes:
+                    break
+                for path in self._paths(key)[::-1]: # Meta first, so the entry disappears atomically
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                total -= size
+                self.stats['evictions'] += 1
+                print(f"Evicted cached IQ '{key}' ({size / 2**20:.1f} MB)")
+
+    def clear(self):
+        """Removes every cached recording."""
+        with self._lock:
+            for _, _, key in self._entries():
+                for path in self._paths(key)[::-1]:
+                    if os.path.exists(path):
+                        os.remove(path)
@@ -12,16 +12,32 @@ Main workflow script:
 import argparse
 import sys
 import os
+import queue
+import threading
+import time
+
+import numpy as np
 
 # Import functions from other scripts
-from query_ollama import query_ollama, DEFAULT_MODEL as OLLAMA_DEFAULT_MODEL
-from generate_tts_cloned import generate_cloned_tts, DEFAULT_REFERENCE_VOICE, DEFAULT_MODEL_NAME as TTS_DEFAULT_MODEL
-from transmit_fm import transmit_audio, SDR_URI, CENTER_FREQ, SAMPLE_RATE, TX_GAIN, FM_DEVIATION, AUDIO_TARGET_RATE, CHUNK_SIZE
+from query_ollama import query_ollama, stream_ollama, print_stream_stats, DEFAULT_MODEL as OLLAMA_DEFAULT_MODEL
+from generate_tts_cloned import generate_cloned_tts, print_model_stats, DEFAULT_REFERENCE_VOICE, DEFAULT_MODEL_NAME as TTS_DEFAULT_MODEL
+from sentence_chunker import chunk_sentences
+from fm_dsp import DSP_DTYPE
+from pluto_fir import PLUTO_MIN_RATE_NO_FIR, fir_interpolation_for
+from sdr_session import PlutoSession
+from transmit_fm import (TransmitPlan, transmit_audio, prepare_audio, modulated_blocks, select_sample_rate, print_rate_selection,
+                         SDR_URI, CENTER_FREQ, SAMPLE_RATE, TX_GAIN, FM_DEVIATION, AUDIO_TARGET_RATE, CHUNK_SIZE)
 
 # --- Workflow Parameters ---
 DEFAULT_OUTPUT_WAV = "workflow_output.wav" # Use a different name to avoid conflict if run separately
+PIPELINE_QUEUE_SIZE = 4 # Max segments buffered between pipeline stages
+PIPELINE_AUDIO_GAIN = 0.95 # Fixed gain for every TTS segment, so loudness does not jump between
+                           # sentences; the clip before modulation limits any overshoot
+PIPELINE_STALL_SECONDS = 120.0 # Give up when no speech arrives for this long (hung LLM or TTS)
+_END = object() # Queue sentinel marking the end of a stage's output
 
-def run_workflow(prompt, ollama_model, tts_reference_voice, tts_model, output_wav, sdr_params):
+def run_workflow(prompt, ollama_model, tts_reference_voice, tts_model, output_wav, sdr_params,
+                 session=None, plan=None):
     """
     Executes the full workflow: Ollama -> TTS -> SDR Transmission.
 
@@ -30,8 +46,13 @@ def run_workflow(prompt, ollama_model, tts_reference_voice, tts_model, output_wa
         ollama_model (str): The Ollama model to use.
         tts_reference_voice (str): Path to the reference WAV for voice cloning.
         tts_model (str): The Coqui TTS model to use.
-        output_wav (str): Path to save the intermediate TTS audio file.
+        output_wav (str): Path to save the intermediate TTS audio file for debugging,
+            or None to keep the audio in memory only.
         sdr_params (dict): Dictionary containing parameters for transmit_audio.
+        session (PlutoSession): Open SDR session to reuse across workflow runs;
+            when None, transmit_audio connects and disconnects by itself.
+        plan (TransmitPlan): Plan built once from sdr_params (TransmitPlan.from_sdr_params)
+            to reuse across workflow runs; it replaces sdr_params and session.
 
     Returns:
         bool: True if the entire workflow completed successfully, False otherwise.
@@ -55,30 +76,38 @@ def run_workflow(prompt, ollama_model, tts_reference_voice, tts_model, output_wa
         print("Workflow failed at TTS step.")
         return False
 
-    tts_success = generate_cloned_tts(
+    tts_audio = generate_cloned_tts(
         text_to_speak=ollama_response,
         output_filename=output_wav,
         reference_wav=tts_reference_voice,
         model_name=tts_model
     )
 
-    if not tts_success:
+    if tts_audio is None:
         print("Workflow failed at TTS step.")
         return False
-    print(f"TTS audio generated: '{output_wav}'")
+    tts_samples, tts_rate = tts_audio
+    print(f"TTS audio generated: {len(tts_samples) / tts_rate:.2f}s at {tts_rate} Hz")
+    print_model_stats()
 
     # Step 3: Transmit Audio via SDR
     print("\n[Step 3/3] Transmitting Audio via SDR...")
-    transmit_success = transmit_audio(
-        audio_file=output_wav,
-        sdr_uri=sdr_params['uri'],
-        center_freq=sdr_params['freq'],
-        sample_rate=sdr_params['rate'],
-        tx_gain=sdr_params['gain'],
-        fm_deviation=sdr_params['deviation'],
-        audio_target_rate=sdr_params['audio_rate'],
-        chunk_size=sdr_params['chunk']
-    )
+    if plan is not None:
+        transmit_success = plan.transmit(tts_samples, tts_rate)
+    else:
+        transmit_success = transmit_audio(
+            audio_file=tts_samples,
+            audio_rate=tts_rate,
+            sdr_uri=sdr_params['uri'],
+            center_freq=sdr_params['freq'],
+            sample_rate=sdr_params['rate'],
+            tx_gain=sdr_params['gain'],
+            fm_deviation=sdr_params['deviation'],
+            audio_target_rate=sdr_params['audio_rate'],
+            chunk_size=sdr_params['chunk'],
+            session=session,
+            fir_interpolation=sdr_params.get('fir_interpolation', 1)
+        )
 
     if not transmit_success:
         print("Workflow failed at SDR transmission step.")
@@ -87,6 +116,230 @@ def run_workflow(prompt, ollama_model, tts_reference_voice, tts_model, output_wa
     print("\n--- Workflow Completed Successfully ---")
     return True
 
+def _put(q, item, stop):
+    """Puts an item on a bounded queue, giving up if the pipeline is stopping."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def run_pipelined_workflow(prompt, ollama_model, tts_reference_voice, tts_model, sdr_params,
+                           token_source=None, synthesize=None, sdr_factory=None, metrics=None,
+                           session=None, plan=None):
+    """
+    Executes the workflow with all three stages running concurrently.
+
+    Sentence segments flow through bounded queues: the Ollama token stream is
+    split into sentences, each sentence is synthesized as soon as it is complete,
+    and the answer is modulated as one stream into the plan's threaded
+    transmitter, which keys up as soon as the first buffers are ready. The
+    carrier stays up between segments, so the FM phase and the stream of
+    fixed-size TX buffers are continuous for the whole answer. Every segment
+    gets the same fixed gain, so loudness does not jump between sentences.
+
+    Args:
+        prompt (str): The initial text prompt for Ollama.
+        ollama_model (str): The Ollama model to use.
+        tts_reference_voice (str): Path to the reference WAV for voice cloning.
+        tts_model (str): The Coqui TTS model to use.
+        sdr_params (dict): Dictionary containing parameters for transmit_audio.
+        token_source (callable): Called as token_source(prompt, model, stats) and
+            returns an iterable of tokens. Defaults to stream_ollama.
+        synthesize (callable): Called with a text segment, returns (samples, rate)
+            or None. Defaults to generate_cloned_tts with the given voice and model.
+        sdr_factory (callable): Passed to PlutoSession; use a stand-in to run without hardware.
+        metrics (dict): Optional dict filled in with 'time_to_first_segment',
+            'time_to_first_audio', 'time_to_first_airtime' (seconds from start),
+            'segment_gaps' (seconds of dead air before each later segment),
+            'segments', 'airtime_seconds' and 'llm' (stream_ollama stats).
+        session (PlutoSession): Open SDR session to reuse; it is left open afterwards.
+        plan (TransmitPlan): Plan built once from sdr_params to reuse across workflow
+            runs; its session, modulator and resamplers are used and left open.
+
+    Returns:
+        bool: True if the entire workflow completed successfully, False otherwise.
+    """
+    if metrics is None:
+        metrics = {}
+    metrics.update({'time_to_first_segment': None, 'time_to_first_audio': None,
+                    'time_to_first_airtime': None, 'segment_gaps': [], 'segments': 0,
+                    'airtime_seconds': 0.0, 'llm': {}})
+    token_source = token_source or stream_ollama
+    if synthesize is None:
+        if not os.path.exists(tts_reference_voice):
+            print(f"Error: TTS Reference voice file not found: {tts_reference_voice}")
+            print("Workflow failed at TTS step.")
+            return False
+        def synthesize(text):
+            return generate_cloned_tts(text, None, tts_reference_voice, tts_model)
+
+    # The plan's modulator and streaming resamplers run through the whole answer,
+    # so sentence joins and the silence between them are as clean as the sentences
+    owns_session = plan is None and session is None
+    if plan is None:
+        try:
+            if owns_session:
+                fir_interpolation = sdr_params.get('fir_interpolation', 1)
+                session = PlutoSession(sdr_params['uri'], sdr_params['freq'], sdr_params['rate'] / fir_interpolation,
+                                       sdr_params['gain'], sdr_factory=sdr_factory,
+                                       fir_interpolation=fir_interpolation)
+            plan = TransmitPlan.from_sdr_params(sdr_params, session=session)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return False
+
+    print("--- Starting Pipelined Workflow ---")
+    print(f"Input Prompt: '{prompt}'")
+    start_time = time.perf_counter()
+    stop = threading.Event()
+    failures = []
+    text_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    audio_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+
+    def llm_stage():
+        try:
+            for segment in chunk_sentences(token_source(prompt, ollama_model, metrics['llm'])):
+                if metrics['time_to_first_segment'] is None:
+                    metrics['time_to_first_segment'] = time.perf_counter() - start_time
+                print(f"[LLM] Segment ready: '{segment}'")
+                if not _put(text_queue, segment, stop):
+                    return
+            if not metrics['llm'].get('completed', True):
+                failures.append("Ollama")
+        except Exception as e:
+            print(f"Error in LLM stage: {e}")
+            failures.append("Ollama")
+        finally:
+            _put(text_queue, _END, stop)
+
+    def tts_stage():
+        try:
+            while not stop.is_set():
+                try:
+                    segment = text_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue # Recheck stop, so a stalled or failed LLM stage cannot hang this thread
+                if segment is _END:
+                    break
+                audio = synthesize(segment)
+                if audio is None:
+                    failures.append("TTS")
+                    break
+                if metrics['time_to_first_audio'] is None:
+                    metrics['time_to_first_audio'] = time.perf_counter() - start_time
+                if not _put(audio_queue, audio, stop):
+                    return
+        except Exception as e:
+            print(f"Error in TTS stage: {e}")
+            failures.append("TTS")
+        finally:
+            _put(audio_queue, _END, stop)
+
+    workers = [threading.Thread(target=llm_stage, name="llm-stage", daemon=True),
+               threading.Thread(target=tts_stage, name="tts-stage", daemon=True)]
+    for worker in workers:
+        worker.start()
+
+    session = plan.session
+    sample_rate = plan.host_rate # Rate generated on the host; the TX FIR interpolates the rest
+    chunk_size = plan.chunk_size
+    chunk_seconds = chunk_size / sample_rate
+
+    def audio_stream():
+        """Yields the answer at the modulation rate as one stream, with silence while TTS is behind."""
+        audio_resampler = audio_rate = starved_since = None
+        waiting_since = time.perf_counter()
+        while True:
+            try:
+                audio = audio_queue.get(timeout=chunk_seconds)
+            except queue.Empty:
+                if time.perf_counter() - waiting_since > PIPELINE_STALL_SECONDS:
+                    print(f"Error: no speech for {PIPELINE_STALL_SECONDS:.0f}s, giving up")
+                    failures.append("Ollama" if workers[0].is_alive() else "TTS") # The stage that is stuck
+                    return
+                if audio_resampler is not None:
+                    # Keep the carrier up while TTS catches up: silence through the same
+                    # filters continues the signal from the last sample already sent
+                    if starved_since is None:
+                        starved_since = time.perf_counter()
+                    filler = np.zeros(int(np.ceil(chunk_size * audio_rate / sample_rate)), dtype=DSP_DTYPE)
+                    yield audio_resampler.process(filler)
+                continue
+            if audio is _END:
+                break
+
+            samples, rate = audio
+            audio_data = prepare_audio(samples, normalize=False)
+            if audio_data is None or len(audio_data) == 0:
+                continue
+            if rate != audio_rate:
+                if audio_resampler is not None:
+                    yield audio_resampler.flush()
+                audio_resampler = plan.resamplers(rate)[0]
+                audio_resampler.reset()
+                audio_rate = rate
+            if metrics['segments']:
+                metrics['segment_gaps'].append(time.perf_counter() - starved_since if starved_since else 0.0)
+            starved_since = None
+            metrics['segments'] += 1
+            metrics['airtime_seconds'] += len(audio_data) / rate
+            yield audio_resampler.process(np.multiply(audio_data, PIPELINE_AUDIO_GAIN, dtype=DSP_DTYPE))
+            waiting_since = time.perf_counter()
+        if audio_resampler is not None:
+            yield audio_resampler.flush()
+
+    transmission_successful = False
+    try:
+        # Connecting here overlaps the device setup with the LLM; TX keys up with the first buffer
+        if not plan.open():
+            failures.append("SDR")
+        else:
+            tx_start = time.perf_counter()
+            fm_blocks = modulated_blocks(audio_stream(), plan.modulator, plan.sdr_resampler, plan.engine)
+            if not plan.transmitter.transmit(fm_blocks):
+                failures.append("SDR")
+            plan.transmitter.print_stats()
+            first_tx_delay = plan.transmitter.stats['first_tx_delay']
+            if first_tx_delay is not None:
+                metrics['time_to_first_airtime'] = tx_start - start_time + first_tx_delay
+        transmission_successful = not failures and metrics['segments'] > 0
+
+    except Exception as e:
+        print(f"Error during pipelined transmission: {e}")
+        failures.append("SDR")
+    finally:
+        stop.set()
+        if owns_session:
+            session.close()
+        for worker in workers:
+            worker.join(timeout=1.0)
+
+    if metrics['llm']:
+        print_stream_stats(metrics['llm'])
+    print_pipeline_metrics(metrics)
+    if not transmission_successful:
+        stage = failures[0] if failures else "Ollama (no response)"
+        print(f"Pipelined workflow failed at {stage} stage.")
+        return False
+    print("\n--- Pipelined Workflow Completed Successfully ---")
+    return True
+
+def print_pipeline_metrics(metrics):
+    """Prints the latency metrics collected by run_pipelined_workflow."""
+    def fmt(value):
+        return f"{value:.2f}s" if value is not None else "n/a"
+    gaps = metrics.get('segment_gaps') or []
+    print("--- Pipeline Metrics ---")
+    print(f"  First segment from LLM: {fmt(metrics.get('time_to_first_segment'))}")
+    print(f"  First audio from TTS:   {fmt(metrics.get('time_to_first_audio'))}")
+    print(f"  Time to first airtime:  {fmt(metrics.get('time_to_first_airtime'))}")
+    print(f"  Segments transmitted:   {metrics.get('segments', 0)} ({metrics.get('airtime_seconds', 0.0):.2f}s of audio)")
+    if gaps:
+        print(f"  Inter-segment gaps:     max {max(gaps):.2f}s, total {sum(gaps):.2f}s over {len(gaps)} transitions")
+
 def main():
     parser = argparse.ArgumentParser(description="Run the Ollama -> TTS -> SDR transmission workflow.")
     parser.add_argument("prompt",
@@ -97,29 +350,61 @@ def main():
                         help=f"Reference WAV for voice cloning (default: {DEFAULT_REFERENCE_VOICE})")
     parser.add_argument("--tts-model", default=TTS_DEFAULT_MODEL,
                         help=f"Coqui TTS model name (default: {TTS_DEFAULT_MODEL})")
-    parser.add_argument("--output-wav", default=DEFAULT_OUTPUT_WAV,
-                        help=f"Intermediate WAV file name (default: {DEFAULT_OUTPUT_WAV})")
+    parser.add_argument("--output-wav", nargs='?', const=DEFAULT_OUTPUT_WAV, default=None,
+                        help=f"Also save the intermediate TTS audio for debugging (default name: {DEFAULT_OUTPUT_WAV})")
     # Add arguments for SDR parameters if needed, otherwise use defaults from transmit_fm
-    parser.add_argument("--sdr-uri", default=SDR_URI, help="SDR device URI")
+    parser.add_argument("--sdr-uri", default=SDR_URI, help="SDR device URI (sim:, null:, file:<path> and sigmf:<base> run without hardware)")
     parser.add_argument("--sdr-freq", type=float, default=CENTER_FREQ, help="SDR frequency (Hz)")
     parser.add_argument("--sdr-rate", type=float, default=SAMPLE_RATE, help="SDR sample rate (Hz)")
+    parser.add_argument("--auto-rate", action="store_true",
+                        help="Use the lowest SDR sample rate that fits the FM signal (Carson's rule)")
+    parser.add_argument("--allow-fir", action="store_true",
+                        help="With --auto-rate, interpolate rates below 2.08 MHz with our own AD9361 TX FIR "
+                             "instead of pyadi-iio's")
     parser.add_argument("--sdr-gain", type=int, default=TX_GAIN, help="SDR TX gain (dB)")
     parser.add_argument("--sdr-deviation", type=float, default=FM_DEVIATION, help="FM deviation (Hz)")
+    parser.add_argument("--pipelined", action="store_true",
+                        help="Stream LLM -> TTS -> SDR concurrently, sentence by sentence")
 
 
     args = parser.parse_args()
 
+    fir_interpolation = 1
+    if args.auto_rate:
+        host_rate = select_sample_rate(args.sdr_deviation)
+        print_rate_selection(host_rate, args.sdr_deviation, reference_rate=args.sdr_rate)
+        if args.allow_fir and host_rate < PLUTO_MIN_RATE_NO_FIR:
+            fir_interpolation = fir_interpolation_for(host_rate) # The TX FIR brings it up to a valid DAC rate
+        args.sdr_rate = host_rate * fir_interpolation
+
     sdr_parameters = {
         'uri': args.sdr_uri,
         'freq': args.sdr_freq,
         'rate': args.sdr_rate,
         'gain': args.sdr_gain,
         'deviation': args.sdr_deviation,
+        'fir_interpolation': fir_interpolation, # 'rate' is after the TX FIR; the host generates rate / this
         'audio_rate': AUDIO_TARGET_RATE, # Keep using the default from transmit_fm for now
         'chunk': CHUNK_SIZE             # Keep using the default from transmit_fm for now
     }
 
-    if run_workflow(args.prompt, args.ollama_model, args.tts_reference, args.tts_model, args.output_wav, sdr_parameters):
+    # Filters, modulator and SDR configuration are set up once and reused by every transmission
+    try:
+        plan = TransmitPlan.from_sdr_params(sdr_parameters)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    try:
+        if args.pipelined:
+            success = run_pipelined_workflow(args.prompt, args.ollama_model, args.tts_reference, args.tts_model,
+                                             sdr_parameters, plan=plan)
+        else:
+            success = run_workflow(args.prompt, args.ollama_model, args.tts_reference, args.tts_model,
+                                   args.output_wav, sdr_parameters, plan=plan)
+    finally:
+        plan.close()
+
+    if success:
         print("Main script finished.")
     else:
         print("Main script finished with errors.")
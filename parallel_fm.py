@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Multi-core FM modulation of long messages.
+
+The audio is cut into segments that are resampled and modulated
+independently in a process pool. Each segment is processed with enough
+surrounding audio (padding) for the filters to settle, and the padded part
+of the result is trimmed, so every kept sample equals the one the serial
+path computes. Segment boundaries are aligned so that each resampling
+stage starts on a whole output sample.
+
+A worker modulates its segment as if the carrier phase were 0 where the
+segment starts, and reports how far the phase advances over it. An
+exclusive prefix sum of those advances gives each segment's true starting
+phase, which is applied as a single complex rotation when the segments are
+stitched back together. Since the resampling after modulation is linear,
+that rotation is exactly what starting the modulator at that phase would
+have produced.
+"""
+
+import collections
+import copy
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from fractions import Fraction
+
+import numpy as np
+
+# --- Parameters ---
+SEGMENT_SECONDS = 5.0  # Audio per segment handed to a worker
+DSP_WORKERS = 1        # Worker count; 1 keeps the serial path, 0 uses every core
+IN_FLIGHT_PER_WORKER = 2 # Segments queued per worker; bounds the memory held by finished segments
+
+def create_executor(workers=DSP_WORKERS, use_threads=False):
+    """
+    Creates a worker pool for parallel_fm_signal_blocks().
+
+    Processes sidestep the GIL for the Python-level parts of the DSP; threads
+    avoid copying segments between processes and still overlap the numpy and
+    BLAS work, which releases the GIL.
+
+    Args:
+        workers (int): Worker count (0 for every core).
+        use_threads (bool): Use a thread pool instead of processes.
+
+    Returns:
+        Executor: The pool; shut it down when done.
+    """
+    workers = workers or os.cpu_count() or 1
+    return ThreadPoolExecutor(workers) if use_threads else ProcessPoolExecutor(workers)
+
+def _stage_ratios(plan):
+    """Returns the reduced (up, down) ratio of every stage of a ResamplingPlan."""
+    ratios = []
+    for up, down, _ in plan.stages:
+        g = math.gcd(int(up), int(down))
+        ratios.append((int(up) // g, int(down) // g))
+    return ratios
+
+def _alignment(ratios):
+    """
+    Returns the smallest input step at which every stage of a chain starts on a whole sample.
+
+    Stage i takes input index n * scale_i for plan input index n; a stage
+    with ratio up/down only maps input index k to a whole output index when
+    k is a multiple of down.
+    """
+    step = 1
+    scale = Fraction(1)
+    for up, down in ratios:
+        needed = Fraction(down) / scale # step * scale must be a multiple of down
+        step = math.lcm(step, needed.numerator)
+        scale *= Fraction(up, down)
+    return step
+
+def _support(plan):
+    """Returns how many plan input samples on either side an output sample depends on."""
+    support = 0.0
+    scale = Fraction(1)
+    for up, down, taps in plan.stages:
+        g = math.gcd(int(up), int(down))
+        support += (math.ceil(len(taps) / (int(up) // g)) + 1) / float(scale)
+        scale *= Fraction(int(up) // g, int(down) // g)
+    return math.ceil(support)
+
+def _ratio(plan):
+    """Returns the exact output/input rate ratio of a ResamplingPlan."""
+    ratio = Fraction(1)
+    for up, down in _stage_ratios(plan):
+        ratio *= Fraction(up, down)
+    return ratio
+
+def _align_up(value, step):
+    return -(-int(value) // step) * step
+
+def _resample_all(resampler, signal):
+    """Runs a whole signal through a fresh resampler, including its tail."""
+    resampler.reset()
+    return np.concatenate((resampler.process(signal), resampler.flush()))
+
+def _render_segment(task):
+    """
+    Worker: resamples and modulates one padded segment.
+
+    Args:
+        task (tuple): (audio, audio_start, bounds, last, gain, audio_plan, sdr_plan,
+            modulator, engine), where audio is the padded slice starting at
+            audio_start and bounds are (t0, t1, tp) intermediate-rate indices:
+            the segment [t0, t1) and the start tp of the padding kept around it.
+
+    Returns:
+        tuple: (complex64 segment at the SDR rate from phase 0, phase advance in radians).
+    """
+    audio, audio_start, (t0, t1, tp), last, gain, audio_plan, sdr_plan, modulator, engine = task
+    r1, r2 = _ratio(audio_plan), _ratio(sdr_plan)
+    dtype = modulator.dtype
+    # Stage 1: audio to the intermediate rate; output j is global index audio_start * r1 + j
+    u = _resample_all(audio_plan.create_resampler(dtype), np.multiply(audio, gain, dtype=dtype))
+    u = u[tp - int(audio_start * r1):]
+    lead = t0 - tp                  # Padding samples before the segment
+    keep = None if last else int((t1 - t0) * r2)
+    trim = int((t0 - tp) * r2)      # SDR-rate samples produced by the leading padding
+
+    if engine == "direct":
+        v = _resample_all(sdr_plan.create_resampler(dtype), u)[trim:]
+        v = v[:keep]
+        np.clip(v, -1.0, 1.0, out=v)
+        advance = modulator.sensitivity * np.sum(v, dtype=np.float64)
+        modulator.reset(0.0)
+        return modulator.process(v), advance
+
+    np.clip(u, -1.0, 1.0, out=u)
+    segment = u[lead:] if last else u[lead:lead + (t1 - t0)]
+    advance = modulator.sensitivity * np.sum(segment, dtype=np.float64)
+    # Start the padding at the phase that puts the segment's own start at 0
+    modulator.reset(np.mod(-modulator.sensitivity * np.sum(u[:lead], dtype=np.float64), 2.0 * np.pi))
+    iq = _resample_all(sdr_plan.create_resampler(dtype), modulator.process(u))[trim:]
+    return iq[:keep], advance
+
+def parallel_fm_signal_blocks(audio_data, fs_audio, gain, audio_plan, sdr_plan, modulator, engine,
+                              dac_scale, workers=DSP_WORKERS, segment_seconds=SEGMENT_SECONDS,
+                              executor=None):
+    """
+    Modulates a message on several cores, yielding the same signal as the serial path.
+
+    Args:
+        audio_data (np.ndarray or WavStream): Mono float audio, sliced one segment at a time.
+        fs_audio (int): Sample rate of audio_data in Hz.
+        gain (float): Normalization gain applied before resampling.
+        audio_plan (ResamplingPlan): Audio to intermediate rate.
+        sdr_plan (ResamplingPlan): Intermediate rate to SDR rate (FM signal or audio, per engine).
+        modulator (FMModulator): Modulator whose phase the message continues from;
+            it is advanced past the message. Each segment is modulated by a copy of it.
+        engine (str): "two-stage" or "direct" (see transmit_fm.fm_signal_blocks).
+        dac_scale (float): Amplitude the unit-envelope FM signal is scaled to.
+        workers (int): Worker count (0 for every core).
+        segment_seconds (float): Audio per segment.
+        executor (Executor): Pool to run the segments in, e.g. from create_executor(),
+            left running afterwards. A process pool of its own is used if None.
+
+    Yields:
+        np.ndarray: complex64 segments of the baseband signal scaled for the DAC.
+    """
+    workers = workers or os.cpu_count() or 1
+    r1 = _ratio(audio_plan)
+    step = _alignment(_stage_ratios(audio_plan) + _stage_ratios(sdr_plan))
+    align2 = _alignment(_stage_ratios(sdr_plan))
+    pad2 = _align_up(_support(sdr_plan) + 1, align2)                       # Intermediate-rate padding
+    pad = _align_up(math.ceil(pad2 / r1) + _support(audio_plan) + 1, step) # Audio padding
+    segment = max(_align_up(segment_seconds * fs_audio, step), step)
+    total = len(audio_data)
+    starts = list(range(0, total, segment)) or [0]
+
+    def tasks():
+        for index, a0 in enumerate(starts):
+            last = index == len(starts) - 1
+            a1 = min(a0 + segment, total)
+            audio_start = max(0, a0 - pad)
+            t0, t1 = int(a0 * r1), int(a1 * r1)
+            tp = max(0, t0 - pad2)
+            audio = np.asarray(audio_data[audio_start:min(total, a1 + pad)])
+            # Every segment gets its own modulator: workers in a thread pool would share one
+            yield (audio, audio_start, (t0, t1, tp), last, gain, audio_plan, sdr_plan, copy.deepcopy(modulator),
+                   engine)
+
+    pool = executor or create_executor(workers)
+    phase = modulator.phase
+    try:
+        pending = collections.deque()
+        task_iter = tasks()
+        for task in task_iter:
+            pending.append(pool.submit(_render_segment, task))
+            if len(pending) >= workers * IN_FLIGHT_PER_WORKER:
+                break
+        while pending:
+            iq, advance = pending.popleft().result()
+            for task in task_iter: # Keep the pool busy while this segment is stitched in
+                pending.append(pool.submit(_render_segment, task))
+                break
+            iq *= np.complex64(dac_scale * np.exp(1j * phase))
+            phase = np.mod(phase + advance, 2.0 * np.pi)
+            if len(iq):
+                yield iq
+    finally:
+        for future in pending:
+            future.cancel()
+        if executor is None:
+            pool.shutdown(wait=True)
+    modulator.phase = phase
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+AD9361 TX FIR configuration for the ADALM-PLUTO.
+
+The AD9361 has a programmable FIR filter in front of its fixed half-band
+interpolators. Loaded with an interpolating design, it takes over the last
+interpolation by 2 or 4 from the host, so fewer samples have to be generated
+and sent over USB/IP. Without it the baseband rate cannot go below 2.083 MHz
+(the 25 MHz minimum ADC clock divided by 12); with interpolation N the floor
+drops to 2.083 MHz / N.
+
+pyadi-iio's sample_rate setter refuses rates below 521 kHz and, for low
+rates, loads an FIR design of its own. A session using one of these filters
+therefore loads and enables it, then writes the AD9361 sampling_frequency
+attribute directly.
+
+Filter configurations use the .ftr text format that pyadi-iio's `filter`
+attribute loads:
+
+    TX 3 GAIN 0 INT 4
+    RX 3 GAIN 0 DEC 4
+    BWTX 100000
+    BWRX 100000
+    <rx coefficient>,<tx coefficient>
+    ...
+"""
+
+import os
+import tempfile
+
+import numpy as np
+from scipy.signal import firwin
+
+# --- Parameters ---
+# AD9361 baseband rate limits on the Pluto. Below PLUTO_MIN_RATE_NO_FIR the TX
+# FIR filter has to interpolate, by up to PLUTO_FIR_MAX_INTERPOLATION, which
+# puts the lowest rate at PLUTO_MIN_RATE (also where pyadi-iio's setter stops).
+PLUTO_MIN_RATE_NO_FIR = 25e6 / 12
+PLUTO_MIN_RATE = 521e3
+PLUTO_MAX_RATE = 61.44e6
+PLUTO_FIR_MAX_INTERPOLATION = 4
+FIR_INTERPOLATIONS = (1, 2, 4)  # Interpolation factors the TX FIR supports
+FIR_TAPS_PER_PHASE = 32         # Taps per polyphase branch (the TX FIR takes up to 128 taps in total)
+FIR_PASSBAND = 0.8              # Cutoff as a fraction of the input Nyquist frequency
+FIR_COEFF_SCALE = 2**15 - 1     # Coefficients are signed 16-bit; each branch sums to this for unity gain
+
+def design_tx_fir(interpolation, num_taps=None):
+    """
+    Designs an interpolating low-pass filter for the AD9361 TX FIR.
+
+    Args:
+        interpolation (int): Interpolation factor, 2 or 4.
+        num_taps (int): Filter length, a multiple of 16 (default: FIR_TAPS_PER_PHASE per phase).
+
+    Returns:
+        np.ndarray: int16 coefficients with unity gain through every polyphase branch.
+    """
+    if interpolation not in FIR_INTERPOLATIONS[1:]:
+        raise ValueError(f"TX FIR interpolation must be one of {FIR_INTERPOLATIONS[1:]}, got {interpolation}")
+    num_taps = num_taps or FIR_TAPS_PER_PHASE * interpolation
+    h = firwin(num_taps, FIR_PASSBAND / interpolation, window=('kaiser', 6.0))
+    h *= interpolation * FIR_COEFF_SCALE / np.sum(h)
+    return np.clip(np.round(h), -2**15, 2**15 - 1).astype(np.int16)
+
+def write_fir_config(path, interpolation, bandwidth, coefficients=None):
+    """
+    Writes a .ftr filter configuration with the same design for TX and RX.
+
+    Args:
+        path (str): Output file.
+        interpolation (int): TX interpolation (and RX decimation) factor.
+        bandwidth (float): Analog filter bandwidth to request, in Hz.
+        coefficients (np.ndarray): int16 taps; designed with design_tx_fir() if None.
+    """
+    if coefficients is None:
+        coefficients = design_tx_fir(interpolation)
+    lines = [f"TX 3 GAIN 0 INT {interpolation}", f"RX 3 GAIN 0 DEC {interpolation}",
+             f"BWTX {int(bandwidth)}", f"BWRX {int(bandwidth)}"]
+    lines += [f"{c},{c}" for c in coefficients]
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+def read_fir_config(path):
+    """
+    Parses a .ftr filter configuration.
+
+    Args:
+        path (str): The .ftr file.
+
+    Returns:
+        dict: 'interpolation' (TX INT factor), 'decimation' (RX DEC factor) and
+              'tx_coefficients' (np.ndarray of the TX taps).
+    """
+    config = {'interpolation': 1, 'decimation': 1, 'tx_coefficients': []}
+    with open(path) as f:
+        for line in f:
+            fields = line.replace(",", " ").split()
+            if not fields or fields[0].startswith("#"):
+                continue
+            if fields[0] == "TX" and "INT" in fields:
+                config['interpolation'] = int(fields[fields.index("INT") + 1])
+            elif fields[0] == "RX" and "DEC" in fields:
+                config['decimation'] = int(fields[fields.index("DEC") + 1])
+            elif fields[0].lstrip("-").isdigit():
+                config['tx_coefficients'].append(int(fields[-1]))
+    config['tx_coefficients'] = np.array(config['tx_coefficients'], dtype=np.int16)
+    return config
+
+def default_fir_config(interpolation, sample_rate):
+    """
+    Returns the path of a generated TX FIR configuration, writing it if needed.
+
+    Args:
+        interpolation (int): Interpolation factor, 2 or 4.
+        sample_rate (float): Host sample rate in Hz; sets the requested analog bandwidth.
+
+    Returns:
+        str: Path of the .ftr file in the temporary directory.
+    """
+    path = os.path.join(tempfile.gettempdir(), f"pluto_tx_fir_int{interpolation}_{int(sample_rate)}.ftr")
+    if not os.path.exists(path):
+        write_fir_config(path, interpolation, FIR_PASSBAND * sample_rate / 2)
+    return path
+
+def fir_interpolation_for(sample_rate):
+    """Returns the smallest TX FIR interpolation factor that makes sample_rate valid on the Pluto, or None."""
+    for interpolation in FIR_INTERPOLATIONS:
+        if PLUTO_MIN_RATE_NO_FIR <= sample_rate * interpolation <= PLUTO_MAX_RATE:
+            return interpolation
+    return None
@@ -8,6 +8,7 @@ Queries a local Ollama instance with a given prompt and model.
 import ollama
 import argparse
 import sys
+import time
 
 # --- Parameters ---
 DEFAULT_MODEL = "gemma3:1b-it-qat"
@@ -58,14 +59,103 @@ def query_ollama(prompt, model_name):
         print("Ensure the Ollama service is running locally.")
         return None
 
+def stream_ollama(prompt, model_name, stats=None):
+    """
+    Sends a prompt to the specified Ollama model and yields response tokens as they arrive.
+
+    Args:
+        prompt (str): The input prompt for the model.
+        model_name (str): The name of the Ollama model to use.
+        stats (dict): Optional dict filled in with timing metrics: 'ttft' (seconds
+            to first token), 'tokens', 'tokens_per_second', 'total_seconds' and
+            'completed' (False if the stream ended with an error).
+
+    Yields:
+        str: Response text fragments in generation order.
+    """
+    if stats is None:
+        stats = {}
+    stats.update({'ttft': None, 'tokens': 0, 'tokens_per_second': None,
+                  'total_seconds': None, 'completed': False})
+
+    print("--- Streaming from Ollama ---")
+    print(f"Model: {model_name}")
+    print(f"Prompt: '{prompt}'")
+    print("-----------------------------")
+
+    start_time = time.perf_counter()
+    first_token_time = None
+    final_chunk = None
+    try:
+        stream = ollama.chat(
+            model=model_name,
+            messages=[
+                {'role': 'user', 'content': prompt},
+            ],
+            stream=True,
+        )
+        for chunk in stream:
+            token = chunk['message']['content'] if 'message' in chunk else ''
+            if token:
+                if first_token_time is None:
+                    first_token_time = time.perf_counter()
+                    stats['ttft'] = first_token_time - start_time
+                stats['tokens'] += 1
+                yield token
+            if chunk.get('done'):
+                final_chunk = chunk
+
+    except ollama.ResponseError as e:
+        print(f"Error interacting with Ollama model '{model_name}': {e}")
+        if "model not found" in str(e):
+            print(f"Ensure the model '{model_name}' is available locally. You might need to run: ollama pull {model_name}")
+        else:
+            print(f"Error details: {e.error}")
+        return
+    except Exception as e:
+        # Catch potential connection errors etc.
+        print(f"An unexpected error occurred: {e}")
+        print("Ensure the Ollama service is running locally.")
+        return
+    finally:
+        stats['total_seconds'] = time.perf_counter() - start_time
+
+    # Prefer Ollama's own eval counters; fall back to wall time since the first token
+    if final_chunk and final_chunk.get('eval_count') and final_chunk.get('eval_duration'):
+        stats['tokens'] = final_chunk['eval_count']
+        stats['tokens_per_second'] = final_chunk['eval_count'] / (final_chunk['eval_duration'] / 1e9)
+    elif first_token_time is not None and stats['tokens'] > 1:
+        stats['tokens_per_second'] = (stats['tokens'] - 1) / (time.perf_counter() - first_token_time)
+    stats['completed'] = True
+
+def print_stream_stats(stats):
+    """Prints the timing metrics collected by stream_ollama."""
+    ttft = f"{stats['ttft']:.2f}s" if stats.get('ttft') is not None else "n/a"
+    tps = f"{stats['tokens_per_second']:.1f}" if stats.get('tokens_per_second') else "n/a"
+    print(f"Ollama stream: time to first token {ttft}, {stats.get('tokens', 0)} tokens, "
+          f"{tps} tokens/s, {stats.get('total_seconds') or 0:.2f}s total")
+
 def main():
     parser = argparse.ArgumentParser(description="Query a local Ollama model.")
     parser.add_argument("prompt", nargs='?', default=DEFAULT_PROMPT,
                         help=f"The prompt to send to the model (default: '{DEFAULT_PROMPT}')")
     parser.add_argument("-m", "--model", default=DEFAULT_MODEL,
                         help=f"The Ollama model name to use (default: '{DEFAULT_MODEL}')")
+    parser.add_argument("-s", "--stream", action="store_true",
+                        help="Print tokens as they are generated and report timing metrics")
     args = parser.parse_args()
 
+    if args.stream:
+        stats = {}
+        print("\n--- Ollama Response ---")
+        for token in stream_ollama(args.prompt, args.model, stats):
+            print(token, end='', flush=True)
+        print("\n-----------------------")
+        print_stream_stats(stats)
+        if not stats['completed']:
+            sys.exit(1)
+        return
+
     result = query_ollama(args.prompt, args.model)
 
     if result:
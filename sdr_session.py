@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Long-lived ADALM-PLUTO transmit session.
+
+Opens the device once, applies configuration changes only when they differ
+from what is already set, and transmits any number of messages back to back.
+"""
+
+import itertools
+import math
+import threading
+import time
+
+import numpy as np
+
+from pluto_fir import default_fir_config, read_fir_config
+from tx_backends import MAX_BUFFER_SAMPLES, TxBackend, open_backend, tx_interleaved
+
+DRAIN_SECONDS = 0.5 # Time to let queued buffers go out before tearing down TX
+
+class PlutoSession:
+    """
+    A persistent PlutoSDR connection for transmitting many messages.
+
+    Usage:
+        with PlutoSession(uri, center_freq, sample_rate, tx_gain) as session:
+            session.transmit(iq_samples, chunk_size)
+            session.transmit(more_iq_samples, chunk_size)
+            session.transmit_cyclic(beacon, repeat_seconds=60, block=False)
+            ...
+            session.stop()
+    """
+
+    def __init__(self, uri, center_freq, sample_rate, tx_gain, sdr_factory=None, max_reconnects=1,
+                 fir_interpolation=1, fir_config=None):
+        """
+        Args:
+            uri (str): URI of the PlutoSDR device.
+            center_freq (float): Center frequency for transmission in Hz.
+            sample_rate (float): Sample rate for the SDR in Hz.
+            tx_gain (int): Transmission gain in dB.
+            sdr_factory (callable): Creates the device from a URI. Defaults to
+                tx_backends.open_backend, which also understands sim:, null:,
+                file: and sigmf: URIs for running without hardware.
+            max_reconnects (int): Reconnect attempts per failed buffer before giving up.
+            fir_interpolation (int): AD9361 TX FIR interpolation (1, 2 or 4). sample_rate
+                is the host rate; the FIR raises it by this factor on the device.
+            fir_config (str): .ftr filter configuration to load. Its INT factor
+                overrides fir_interpolation. A default design is generated if None.
+        """
+        self.uri = uri
+        self.sdr_factory = sdr_factory or open_backend
+        self.max_reconnects = max_reconnects
+        self.config = {'sample_rate': int(sample_rate), 'tx_lo': int(center_freq),
+                       'tx_hardwaregain_chan0': tx_gain}
+        self.sdr = None
+        self.stats = {'connects': 0, 'reconnects': 0, 'config_writes': 0,
+                      'messages': 0, 'buffers': 0}
+        self.fir = {'interpolation': 1, 'config': None}
+        self._set_fir(fir_interpolation, fir_config)
+        self._applied = {}
+        self._applied_fir = None
+        self._tx_enabled = False
+        self._stop_event = threading.Event()
+        self._stop_lock = threading.Lock()
+        self._stop_timer = None
+        self._cyclic_loaded = False
+
+    @property
+    def is_open(self):
+        return self.sdr is not None
+
+    def open(self):
+        """
+        Connects to the device and applies the configuration.
+
+        Returns:
+            bool: True if the device is ready to transmit, False otherwise.
+        """
+        if self.sdr is not None:
+            return True
+        try:
+            print(f"Connecting to PlutoSDR at {self.uri}...")
+            self.sdr = self.sdr_factory(self.uri)
+            self.stats['connects'] += 1
+            print("PlutoSDR connected.")
+
+            self._applied = {}
+            self._applied_fir = None
+            self._tx_enabled = False
+            self.sdr.tx_cyclic_buffer = False # We'll send chunks manually
+            self._apply_config()
+
+            # Ensure buffer is destroyed before potential use (might not exist)
+            try:
+                 self.sdr.tx_destroy_buffer()
+            except Exception as buf_e:
+                 print(f"Note: Could not destroy buffer (may not exist yet): {buf_e}")
+
+            print("SDR configured:")
+            print(f"  TX LO Freq: {self.sdr.tx_lo / 1e6:.3f} MHz")
+            print(f"  Sample Rate: {self.sdr.sample_rate / 1e3:.0f} kHz")
+            print(f"  TX Gain: {self.sdr.tx_hardwaregain_chan0} dB")
+            if self.fir['interpolation'] > 1:
+                print(f"  TX FIR: interpolation x{self.fir['interpolation']} from '{self._applied_fir[1]}'")
+            return True
+
+        except Exception as e:
+            print(f"Error initializing SDR: {e}")
+            print("Ensure the PlutoSDR is connected and accessible via USB.")
+            print("Verify the IP address if using network mode.")
+            print("Check if libiio and pyadi-iio drivers/libraries are correctly installed.")
+            self.sdr = None
+            return False
+
+    def configure(self, center_freq=None, sample_rate=None, tx_gain=None, fir_interpolation=None, fir_config=None):
+        """
+        Updates the configuration, writing only the attributes that changed.
+
+        Args:
+            center_freq (float): New center frequency in Hz, or None to keep.
+            sample_rate (float): New (host) sample rate in Hz, or None to keep.
+            tx_gain (int): New transmission gain in dB, or None to keep.
+            fir_interpolation (int): New TX FIR interpolation, or None to keep.
+            fir_config (str): New .ftr filter configuration, or None for the default design.
+        """
+        if fir_interpolation is not None or fir_config is not None:
+            self._set_fir(fir_interpolation or 1, fir_config)
+        if center_freq is not None:
+            self.config['tx_lo'] = int(center_freq)
+        if sample_rate is not None:
+            self.config['sample_rate'] = int(sample_rate)
+        if tx_gain is not None:
+            self.config['tx_hardwaregain_chan0'] = tx_gain
+        if self.sdr is not None:
+            self._apply_config()
+
+    def _set_fir(self, interpolation, config):
+        """Records the wanted TX FIR setup; the INT factor of a given config file wins."""
+        if config is not None:
+            interpolation = read_fir_config(config)['interpolation']
+        if interpolation not in (1, 2, 4):
+            raise ValueError(f"TX FIR interpolation must be 1, 2 or 4, got {interpolation}")
+        self.fir = {'interpolation': interpolation, 'config': config}
+
+    def _apply_config(self):
+        """Writes configuration attributes that differ from what was last applied."""
+        # Our FIR has to be loaded and enabled before a rate that depends on it is
+        # set, and any change to it changes what the rate means on the device
+        fir_changed = self._apply_fir()
+        for attr, value in self.config.items():
+            if self._applied.get(attr) == value and not (attr == 'sample_rate' and fir_changed):
+                continue
+            if attr == 'sample_rate' and self.fir['interpolation'] > 1:
+                # pyadi-iio's setter refuses rates below 521 kHz and loads its own FIR over ours
+                self.sdr._set_iio_attr("voltage0", "sampling_frequency", True, value)
+            else:
+                setattr(self.sdr, attr, value)
+            self._applied[attr] = value
+            self.stats['config_writes'] += 1
+
+    def _apply_fir(self):
+        """
+        Loads and enables the TX FIR if its setup changed.
+
+        Returns:
+            bool: True if the FIR setup changed, so the sample rate has to be written again.
+        """
+        interpolation = self.fir['interpolation']
+        if interpolation > 1:
+            config = self.fir['config'] or default_fir_config(interpolation, self.config['sample_rate'])
+            if self._applied_fir == (interpolation, config):
+                return False
+            self.sdr.filter = config
+            self.sdr._set_iio_attr("voltage0", "filter_fir_en", True, 1)
+            self._applied_fir = (interpolation, config)
+            self.stats['config_writes'] += 1
+            return True
+        if self._applied_fir is None or self._applied_fir[0] == 1:
+            return False # Never loaded on this connection
+        # Nothing to switch off: pyadi-iio's sample_rate setter replaces our filter with one for the rate
+        self._applied_fir = (1, None)
+        return True
+
+    def tx(self, buffer):
+        """
+        Sends one buffer, reconnecting and retrying if the device errors out.
+
+        Args:
+            buffer (np.ndarray): Complex samples scaled for the DAC, or interleaved
+                int16 I/Q (sent without further conversion, see tx_backends.tx_interleaved).
+
+        Returns:
+            bool: True if the buffer was sent, False otherwise.
+        """
+        for attempt in range(self.max_reconnects + 1):
+            if attempt > 0 and not self.reconnect():
+                continue
+            if self.sdr is None and not self.open():
+                continue
+            try:
+                if not self._tx_enabled:
+                    # Enable TX channel 0
+                    self.sdr.tx_enabled_channels = [0]
+                    self._tx_enabled = True
+                if buffer.dtype == np.int16:
+                    tx_interleaved(self.sdr, buffer)
+                else:
+                    self.sdr.tx(buffer)
+                self.stats['buffers'] += 1
+                return True
+            except Exception as tx_e:
+                print(f"Error sending buffer: {tx_e}")
+        return False
+
+    def transmit(self, iq_samples, chunk_size):
+        """
+        Transmits one message as a sequence of equally sized buffers.
+
+        The last buffer is zero-padded so the device buffer size never changes
+        between messages.
+
+        Args:
+            iq_samples (np.ndarray): Complex samples scaled for the DAC.
+            chunk_size (int): Number of samples per transmission chunk.
+
+        Returns:
+            bool: True if every chunk was sent, False otherwise.
+        """
+        print(f"Starting transmission of {len(iq_samples)} samples in "
+              f"{math.ceil(len(iq_samples) / chunk_size)} chunks...")
+        return self.transmit_blocks([iq_samples], chunk_size)
+
+    def transmit_blocks(self, blocks, chunk_size, stop_event=None):
+        """
+        Transmits one message produced as a stream of arbitrarily sized blocks.
+
+        Blocks are regrouped into chunk_size buffers as they arrive, so the
+        first buffer goes out as soon as enough samples have been produced.
+
+        Args:
+            blocks (iterable): Complex sample arrays scaled for the DAC.
+            chunk_size (int): Number of samples per transmission chunk.
+            stop_event (threading.Event): Abandons the message when set.
+
+        Returns:
+            bool: True if every chunk was sent, False otherwise.
+        """
+        print(f"Chunk size: {chunk_size} samples")
+        start_time = time.time()
+        sent = 0
+        pending = None
+        for block in blocks:
+            if stop_event is not None and stop_event.is_set():
+                print(f"  Stopped after {sent} chunks")
+                return False
+            pending = block if pending is None or not len(pending) else np.concatenate((pending, block))
+            num_full = len(pending) // chunk_size
+            for i in range(num_full):
+                if not self._send_chunk(pending[i * chunk_size:(i + 1) * chunk_size], sent):
+                    return False
+                sent += 1
+            pending = pending[num_full * chunk_size:]
+
+        if pending is not None and len(pending):
+            padded = np.zeros(chunk_size, dtype=pending.dtype)
+            padded[:len(pending)] = pending
+            if not self._send_chunk(padded, sent):
+                return False
+            sent += 1
+
+        self.stats['messages'] += 1
+        print(f"  Sent {sent} chunks")
+        print(f"Message queued in {time.time() - start_time:.2f} seconds.")
+        return True
+
+    def transmit_cyclic(self, iq_samples, repeat_count=None, repeat_seconds=None, chunk_size=None,
+                        block=True, max_samples=MAX_BUFFER_SAMPLES):
+        """
+        Transmits a short message on repeat from a cyclic device buffer.
+
+        The message is uploaded once and the device loops it with no further
+        USB/IP traffic until stop() is called, the requested number of repeats
+        or seconds has elapsed, or the session is closed. A message longer
+        than max_samples does not fit in one device buffer and is streamed
+        chunk by chunk instead, repeating it the same number of times.
+
+        Args:
+            iq_samples (np.ndarray): One period of the message: complex samples
+                scaled for the DAC, or interleaved int16 I/Q.
+            repeat_count (int): Times to send the message, or None.
+            repeat_seconds (float): How long to repeat it, or None. With neither
+                set, it repeats until stop().
+            chunk_size (int): Chunk size for the streaming fallback (default: 1/8 of max_samples).
+            block (bool): Wait until the repeats are done. Otherwise return right
+                away and stop in the background.
+            max_samples (int): Largest message to load as a single device buffer.
+
+        Returns:
+            bool: True if the message was loaded (or, when blocking, sent), False otherwise.
+        """
+        interleaved = iq_samples.dtype == np.int16
+        num_samples = len(iq_samples) // 2 if interleaved else len(iq_samples)
+        period = num_samples / float(self.config['sample_rate'])
+        if repeat_seconds is None and repeat_count is not None:
+            repeat_seconds = repeat_count * period
+        self.stop()
+        self._stop_event = stop_event = threading.Event()
+
+        if num_samples > max_samples:
+            chunk_size = chunk_size or max_samples // 8
+            print(f"Message of {num_samples} samples exceeds the {max_samples}-sample device buffer; "
+                  f"streaming the repeats instead.")
+            if repeat_count is None and repeat_seconds is not None:
+                repeat_count = max(1, math.ceil(repeat_seconds / period))
+            if interleaved:
+                iq_samples = iq_samples[0::2] + 1j * iq_samples[1::2]
+            repeats = itertools.repeat(iq_samples, repeat_count) if repeat_count else itertools.repeat(iq_samples)
+            if block:
+                return self.transmit_blocks(repeats, chunk_size, stop_event)
+            if repeat_seconds is not None:
+                self._stop_timer = threading.Timer(repeat_seconds, self.stop)
+                self._stop_timer.daemon = True
+                self._stop_timer.start()
+            threading.Thread(target=self.transmit_blocks, args=(repeats, chunk_size, stop_event),
+                             name="tx-repeat", daemon=True).start()
+            return True
+
+        if self.sdr is None and not self.open():
+            return False
+        try:
+            self.sdr.tx_destroy_buffer()
+        except Exception as buf_e:
+            print(f"Note: Could not destroy buffer (may not exist yet): {buf_e}")
+        self.sdr.tx_cyclic_buffer = True
+        if not self.tx(iq_samples):
+            self.sdr.tx_cyclic_buffer = False
+            return False
+        self._cyclic_loaded = True
+        self.stats['messages'] += 1
+        until = f"for {repeat_seconds:.2f} s" if repeat_seconds is not None else "until stopped"
+        print(f"Cyclic buffer of {num_samples} samples ({period * 1e3:.1f} ms) loaded, repeating {until}.")
+
+        if block:
+            stop_event.wait(repeat_seconds)
+            self.stop()
+        elif repeat_seconds is not None:
+            self._stop_timer = threading.Timer(repeat_seconds, self.stop)
+            self._stop_timer.daemon = True
+            self._stop_timer.start()
+        return True
+
+    def stop(self):
+        """Stops a cyclic or background repeat transmission; safe to call at any time."""
+        with self._stop_lock:
+            self._stop_event.set()
+            if self._stop_timer is not None:
+                self._stop_timer.cancel()
+                self._stop_timer = None
+            if not self._cyclic_loaded:
+                return
+            self._cyclic_loaded = False
+            if self.sdr is None:
+                return
+            try:
+                self.sdr.tx_destroy_buffer()
+                print("Cyclic transmission stopped.")
+            except Exception as buf_e:
+                print(f"Error stopping cyclic buffer: {buf_e}")
+            finally:
+                self.sdr.tx_cyclic_buffer = False
+
+    def _send_chunk(self, chunk, index):
+        """Sends one chunk, printing progress periodically."""
+        if not self.tx(chunk):
+            print(f"Error sending chunk {index+1}, stopping transmission.")
+            return False
+        if (index + 1) % 10 == 0: # Print progress periodically
+             print(f"  Sent chunk {index+1} ({len(chunk)} samples)")
+        return True
+
+    def reconnect(self):
+        """
+        Drops the current connection and opens a fresh one with the same configuration.
+
+        Returns:
+            bool: True if the device is ready again, False otherwise.
+        """
+        print("Reconnecting to PlutoSDR...")
+        self.close(drain_seconds=0)
+        self.stats['reconnects'] += 1
+        return self.open()
+
+    def close(self, drain_seconds=DRAIN_SECONDS):
+        """
+        Disables TX and releases the device.
+
+        Args:
+            drain_seconds (float): Time to wait for queued buffers to be transmitted first.
+        """
+        self.stop()
+        if self.sdr is None:
+            return
+        if drain_seconds and self._tx_enabled and getattr(self.sdr, 'realtime', True):
+            # Wait a short moment to ensure the last buffer is transmitted
+            time.sleep(drain_seconds)
+        print("Cleaning up SDR resources...")
+        try:
+            # Disable TX first
+            self.sdr.tx_enabled_channels = []
+            print("TX disabled.")
+            # Destroy buffer
+            self.sdr.tx_destroy_buffer()
+            print("TX buffer destroyed.")
+        except Exception as cleanup_e:
+            print(f"Error during SDR cleanup: {cleanup_e}")
+        finally:
+            if isinstance(self.sdr, TxBackend):
+                self.sdr.close()
+                self.sdr.print_stats()
+            self.sdr = None # Release SDR object
+            self._tx_enabled = False
+            print("SDR object released.")
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Turns a stream of LLM tokens into sentence-sized, TTS-ready text segments.
+
+Segments are emitted as soon as a boundary is certain, so speech synthesis can
+start on the first sentence while the model is still generating the rest.
+"""
+
+import re
+import argparse
+
+from query_ollama import stream_ollama, print_stream_stats, DEFAULT_MODEL
+
+# --- Parameters ---
+FIRST_MIN_CHARS = 12   # The first segment may end at a clause boundary once it is this long
+MIN_CHARS = 20         # Later segments shorter than this are merged with the next sentence
+MAX_CHARS = 250        # Force a split (at a clause or word boundary) past this length
+
+# Words that end in a period without ending the sentence (compared lowercase, without the period)
+ABBREVIATIONS = {
+    "mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "vs", "no", "fig", "approx",
+    "inc", "ltd", "co", "corp", "gen", "col", "lt", "sgt", "capt", "cmdr", "adm",
+    "dept", "gov", "sen", "rep", "e.g", "i.e", "u.s", "u.k", "a.m", "p.m", "mt", "ft",
+}
+
+SENTENCE_END = ".!?"
+CLAUSE_END = ",;:—"
+CLOSERS = "\"')]*_”’"
+
+def clean_markdown(text):
+    """
+    Strips markdown syntax that should not be read aloud.
+
+    Args:
+        text (str): A text segment, possibly containing markdown.
+
+    Returns:
+        str: Plain text with whitespace collapsed.
+    """
+    text = re.sub(r"```[^\n]*", " ", text)                    # Code fences
+    text = re.sub(r"\[([^\]]*)\]\([^)]*\)", r"\1", text)      # Links -> link text
+    text = re.sub(r"(?m)^\s*#+\s*", "", text)                 # Headings
+    text = re.sub(r"(?m)^\s*[-*+]\s+", "", text)              # Bullets
+    text = re.sub(r"(?m)^\s*>\s?", "", text)                  # Block quotes
+    text = text.replace("`", "")
+    text = re.sub(r"\*+|(?<!\w)_+|_+(?!\w)", "", text)        # Emphasis, keeping snake_case words intact
+    return re.sub(r"\s+", " ", text).strip()
+
+def _is_abbreviation(buffer, dot_index):
+    """Returns True if the period at dot_index belongs to an abbreviation, initial or list number."""
+    line_start = buffer.rfind("\n", 0, dot_index) + 1
+    match = re.search(r"[^\s(\[*_\"']+$", buffer[line_start:dot_index])
+    if not match:
+        return False
+    word = match.group(0)
+    if word.lower() in ABBREVIATIONS:
+        return True
+    if len(word) == 1 and word.isupper():
+        return True  # Initial, e.g. "J. Smith"
+    if word.isdigit() and not buffer[line_start:line_start + match.start()].strip():
+        return True  # Numbered list marker, e.g. "1. First item"
+    return False
+
+class SentenceChunker:
+    """
+    Incrementally splits streamed text into sentence or clause segments.
+
+    Feed tokens with feed(); each call returns the segments that became complete.
+    Call flush() when the stream ends to get whatever is left in the buffer.
+    """
+
+    def __init__(self, first_min_chars=FIRST_MIN_CHARS, min_chars=MIN_CHARS, max_chars=MAX_CHARS):
+        """
+        Args:
+            first_min_chars (int): Minimum length before the first segment may end at a clause.
+            min_chars (int): Minimum length of later segments.
+            max_chars (int): Length past which a segment is split at the best available point.
+        """
+        self.first_min_chars = first_min_chars
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.segments_emitted = 0
+        self._buffer = ""
+
+    def feed(self, token):
+        """
+        Adds a token to the buffer.
+
+        Args:
+            token (str): The next fragment of streamed text.
+
+        Returns:
+            list: Complete segments (str) ready for synthesis, possibly empty.
+        """
+        self._buffer += token
+        segments = []
+        while True:
+            end = self._find_boundary()
+            if end is None:
+                break
+            segment = clean_markdown(self._buffer[:end])
+            self._buffer = self._buffer[end:].lstrip()
+            if segment:
+                segments.append(segment)
+                self.segments_emitted += 1
+        return segments
+
+    def flush(self):
+        """
+        Returns the remaining buffered text as a final segment.
+
+        Returns:
+            list: Zero or one trailing segment.
+        """
+        segment = clean_markdown(self._buffer)
+        self._buffer = ""
+        if not segment:
+            return []
+        self.segments_emitted += 1
+        return [segment]
+
+    def _find_boundary(self):
+        """Returns the end index of the first certain segment in the buffer, or None."""
+        buffer = self._buffer
+        first = self.segments_emitted == 0
+        min_chars = 1 if first else self.min_chars
+        length = len(buffer)
+        i = 0
+        while i < length:
+            ch = buffer[i]
+            if ch == "\n":
+                # A line break ends a segment once we know more text follows it
+                if i + 1 < length and len(buffer[:i].strip()) >= min_chars:
+                    return i
+            elif ch in SENTENCE_END:
+                j = i + 1
+                while j < length and (buffer[j] in SENTENCE_END or buffer[j] in CLOSERS):
+                    j += 1
+                if j >= length:
+                    return None  # Need to see what follows the punctuation
+                if buffer[j].isspace() and len(buffer[:j].strip()) >= min_chars:
+                    k = j
+                    while k < length and buffer[k].isspace():
+                        k += 1
+                    if k >= length:
+                        return None  # Need the next word to rule out a lowercase continuation
+                    if not (ch == "." and _is_abbreviation(buffer, i)) and not buffer[k].islower():
+                        return j
+                i = j
+                continue
+            elif ch in CLAUSE_END and first and i + 1 >= self.first_min_chars:
+                # Start speaking early: the first segment may end at a clause
+                if i + 1 < length and buffer[i + 1].isspace():
+                    return i + 1
+            i += 1
+
+        if length > self.max_chars:
+            return self._forced_split(buffer[:self.max_chars])
+        return None
+
+    def _forced_split(self, window):
+        """Returns the best split point inside an overlong window."""
+        for pattern in (r"[,;:—]\s", r"\s"):
+            matches = list(re.finditer(pattern, window))
+            if matches:
+                return matches[-1].start() + 1
+        return len(window)
+
+def chunk_sentences(tokens, first_min_chars=FIRST_MIN_CHARS, min_chars=MIN_CHARS, max_chars=MAX_CHARS):
+    """
+    Yields TTS-ready segments from an iterable of streamed tokens.
+
+    Args:
+        tokens (iterable): Text fragments, e.g. from query_ollama.stream_ollama.
+        first_min_chars (int): Minimum length before the first segment may end at a clause.
+        min_chars (int): Minimum length of later segments.
+        max_chars (int): Length past which a segment is split at the best available point.
+
+    Yields:
+        str: Segments in order, each as soon as its boundary is certain.
+    """
+    chunker = SentenceChunker(first_min_chars, min_chars, max_chars)
+    for token in tokens:
+        yield from chunker.feed(token)
+    yield from chunker.flush()
+
+def main():
+    parser = argparse.ArgumentParser(description="Split a streamed Ollama response into TTS-ready segments.")
+    parser.add_argument("prompt", help="The prompt to send to Ollama (use quotes).")
+    parser.add_argument("-m", "--model", default=DEFAULT_MODEL,
+                        help=f"The Ollama model name to use (default: '{DEFAULT_MODEL}')")
+    args = parser.parse_args()
+
+    stats = {}
+    for i, segment in enumerate(chunk_sentences(stream_ollama(args.prompt, args.model, stats))):
+        print(f"[{i + 1}] {segment}")
+    print_stream_stats(stats)
+
+if __name__ == "__main__":
+    main()
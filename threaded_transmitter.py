@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Double-buffered transmit loop: DSP runs ahead in a producer thread while a
+dedicated TX thread does nothing but hand ready buffers to the SDR.
+
+A Python hiccup in modulation, logging or elsewhere then only drains the
+buffer ring instead of stalling the DAC feed. Buffers are converted to the
+device's interleaved int16 format in the producer, so the TX thread only
+hands finished memory to the driver.
+"""
+
+import queue
+import threading
+import time
+
+import numpy as np
+
+from tx_backends import to_interleaved_int16
+
+RING_SIZE = 8 # Buffers the producer may run ahead of the TX thread
+
+class ThreadedTransmitter:
+    """
+    Streams a message through a bounded ring of pre-converted TX buffers.
+
+    The producer thread pulls DSP blocks, converts them into fixed-size buffers
+    taken from a preallocated pool and queues them. The TX thread sends queued
+    buffers and returns them to the pool. The pool is allocated once and
+    reused by every message sent through the same transmitter.
+    """
+
+    def __init__(self, session, chunk_size, ring_size=RING_SIZE, dtype=np.int16, prefill=None):
+        """
+        Args:
+            session (PlutoSession): Open session the buffers are sent on.
+            chunk_size (int): Number of samples per TX buffer.
+            ring_size (int): Number of buffers in the pool.
+            dtype: Buffer format. np.int16 (the default) gives interleaved I/Q
+                that goes to the device without further conversion; a complex
+                dtype leaves the conversion to the driver's tx() call.
+            prefill (int): Buffers queued before the first one is sent (default: half the ring).
+        """
+        self.session = session
+        self.chunk_size = chunk_size
+        self.ring_size = ring_size
+        self.dtype = np.dtype(dtype)
+        self.interleaved = self.dtype == np.int16
+        self._values_per_sample = 2 if self.interleaved else 1
+        self.prefill = ring_size // 2 if prefill is None else prefill
+        self._start_time = None
+        self._pool = [np.zeros(chunk_size * self._values_per_sample, dtype=self.dtype) for _ in range(ring_size)]
+        self.stats = {}
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Clears the counters of the previous transmission."""
+        self.stats = {'buffers': 0, 'underruns': 0, 'late_buffers': 0, 'max_lateness': 0.0,
+                      'min_queue_depth': None, 'queue_depth_sum': 0, 'elapsed': 0.0, 'first_tx_delay': None,
+                      'convert_seconds': 0.0, 'tx_seconds': 0.0, 'max_tx_seconds': 0.0}
+
+    def transmit(self, blocks):
+        """
+        Transmits one message produced as a stream of arbitrarily sized blocks.
+
+        Args:
+            blocks (iterable): Complex sample arrays scaled for the DAC.
+
+        Returns:
+            bool: True if every buffer was sent, False otherwise.
+        """
+        self.reset_stats()
+        free = queue.Queue()
+        for buffer in self._pool:
+            free.put(buffer)
+        filled = queue.Queue()
+        stop = threading.Event()
+        errors = []
+        produced = threading.Event()
+
+        producer = threading.Thread(target=self._produce, args=(blocks, free, filled, stop, produced, errors),
+                                    name="tx-producer", daemon=True)
+        consumer = threading.Thread(target=self._consume, args=(free, filled, stop, produced, errors),
+                                    name="tx-consumer", daemon=True)
+        start_time = self._start_time = time.perf_counter()
+        producer.start()
+        consumer.start()
+        consumer.join()
+        stop.set()
+        producer.join()
+        self.stats['elapsed'] = time.perf_counter() - start_time
+
+        for error in errors:
+            print(f"Error during transmission: {error}")
+        if not errors:
+            self.session.stats['messages'] += 1
+        return not errors
+
+    def _take_buffer(self, free, stop):
+        """Gets an empty buffer from the pool, waiting while the ring is full."""
+        while not stop.is_set():
+            try:
+                return free.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return None
+
+    def _fill(self, buffer, fill, samples):
+        """Copies complex samples into a pooled buffer at sample offset fill, converting the format."""
+        if self.interleaved:
+            to_interleaved_int16(samples, buffer[2 * fill:2 * (fill + len(samples))])
+        else:
+            buffer[fill:fill + len(samples)] = samples
+
+    def _produce(self, blocks, free, filled, stop, produced, errors):
+        """Producer thread: regroups DSP blocks into pooled, fixed-size, device-format buffers."""
+        try:
+            buffer = self._take_buffer(free, stop)
+            fill = 0
+            for block in blocks:
+                offset = 0
+                while offset < len(block) and buffer is not None:
+                    count = min(self.chunk_size - fill, len(block) - offset)
+                    start = time.perf_counter()
+                    self._fill(buffer, fill, block[offset:offset + count])
+                    self.stats['convert_seconds'] += time.perf_counter() - start
+                    fill += count
+                    offset += count
+                    if fill == self.chunk_size:
+                        filled.put(buffer)
+                        buffer = self._take_buffer(free, stop)
+                        fill = 0
+                if buffer is None:
+                    return # TX thread gave up
+            if fill:
+                buffer[fill * self._values_per_sample:] = 0 # Zero-pad the last buffer to keep the size constant
+                filled.put(buffer)
+        except Exception as e:
+            errors.append(f"DSP producer failed: {e}")
+        finally:
+            filled.put(None)
+            produced.set()
+
+    def _consume(self, free, filled, stop, produced, errors):
+        """TX thread: sends buffers as soon as they are ready and tracks pacing."""
+        chunk_seconds = self.chunk_size / float(self.session.config['sample_rate'])
+        # Let the producer fill half the ring before keying up, so the stream starts with slack
+        while filled.qsize() < self.prefill and not produced.is_set():
+            time.sleep(chunk_seconds / 4)
+        first_tx = None
+        while True:
+            try:
+                buffer = filled.get_nowait()
+            except queue.Empty:
+                if first_tx is not None:
+                    self.stats['underruns'] += 1 # Ring ran dry while streaming
+                buffer = filled.get()
+            if buffer is None:
+                return
+
+            depth = filled.qsize()
+            self.stats['queue_depth_sum'] += depth
+            if self.stats['min_queue_depth'] is None or depth < self.stats['min_queue_depth']:
+                self.stats['min_queue_depth'] = depth
+
+            now = time.perf_counter()
+            if first_tx is None:
+                first_tx = now
+                self.stats['first_tx_delay'] = now - self._start_time
+            # The device needs buffer n by the time buffers 0..n-1 have played out
+            lateness = now - (first_tx + self.stats['buffers'] * chunk_seconds)
+            if lateness > 0:
+                self.stats['late_buffers'] += 1
+                self.stats['max_lateness'] = max(self.stats['max_lateness'], lateness)
+
+            start = time.perf_counter()
+            sent = self.session.tx(buffer)
+            tx_seconds = time.perf_counter() - start
+            if not sent:
+                errors.append(f"SDR rejected buffer {self.stats['buffers'] + 1}")
+                stop.set()
+                return
+            self.stats['tx_seconds'] += tx_seconds
+            self.stats['max_tx_seconds'] = max(self.stats['max_tx_seconds'], tx_seconds)
+            self.stats['buffers'] += 1
+            free.put(buffer)
+
+    def print_stats(self):
+        """Prints the pacing counters of the last transmission."""
+        buffers = self.stats['buffers']
+        average_depth = self.stats['queue_depth_sum'] / buffers if buffers else 0.0
+        print(f"Sent {buffers} buffers in {self.stats['elapsed']:.2f}s: "
+              f"queue depth avg {average_depth:.1f} / min {self.stats['min_queue_depth']} of {self.ring_size}, "
+              f"{self.stats['underruns']} underruns, {self.stats['late_buffers']} late buffers "
+              f"(max {self.stats['max_lateness'] * 1e3:.1f} ms late)")
+        if buffers:
+            conversion = (f"{self.stats['convert_seconds'] / buffers * 1e6:.0f} us int16 conversion in the producer"
+                          if self.interleaved else "format conversion left to the driver's tx()")
+            print(f"  Per chunk: tx() {self.stats['tx_seconds'] / buffers * 1e6:.0f} us avg / "
+                  f"{self.stats['max_tx_seconds'] * 1e6:.0f} us max in the TX thread, {conversion}")
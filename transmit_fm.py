@@ -9,12 +9,23 @@ WARNING: Transmitting radio signals requires adherence to local regulations
          responsibly. Start with minimum transmit power.
 """
 
-import adi
+import argparse
+import copy
+import math
+import os
+import sys
 import numpy as np
 from scipy.io import wavfile
-from scipy.signal import resample_poly
 import time
-import math
+
+from fm_dsp import (ChannelMixer, FMModulator, create_modulator, get_resampling_plan, BLOCK_SIZE, DSP_DTYPE, LUT_SIZE,
+                    MODULATOR_MODES, RESAMPLING_QUALITIES, DEFAULT_QUALITY, DEFAULT_PLAN_CACHE_DIR)
+from iq_cache import IQCache, content_key, DEFAULT_IQ_CACHE_DIR, IQ_CACHE_MAX_BYTES
+from parallel_fm import create_executor, parallel_fm_signal_blocks, DSP_WORKERS, SEGMENT_SECONDS
+from pluto_fir import (PLUTO_MIN_RATE, PLUTO_MIN_RATE_NO_FIR, PLUTO_MAX_RATE, FIR_INTERPOLATIONS,
+                       fir_interpolation_for, read_fir_config)
+from sdr_session import PlutoSession
+from threaded_transmitter import ThreadedTransmitter
 
 # --- Parameters ---
 AUDIO_FILE = "output.wav"
@@ -25,52 +36,137 @@ TX_GAIN = -10            # TX gain in dB (Start low, e.g., -30 to -10)
 FM_DEVIATION = 5e3       # FM deviation (e.g., 5 kHz for narrowband FM)
 AUDIO_TARGET_RATE = 48e3 # Intermediate audio rate before final resampling
 CHUNK_SIZE = 8192        # Number of samples per transmission chunk
+FM_ENGINES = ("two-stage", "direct") # Modulate at AUDIO_TARGET_RATE and resample, or modulate at the SDR rate
+FM_ENGINE = "two-stage"
+BANDWIDTH_MARGIN = 1.25  # Sample rate headroom over Carson's bandwidth for filter transition bands
+IQ_WIRE_BYTES = 4        # Bytes per IQ sample sent to the Pluto (two int16)
+CYCLIC_GAP_SECONDS = 0.25 # Unmodulated carrier between repeats of a cyclic beacon
+PLAYLIST_GAP_SECONDS = 1.0 # Unmodulated carrier between the messages of a playlist
+CHANNEL_SPACING = 100e3  # Default spacing of simultaneous FM channels around the center frequency
+# Scale signal amplitude for SDR DAC
+# PlutoSDR expects I/Q samples in the range [-2^15, 2^15-1].
+# pyadi-iio handles scaling, but it's good practice to provide
+# signals roughly in the range [-1, 1] scaled by 2**15.
+# We scale by 0.5 * 2**15 to leave some headroom.
+DAC_SCALE = 0.5 * (2**15)
 
-# --- Transmission Function ---
-def transmit_audio(audio_file, sdr_uri=SDR_URI, center_freq=CENTER_FREQ,
-                   sample_rate=SAMPLE_RATE, tx_gain=TX_GAIN,
-                   fm_deviation=FM_DEVIATION, audio_target_rate=AUDIO_TARGET_RATE,
-                   chunk_size=CHUNK_SIZE):
+# --- Audio Input ---
+def read_audio_file(audio_file):
     """
-    Reads an audio file, performs FM modulation, and transmits it using PlutoSDR.
+    Reads a WAV file from disk.
 
     Args:
         audio_file (str): Path to the input WAV file.
-        sdr_uri (str): URI of the PlutoSDR device.
-        center_freq (float): Center frequency for transmission in Hz.
-        sample_rate (float): Sample rate for the SDR in Hz.
-        tx_gain (int): Transmission gain in dB.
-        fm_deviation (float): FM frequency deviation in Hz.
-        audio_target_rate (float): Intermediate sample rate for audio before SDR resampling.
-        chunk_size (int): Number of samples per transmission chunk.
 
     Returns:
-        bool: True if transmission was successful (or finished), False otherwise.
+        tuple: (audio_data, sample_rate) with the raw samples as stored in the file,
+               or None if the file could not be read.
     """
-    print("--- FM Voice Transmission ---")
-    print(f"Audio file: {audio_file}")
-    print(f"Frequency: {center_freq / 1e6:.3f} MHz")
-    print(f"Sample Rate: {sample_rate / 1e3:.0f} kHz")
-    print(f"FM Deviation: {fm_deviation / 1e3:.1f} kHz")
-    print(f"TX Gain: {tx_gain} dB")
-    print(f"Sample Rate: {SAMPLE_RATE / 1e3:.0f} kHz")
-    print(f"FM Deviation: {FM_DEVIATION / 1e3:.1f} kHz")
-    print(f"TX Gain: {TX_GAIN} dB")
-    print("--------------------------")
-    print("WARNING: Ensure you comply with local radio regulations.")
-
-    # 1. Read Audio File
     try:
         fs_audio, audio_data = wavfile.read(audio_file)
         print(f"Read audio file: Sample rate {fs_audio} Hz, Duration {len(audio_data)/fs_audio:.2f}s")
     except FileNotFoundError:
         print(f"Error: Audio file '{audio_file}' not found.")
-        return False
+        return None
     except Exception as e:
         print(f"Error reading audio file: {e}")
-        return False
+        return None
+    return audio_data, fs_audio
+
+class WavStream:
+    """
+    A memory-mapped WAV file read as mono float32 blocks.
+
+    Slicing maps only the requested frames and converts just those, so the
+    memory used stays at one block however long the recording is. Integer
+    samples are scaled by their dtype's range like prepare_audio() does;
+    peak normalization is left to the modulator's pre-scan (see peak_amplitude).
+    """
+
+    def __init__(self, audio_file):
+        """
+        Args:
+            audio_file (str): Path to the WAV file. 24-bit PCM cannot be mapped
+                and raises ValueError; use read_audio_file() for it.
+        """
+        self.sample_rate, self._data = wavfile.read(audio_file, mmap=True)
+        if np.issubdtype(self._data.dtype, np.integer):
+            info = np.iinfo(self._data.dtype)
+            self._scale = float(max(abs(info.max), abs(info.min)))
+        else:
+            self._scale = 1.0
+        self.channels = 1 if self._data.ndim == 1 else self._data.shape[1]
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def duration(self):
+        return len(self._data) / self.sample_rate
+
+    def __getitem__(self, frames):
+        """Returns the frames of a slice as mono float32."""
+        block = self._data[frames]
+        if block.ndim > 1:
+            block = block.mean(axis=1, dtype=np.float32)
+        return block.astype(np.float32) / np.float32(self._scale)
+
+def open_wav_stream(audio_file):
+    """
+    Opens a WAV file for block-wise reading without loading it.
+
+    Args:
+        audio_file (str): Path to the input WAV file.
+
+    Returns:
+        WavStream: The mapped file, or None if it could not be mapped (e.g. missing
+                   or 24-bit; read_audio_file() can still load the latter).
+    """
+    try:
+        stream = WavStream(audio_file)
+    except FileNotFoundError:
+        print(f"Error: Audio file '{audio_file}' not found.")
+        return None
+    except Exception as e:
+        print(f"Note: Could not memory-map '{audio_file}' ({e})")
+        return None
+    print(f"Mapped audio file: Sample rate {stream.sample_rate} Hz, Duration {stream.duration:.2f}s"
+          + (f", {stream.channels} channels mixed to mono" if stream.channels > 1 else ""))
+    return stream
+
+def peak_amplitude(audio_data, block_size=BLOCK_SIZE * 16):
+    """
+    Returns the largest absolute sample value, scanning block by block.
+
+    Args:
+        audio_data (np.ndarray or WavStream): Mono samples.
+        block_size (int): Samples examined at a time, which bounds the temporary memory.
+
+    Returns:
+        float: The peak amplitude (0.0 for empty input).
+    """
+    peak = 0.0
+    for start in range(0, len(audio_data), block_size):
+        block = np.asarray(audio_data[start:start + block_size])
+        peak = max(peak, float(np.max(block)), -float(np.min(block)))
+    return peak
 
-    # 2. Preprocess Audio
+def prepare_audio(audio_data, normalize=True):
+    """
+    Converts audio samples to mono float32 in [-1.0, 1.0].
+
+    Float input that is already mono float32 (e.g. straight from TTS) only gets
+    peak-normalized; integer input is scaled by its dtype's range.
+
+    Args:
+        audio_data (np.ndarray): Audio samples, 1-D or (samples, channels).
+        normalize (bool): Peak-normalize float input. Pass False to keep its
+            level, e.g. so that consecutive segments keep the same loudness.
+
+    Returns:
+        np.ndarray: Mono float32 samples, or None if the dtype is unsupported.
+    """
+    audio_data = np.asarray(audio_data)
     # Convert to mono if stereo
     if audio_data.ndim > 1:
         print("Audio is stereo, converting to mono.")
@@ -92,11 +188,10 @@ def transmit_audio(audio_file, sdr_uri=SDR_URI, center_freq=CENTER_FREQ,
         audio_data = audio_data.astype(np.float32) / scale
     elif np.issubdtype(audio_data.dtype, np.floating):
          # Assume float is already in a reasonable range, but normalize just in case
-         max_abs_val = np.max(np.abs(audio_data))
+         audio_data = audio_data.astype(np.float32, copy=False)
+         max_abs_val = np.max(np.abs(audio_data)) if audio_data.size and normalize else 0
          if max_abs_val > 0:
-             audio_data = audio_data.astype(np.float32) / max_abs_val
-         else:
-             audio_data = audio_data.astype(np.float32) # Already zero
+             audio_data = audio_data / max_abs_val
     else:
         print(f"Warning: Unsupported audio data type {audio_data.dtype}. Attempting direct conversion to float.")
         # Attempt conversion, might fail or be inaccurate
@@ -108,168 +203,896 @@ def transmit_audio(audio_file, sdr_uri=SDR_URI, center_freq=CENTER_FREQ,
                  audio_data = audio_data / max_abs_val
         except (TypeError, ValueError) as e:
             print(f"Error: Could not convert audio data type {audio_data.dtype} to float: {e}")
-            return
+            return None
+    return audio_data
 
+# --- Sample Rate Selection ---
+def carson_bandwidth(fm_deviation, audio_bandwidth):
+    """Returns the occupied bandwidth of an FM signal in Hz by Carson's rule."""
+    return 2.0 * (fm_deviation + audio_bandwidth)
 
-    # Resample audio to the target rate for modulation
-    # Use integer up/down factors for resample_poly for better quality
-    gcd = math.gcd(int(audio_target_rate), int(fs_audio))
-    up = int(audio_target_rate) // gcd
-    down = int(fs_audio) // gcd
-    print(f"Resampling audio from {fs_audio} Hz to {audio_target_rate} Hz (up={up}, down={down})...")
-    try:
-        audio_resampled = resample_poly(audio_data, up, down)
-    except Exception as e:
-        print(f"Error during audio resampling: {e}")
-        return False
-    fs_resampled = audio_target_rate
-    print("Audio resampling complete.")
+def select_sample_rate(fm_deviation=FM_DEVIATION, audio_bandwidth=None,
+                       audio_target_rate=AUDIO_TARGET_RATE):
+    """
+    Picks the lowest SDR sample rate that carries the FM signal.
+
+    The rate must cover Carson's bandwidth with BANDWIDTH_MARGIN to spare and
+    be one the Pluto supports. Of those, the smallest integer multiple of
+    audio_target_rate is chosen, so the last resampling stage is a plain
+    integer interpolation. Rates below PLUTO_MIN_RATE_NO_FIR need the AD9361
+    TX FIR to interpolate: pyadi-iio's or ours (see fir_interpolation_for).
+
+    Args:
+        fm_deviation (float): FM frequency deviation in Hz.
+        audio_bandwidth (float): Highest audio frequency in Hz. Defaults to the
+            Nyquist frequency of audio_target_rate, the most the path can carry.
+        audio_target_rate (float): Intermediate audio/modulation rate in Hz.
+
+    Returns:
+        float: The selected sample rate in Hz.
+    """
+    if audio_bandwidth is None:
+        audio_bandwidth = audio_target_rate / 2
+    occupied = carson_bandwidth(fm_deviation, audio_bandwidth) * BANDWIDTH_MARGIN
+    needed = max(occupied, PLUTO_MIN_RATE, audio_target_rate)
+    return min(math.ceil(needed / audio_target_rate) * audio_target_rate, PLUTO_MAX_RATE)
+
+def print_rate_selection(sample_rate, fm_deviation=FM_DEVIATION, audio_bandwidth=None,
+                         audio_target_rate=AUDIO_TARGET_RATE, reference_rate=SAMPLE_RATE):
+    """
+    Prints the occupied bandwidth, the selected rate and the data rate saved.
+
+    Args:
+        sample_rate (float): The selected sample rate in Hz.
+        fm_deviation (float): FM frequency deviation in Hz.
+        audio_bandwidth (float): Highest audio frequency in Hz (see select_sample_rate).
+        audio_target_rate (float): Intermediate audio/modulation rate in Hz.
+        reference_rate (float): Rate the savings are reported against.
+    """
+    if audio_bandwidth is None:
+        audio_bandwidth = audio_target_rate / 2
+    occupied = carson_bandwidth(fm_deviation, audio_bandwidth)
+    print(f"Carson bandwidth: {occupied / 1e3:.1f} kHz "
+          f"({fm_deviation / 1e3:.1f} kHz deviation, {audio_bandwidth / 1e3:.1f} kHz audio)")
+    print(f"Selected sample rate: {sample_rate / 1e3:.0f} kHz "
+          f"({sample_rate / audio_target_rate:.0f}x {audio_target_rate / 1e3:.0f} kHz)"
+          + (", needs TX FIR interpolation" if sample_rate < PLUTO_MIN_RATE_NO_FIR else ""))
+    print(f"Data rate: {sample_rate / 1e6:.3f} MS/s ({sample_rate * IQ_WIRE_BYTES / 1e6:.2f} MB/s to the SDR) "
+          f"vs {reference_rate / 1e6:.3f} MS/s ({reference_rate * IQ_WIRE_BYTES / 1e6:.2f} MB/s), "
+          f"{reference_rate / sample_rate:.1f}x fewer samples to generate and send")
+
+def even_channel_offsets(num_channels, spacing=CHANNEL_SPACING):
+    """Returns num_channels frequency offsets in Hz, evenly spaced and centered on 0."""
+    return [(index - (num_channels - 1) / 2) * spacing for index in range(num_channels)]
+
+def check_channel_plan(offsets, sample_rate, fm_deviation=FM_DEVIATION, audio_bandwidth=None,
+                       audio_target_rate=AUDIO_TARGET_RATE):
+    """
+    Checks that FM channels at the given offsets fit the band without overlapping.
+
+    Args:
+        offsets (sequence): Channel frequency offsets from the center in Hz.
+        sample_rate (float): Host sample rate in Hz; channels must stay inside +/- half of it.
+        fm_deviation (float): FM frequency deviation in Hz.
+        audio_bandwidth (float): Highest audio frequency in Hz (see select_sample_rate).
+        audio_target_rate (float): Intermediate audio/modulation rate in Hz.
+
+    Raises:
+        ValueError: If a channel extends past the band edge or overlaps its neighbour.
+    """
+    if audio_bandwidth is None:
+        audio_bandwidth = audio_target_rate / 2
+    half_width = carson_bandwidth(fm_deviation, audio_bandwidth) / 2
+    edge = sample_rate / 2
+    ordered = sorted(offsets)
+    for offset in ordered:
+        if abs(offset) + half_width > edge:
+            raise ValueError(f"Channel at {offset / 1e3:+.1f} kHz needs +/-{half_width / 1e3:.1f} kHz and "
+                             f"does not fit within +/-{edge / 1e3:.1f} kHz at {sample_rate / 1e3:.0f} kHz")
+    for lower, upper in zip(ordered, ordered[1:]):
+        if upper - lower < 2 * half_width:
+            raise ValueError(f"Channels at {lower / 1e3:+.1f} and {upper / 1e3:+.1f} kHz overlap; "
+                             f"each occupies {2 * half_width / 1e3:.1f} kHz")
+
+# --- FM Modulation ---
+def fm_signal_blocks(audio_data, fs_audio, fm_deviation=FM_DEVIATION,
+                     audio_target_rate=AUDIO_TARGET_RATE, sample_rate=SAMPLE_RATE,
+                     modulator=None, block_size=BLOCK_SIZE, dtype=DSP_DTYPE, engine=FM_ENGINE,
+                     quality=DEFAULT_QUALITY, plan_cache_dir=DEFAULT_PLAN_CACHE_DIR, resamplers=None):
+    """
+    Resamples, FM modulates and resamples float audio to the SDR rate, block by block.
+
+    Both resampling stages keep their filter history between blocks, so the
+    output matches processing the whole message at once, while memory stays
+    bounded by the block size and the first block is ready almost immediately.
 
-    # Normalize again after resampling
-    max_abs_resampled = np.max(np.abs(audio_resampled))
-    if max_abs_resampled > 0:
-        audio_resampled = audio_resampled / max_abs_resampled * 0.95 # Keep headroom
+    The "two-stage" engine modulates at audio_target_rate and resamples the
+    complex FM signal to the SDR rate. The "direct" engine instead interpolates
+    the real audio to the SDR rate and modulates there, so the high-rate filter
+    runs on one real channel instead of two, and the FM sidebands are never
+    confined to the narrower intermediate band.
+
+    Args:
+        audio_data (np.ndarray or WavStream): Mono float samples in [-1.0, 1.0]
+            (see prepare_audio), or a mapped WAV file read a block at a time.
+        fs_audio (int): Sample rate of audio_data in Hz.
+        fm_deviation (float): FM frequency deviation in Hz.
+        audio_target_rate (float): Intermediate sample rate used for modulation.
+        sample_rate (float): Output (SDR) sample rate in Hz.
+        modulator (FMModulator): Modulator to continue from, so consecutive
+            messages join without a phase jump. A fresh one is used if None.
+            Its sample rate must be the rate the engine modulates at.
+        block_size (int): Number of input audio samples processed per block.
+        dtype: Real sample precision of the whole path (float32 by default; the
+            FM phase accumulator is always float64).
+        engine (str): "two-stage" or "direct" (see above).
+        quality (str): Resampling filter design, a key of fm_dsp.RESAMPLING_QUALITIES.
+        plan_cache_dir (str): Optional directory to persist resampling plans in.
+        resamplers (tuple): (audio resampler, SDR-rate resampler) to reuse instead
+            of creating them from the cached plans, e.g. from a TransmitPlan.
+            They are reset before use.
+
+    Yields:
+        np.ndarray: complex64 blocks (for float32) of the baseband signal scaled for the Pluto DAC.
+    """
+    if engine not in FM_ENGINES:
+        raise ValueError(f"Unknown FM engine '{engine}', expected one of {FM_ENGINES}")
+    # Resample audio to the target rate, then either the FM signal or the audio itself to the SDR rate
+    # Filters come from the plan cache; only the filter state is new for each message
+    if resamplers is None:
+        audio_plan = get_resampling_plan(fs_audio, audio_target_rate, quality, plan_cache_dir)
+        sdr_plan = get_resampling_plan(audio_target_rate, sample_rate, quality, plan_cache_dir)
+        audio_resampler = audio_plan.create_resampler(dtype)
+        sdr_resampler = sdr_plan.create_resampler(dtype)
+        print(f"Resampling audio {audio_plan.describe()}")
+        print(f"Resampling {'audio' if engine == 'direct' else 'FM signal'} {sdr_plan.describe()}")
     else:
-        audio_resampled = audio_resampled # Already zero
+        audio_resampler, sdr_resampler = resamplers # Reset before use
+    modulation_rate = sample_rate if engine == "direct" else audio_target_rate
+    if modulator is None:
+        modulator = FMModulator(fm_deviation, modulation_rate, dtype=dtype)
+    elif modulator.sample_rate != modulation_rate:
+        raise ValueError(f"Modulator runs at {modulator.sample_rate} Hz but the {engine} engine "
+                         f"modulates at {modulation_rate} Hz")
 
-    # 3. FM Modulation
-    print("Performing FM modulation...")
-    # Calculate sensitivity factor (radians per sample per unit of input)
-    sensitivity = 2.0 * np.pi * fm_deviation / fs_resampled
-    # Integrate audio signal for phase modulation
-    phase = sensitivity * np.cumsum(audio_resampled)
-    # Generate complex FM signal e^(j*phase)
-    fm_signal = np.exp(1j * phase).astype(np.complex64)
-    print("FM modulation complete.")
+    yield from modulated_blocks(_normalized_audio(audio_data, audio_resampler, block_size, dtype),
+                                 modulator, sdr_resampler, engine)
+
+def normalization_gain(audio_data):
+    """Returns the gain that peak-normalizes audio_data, with headroom."""
+    # Normalize from a pre-scan of the input peak; the clip before modulation
+    # catches the small overshoot the interpolation filter can add on top of it
+    max_abs_val = peak_amplitude(audio_data)
+    return 0.95 / max_abs_val if max_abs_val > 0 else 0.0 # Keep headroom
+
+def _normalized_audio(audio_data, audio_resampler, block_size=BLOCK_SIZE, dtype=DSP_DTYPE):
+    """Yields audio peak-normalized and resampled to the intermediate rate, ending with the filter tail."""
+    gain = normalization_gain(audio_data)
+    audio_resampler.reset()
+    for start in range(0, len(audio_data), block_size):
+        # Scaling before the (linear) filter makes a fresh copy the later stages can work in
+        yield audio_resampler.process(np.multiply(audio_data[start:start + block_size], gain, dtype=dtype))
+    yield audio_resampler.flush()
+
+def modulated_blocks(audio_blocks, modulator, sdr_resampler, engine):
+    """
+    FM modulates a stream of normalized audio and brings it to the SDR rate.
+
+    The modulator and the SDR-rate resampler run continuously over the whole
+    stream, so everything fed through one call, e.g. several messages with
+    silence between them, comes out as one phase-continuous signal.
+    """
+    def modulate(audio_block):
+        np.clip(audio_block, -1.0, 1.0, out=audio_block)
+        return modulator.process(audio_block)
+
+    def modulate_block(audio_resampled, last=False):
+        if engine == "direct":
+            audio_sdr = sdr_resampler.process(audio_resampled)
+            if last:
+                audio_sdr = np.concatenate((audio_sdr, sdr_resampler.flush()))
+            fm_signal_sdr = modulate(audio_sdr)
+        else:
+            fm_signal_sdr = sdr_resampler.process(modulate(audio_resampled))
+            if last:
+                fm_signal_sdr = np.concatenate((fm_signal_sdr, sdr_resampler.flush()))
+        fm_signal_sdr *= DAC_SCALE
+        return fm_signal_sdr
+
+    sdr_resampler.reset()
+    for audio_resampled in audio_blocks:
+        block = modulate_block(audio_resampled)
+        if len(block):
+            yield block
+    tail = modulate_block(np.zeros(0, dtype=sdr_resampler.dtype), last=True)
+    if len(tail):
+        yield tail
+
+def _aligned_channels(streams):
+    """
+    Regroups per-channel block streams into (channels, samples) blocks.
 
-    # 4. Resample FM signal to SDR sample rate
-    gcd_sdr = math.gcd(int(sample_rate), int(fs_resampled))
-    up_sdr = int(sample_rate) // gcd_sdr
-    down_sdr = int(fs_resampled) // gcd_sdr
-    print(f"Resampling FM signal from {fs_resampled} Hz to {sample_rate} Hz (up={up_sdr}, down={down_sdr})...")
+    Channels may produce blocks of different sizes; a channel that has
+    finished is padded with zeros until the longest one ends.
+    """
+    streams = [iter(stream) for stream in streams]
+    pending = [np.zeros(0, dtype=np.complex64) for _ in streams]
+    active = [True] * len(streams)
+    while True:
+        for index, stream in enumerate(streams):
+            while active[index] and not len(pending[index]):
+                try:
+                    pending[index] = next(stream)
+                except StopIteration:
+                    active[index] = False
+        available = [len(samples) for samples, running in zip(pending, active) if running]
+        length = min(available) if available else max(len(samples) for samples in pending)
+        if not length:
+            return
+        block = np.zeros((len(streams), length), dtype=np.result_type(*pending))
+        for index, samples in enumerate(pending):
+            count = min(length, len(samples))
+            block[index, :count] = samples[:count]
+            pending[index] = samples[count:]
+        yield block
+
+def modulate_fm(audio_data, fs_audio, fm_deviation=FM_DEVIATION,
+                audio_target_rate=AUDIO_TARGET_RATE, sample_rate=SAMPLE_RATE,
+                modulator=None, engine=FM_ENGINE):
+    """
+    Resamples float audio, FM modulates it and resamples the result to the SDR rate.
+
+    Args:
+        audio_data (np.ndarray): Mono float samples in [-1.0, 1.0] (see prepare_audio).
+        fs_audio (int): Sample rate of audio_data in Hz.
+        fm_deviation (float): FM frequency deviation in Hz.
+        audio_target_rate (float): Intermediate sample rate used for modulation.
+        sample_rate (float): Output (SDR) sample rate in Hz.
+        modulator (FMModulator): Modulator to continue from, so consecutive
+            messages join without a phase jump. A fresh one is used if None.
+        engine (str): "two-stage" or "direct" (see fm_signal_blocks).
+
+    Returns:
+        np.ndarray: The complex baseband signal scaled for the Pluto DAC,
+                    or None if modulation failed.
+    """
+    print("Performing FM modulation...")
     try:
-        fm_signal_sdr = resample_poly(fm_signal, up_sdr, down_sdr)
+        blocks = list(fm_signal_blocks(audio_data, fs_audio, fm_deviation,
+                                       audio_target_rate, sample_rate, modulator, engine=engine))
     except Exception as e:
-        print(f"Error during FM signal resampling: {e}")
-        return False
-    print("FM signal resampling complete.")
-
-    # Scale signal amplitude for SDR DAC
-    # PlutoSDR expects I/Q samples in the range [-2^15, 2^15-1].
-    # pyadi-iio handles scaling, but it's good practice to provide
-    # signals roughly in the range [-1, 1] scaled by 2**15.
-    # We scale by 0.5 * 2**15 to leave some headroom.
-    fm_signal_sdr *= 0.5 * (2**15)
-
-    # 5. Initialize and Configure SDR
-    sdr = None # Initialize sdr to None for cleanup check
-    transmission_successful = False
-    try:
-        print(f"Connecting to PlutoSDR at {sdr_uri}...")
-        sdr = adi.Pluto(uri=sdr_uri)
-        print("PlutoSDR connected.")
+        print(f"Error during FM modulation: {e}")
+        return None
+    print("FM modulation complete.")
+    return np.concatenate(blocks) if blocks else np.zeros(0, dtype=np.complex64)
+
+def build_beacon_loop(iq_samples, gap_samples):
+    """
+    Appends an unmodulated gap so a message can be looped without a phase jump.
+
+    Over the gap the carrier phase glides linearly from where the message ends
+    back to where it starts (and the amplitude likewise), so the device can
+    repeat the buffer end to start with no discontinuity to splatter.
+
+    Args:
+        iq_samples (np.ndarray): Complex samples of one message, scaled for the DAC.
+        gap_samples (int): Length of the gap in samples (0 loops the message as is).
+
+    Returns:
+        np.ndarray: One period of the loop.
+    """
+    if gap_samples <= 0 or not len(iq_samples):
+        return iq_samples
+    end, start = iq_samples[-1], iq_samples[0]
+    glide = np.angle(start / end) if end and start else 0.0 # Shortest way round
+    steps = np.arange(1, gap_samples + 1) / (gap_samples + 1)
+    amplitude = abs(end) + (abs(start) - abs(end)) * steps
+    gap = amplitude * np.exp(1j * (np.angle(end) + glide * steps))
+    return np.concatenate((iq_samples, gap.astype(iq_samples.dtype)))
+
+# --- Transmission Plan ---
+def load_audio(audio_file, audio_rate=None):
+    """
+    Gets mono float audio from a WAV file or a sample array.
+
+    Args:
+        audio_file (str or np.ndarray): Path to a WAV file, or the samples themselves.
+        audio_rate (int): Sample rate of audio_file when it is a sample array.
+
+    Returns:
+        tuple: (audio_data, sample_rate), where audio_data is a prepared array or,
+               for files, a WavStream read block by block; or None on error.
+    """
+    if isinstance(audio_file, np.ndarray):
+        if not audio_rate:
+            print("Error: audio_rate is required when passing audio samples.")
+            return None
+        audio_data = prepare_audio(audio_file)
+        return None if audio_data is None else (audio_data, int(audio_rate))
+    # Mapped and converted block by block as the modulator consumes it,
+    # falling back to loading files that cannot be mapped (24-bit PCM)
+    stream = open_wav_stream(audio_file)
+    if stream is not None:
+        return stream, stream.sample_rate
+    if not os.path.exists(audio_file):
+        return None
+    audio = read_audio_file(audio_file)
+    if audio is None:
+        return None
+    audio_data = prepare_audio(audio[0])
+    return None if audio_data is None else (audio_data, audio[1])
+
+class TransmitPlan:
+    """
+    Everything about an FM transmission that does not depend on the message.
+
+    Parameter validation, rate arithmetic, resampling filters, the modulator,
+    the TX buffer pool and the device configuration are set up once; each
+    transmit() then only prepares, modulates and sends its audio. The
+    modulator carries its phase from one message to the next. With an IQ
+    cache, a message that was sent before is streamed from disk instead of
+    being modulated again.
+
+    Usage:
+        with TransmitPlan.from_sdr_params(sdr_params) as plan:
+            plan.transmit(samples, rate)
+            plan.transmit(more_samples, rate)
+            plan.print_stats()
+    """
+
+    def __init__(self, sdr_uri=SDR_URI, center_freq=CENTER_FREQ, sample_rate=SAMPLE_RATE, tx_gain=TX_GAIN,
+                 fm_deviation=FM_DEVIATION, audio_target_rate=AUDIO_TARGET_RATE, chunk_size=CHUNK_SIZE,
+                 session=None, modulator=None, engine=FM_ENGINE, resampling_quality=DEFAULT_QUALITY,
+                 plan_cache_dir=DEFAULT_PLAN_CACHE_DIR, fir_interpolation=1, fir_config=None,
+                 iq_cache_dir=DEFAULT_IQ_CACHE_DIR, iq_cache_max_bytes=IQ_CACHE_MAX_BYTES,
+                 workers=DSP_WORKERS):
+        """
+        Args:
+            sdr_uri (str): URI of the PlutoSDR device.
+            center_freq (float): Center frequency for transmission in Hz.
+            sample_rate (float): Sample rate for the SDR in Hz, after any TX FIR interpolation.
+            tx_gain (int): Transmission gain in dB.
+            fm_deviation (float): FM frequency deviation in Hz.
+            audio_target_rate (float): Intermediate sample rate for audio before SDR resampling.
+            chunk_size (int): Number of samples per transmission chunk.
+            session (PlutoSession): Session to transmit on, left open by close().
+                A session of the plan's own is created if None.
+            modulator (FMModulator): Modulator to use; the exact cos/sin one if None.
+            engine (str): "two-stage" or "direct" (see fm_signal_blocks).
+            resampling_quality (str): Resampling filter design, a key of fm_dsp.RESAMPLING_QUALITIES.
+            plan_cache_dir (str): Optional directory to persist resampling plans in.
+            fir_interpolation (int): AD9361 TX FIR interpolation (1, 2 or 4).
+            fir_config (str): .ftr filter configuration; its INT factor overrides fir_interpolation.
+            iq_cache_dir (str): Directory to cache modulated IQ in (see iq_cache), or None.
+            iq_cache_max_bytes (int): Size cap of the IQ cache.
+            workers (int): DSP worker processes for long messages (see parallel_fm);
+                1 modulates serially, 0 uses every core.
+
+        Raises:
+            ValueError: If the parameters do not describe a valid transmission.
+        """
+        start = time.perf_counter()
+        if engine not in FM_ENGINES:
+            raise ValueError(f"Unknown FM engine '{engine}', expected one of {FM_ENGINES}")
+        if fir_config is not None:
+            fir_interpolation = read_fir_config(fir_config)['interpolation']
+        self.fm_deviation = fm_deviation
+        self.audio_target_rate = audio_target_rate
+        self.sample_rate = sample_rate
+        self.host_rate = sample_rate / fir_interpolation # The TX FIR does the last interpolation
+        self.engine = engine
+        self.quality = resampling_quality
+        self.plan_cache_dir = plan_cache_dir
+        self.chunk_size = chunk_size
+
+        modulation_rate = self.host_rate if engine == "direct" else audio_target_rate
+        if modulator is None:
+            modulator = FMModulator(fm_deviation, modulation_rate)
+        elif modulator.sample_rate != modulation_rate:
+            raise ValueError(f"Modulator runs at {modulator.sample_rate} Hz but the {engine} engine "
+                             f"modulates at {modulation_rate} Hz")
+        self.modulator = modulator
+        self.sdr_plan = get_resampling_plan(audio_target_rate, self.host_rate, resampling_quality, plan_cache_dir)
+        self.sdr_resampler = self.sdr_plan.create_resampler()
+        self._audio_resamplers = {} # Input audio rate -> resampler, created on first use
+        self.iq_cache = IQCache(iq_cache_dir, iq_cache_max_bytes) if iq_cache_dir else None
+        self.workers = workers
+        self._executor = None # Worker pool, started by the first long message
+
+        self.owns_session = session is None
+        if self.owns_session:
+            session = PlutoSession(sdr_uri, center_freq, self.host_rate, tx_gain,
+                                   fir_interpolation=fir_interpolation, fir_config=fir_config)
+        else:
+            session.configure(center_freq, self.host_rate, tx_gain, fir_interpolation, fir_config)
+        self.session = session
+        self.transmitter = ThreadedTransmitter(session, chunk_size)
+        self.stats = {'design_seconds': time.perf_counter() - start, 'open_seconds': 0.0, 'messages': 0,
+                      'airtime': 0.0, 'elapsed': 0.0, 'first_tx_delay': 0.0}
+
+        print(f"Transmit plan: {self.host_rate / 1e3:.1f} kHz host rate"
+              + (f" (TX FIR x{fir_interpolation} to {sample_rate / 1e3:.1f} kHz)" if fir_interpolation > 1 else "")
+              + f", {engine} engine, {resampling_quality} resampling")
+        print(f"Resampling {'audio' if engine == 'direct' else 'FM signal'} {self.sdr_plan.describe()}")
+
+    @classmethod
+    def from_sdr_params(cls, sdr_params, session=None, **options):
+        """Creates a plan from a main_workflow-style sdr_params dict; options go to the constructor."""
+        options.setdefault('fir_interpolation', sdr_params.get('fir_interpolation', 1))
+        return cls(sdr_params['uri'], sdr_params['freq'], sdr_params['rate'], sdr_params['gain'],
+                   sdr_params['deviation'], sdr_params['audio_rate'], sdr_params['chunk'], session=session,
+                   **options)
+
+    @property
+    def setup_seconds(self):
+        return self.stats['design_seconds'] + self.stats['open_seconds']
+
+    def open(self):
+        """
+        Connects and configures the device (done by the first transmit() otherwise).
+
+        Returns:
+            bool: True if the device is ready to transmit, False otherwise.
+        """
+        if self.session.is_open:
+            return True
+        start = time.perf_counter()
+        opened = self.session.open()
+        self.stats['open_seconds'] += time.perf_counter() - start
+        return opened
+
+    def resamplers(self, audio_rate):
+        """Returns the (audio, SDR-rate) resamplers for audio at audio_rate."""
+        if audio_rate not in self._audio_resamplers:
+            audio_plan = get_resampling_plan(audio_rate, self.audio_target_rate, self.quality, self.plan_cache_dir)
+            print(f"Resampling audio {audio_plan.describe()}")
+            self._audio_resamplers[audio_rate] = audio_plan.create_resampler()
+        return self._audio_resamplers[audio_rate], self.sdr_resampler
+
+    def signal_params(self, audio_rate):
+        """Returns every setting that shapes the modulated signal of audio at audio_rate."""
+        return {'audio_rate': audio_rate, 'fm_deviation': self.fm_deviation,
+                'audio_target_rate': self.audio_target_rate, 'host_rate': self.host_rate,
+                'engine': self.engine, 'quality': self.quality,
+                'modulator': type(self.modulator).__name__, 'dtype': str(self.modulator.dtype),
+                'table_size': getattr(self.modulator, 'table_size', None),
+                'fixed_point': getattr(self.modulator, 'fixed_point', None)}
+
+    def signal_blocks(self, audio_data, audio_rate):
+        """Streams the DAC-scaled baseband blocks of prepared audio (see fm_signal_blocks)."""
+        if self.iq_cache is not None:
+            params = self.signal_params(audio_rate)
+            key = content_key(audio_data, params)
+            entry = self.iq_cache.lookup(key)
+            if entry is not None:
+                print(f"IQ cache hit: streaming {len(entry[0])} samples from '{self.iq_cache.cache_dir}'")
+                return self.iq_cache.replay(entry, self.modulator)
+        if self.workers != 1 and len(audio_data) >= 2 * SEGMENT_SECONDS * audio_rate:
+            blocks = self.parallel_signal_blocks(audio_data, audio_rate)
+        else:
+            blocks = fm_signal_blocks(audio_data, audio_rate, self.fm_deviation, self.audio_target_rate,
+                                      self.host_rate, self.modulator, engine=self.engine,
+                                      resamplers=self.resamplers(audio_rate))
+        if self.iq_cache is not None:
+            blocks = self.iq_cache.record(key, blocks, self.host_rate, self.modulator, params)
+        return blocks
+
+    def parallel_signal_blocks(self, audio_data, audio_rate):
+        """
+        Streams the same blocks as fm_signal_blocks(), computed by the plan's worker pool.
+
+        The message is split into segments that are modulated on all workers
+        at once and stitched back phase-continuously (see parallel_fm).
+        """
+        if self._executor is None:
+            self._executor = create_executor(self.workers)
+        audio_plan = get_resampling_plan(audio_rate, self.audio_target_rate, self.quality, self.plan_cache_dir)
+        return parallel_fm_signal_blocks(audio_data, audio_rate, normalization_gain(audio_data), audio_plan,
+                                         self.sdr_plan, self.modulator, self.engine, DAC_SCALE,
+                                         self.workers, executor=self._executor)
+
+    def transmit(self, audio, audio_rate=None, repeat_count=None, repeat_seconds=None,
+                 repeat_gap=CYCLIC_GAP_SECONDS):
+        """
+        Modulates and transmits one message.
+
+        Args:
+            audio (str or np.ndarray): Path to a WAV file, or the audio samples.
+            audio_rate (int): Sample rate of audio when it is a sample array.
+            repeat_count (int): Transmit the message this many times from a cyclic
+                device buffer (see PlutoSession.transmit_cyclic) instead of streaming it once.
+            repeat_seconds (float): Repeat the message from a cyclic buffer for this long.
+            repeat_gap (float): Seconds of unmodulated carrier between repeats.
+
+        Returns:
+            bool: True if the message was transmitted, False otherwise.
+        """
+        start_time = time.perf_counter()
+        audio = load_audio(audio, audio_rate)
+        if audio is None or not self.open():
+            return False
+        return self._send(self.signal_blocks(*audio), start_time, 1, repeat_count, repeat_seconds, repeat_gap)
+
+    def playlist_blocks(self, messages, gap_seconds=PLAYLIST_GAP_SECONDS):
+        """
+        Streams several messages as one continuous, phase-continuous signal.
+
+        The messages are normalized one by one and joined by unmodulated
+        carrier, with one modulator and SDR-rate resampler running through
+        the whole stream, so the joins are as clean as the messages themselves.
 
-        # Configure SDR parameters
-        sdr.sample_rate = int(sample_rate)
-        sdr.tx_lo = int(center_freq)
-        sdr.tx_hardwaregain_chan0 = tx_gain
-        sdr.tx_cyclic_buffer = False # We'll send chunks manually
+        Args:
+            messages (list): (audio_data, audio_rate) pairs, e.g. from load_audio().
+            gap_seconds (float): Seconds of unmodulated carrier between messages.
 
-        # Ensure buffer is destroyed before potential use (might not exist)
+        Returns:
+            generator: DAC-scaled baseband blocks (see fm_signal_blocks).
+        """
+        gap = np.zeros(int(round(gap_seconds * self.audio_target_rate)), dtype=DSP_DTYPE)
+
+        def audio_blocks():
+            for index, (audio_data, audio_rate) in enumerate(messages):
+                if index and len(gap):
+                    yield gap # Silence holds the carrier phase steady
+                yield from _normalized_audio(audio_data, self.resamplers(audio_rate)[0])
+
+        return modulated_blocks(audio_blocks(), self.modulator, self.sdr_resampler, self.engine)
+
+    def transmit_playlist(self, sources, gap_seconds=PLAYLIST_GAP_SECONDS, repeat_count=None,
+                          repeat_seconds=None, repeat_gap=CYCLIC_GAP_SECONDS):
+        """
+        Transmits several messages back to back as one stream (see playlist_blocks).
+
+        Unlike one transmit() per message, the TX stream never stops between
+        messages, so the wall time is close to the total audio and gap duration.
+
+        Args:
+            sources (list): WAV file paths and/or (samples, sample_rate) tuples.
+            gap_seconds (float): Seconds of unmodulated carrier between messages.
+            repeat_count (int): Transmit the whole playlist this many times from a cyclic buffer.
+            repeat_seconds (float): Repeat the whole playlist from a cyclic buffer for this long.
+            repeat_gap (float): Seconds of unmodulated carrier between repeats.
+
+        Returns:
+            bool: True if the playlist was transmitted, False otherwise.
+        """
+        start_time = time.perf_counter()
+        messages = []
+        for source in sources: # Files are only mapped here, so every entry is checked before keying up
+            audio = load_audio(*source) if isinstance(source, tuple) else load_audio(source)
+            if audio is None:
+                print(f"Error: could not load playlist entry {len(messages) + 1}, nothing sent.")
+                return False
+            messages.append(audio)
+        duration = sum(len(audio_data) / audio_rate for audio_data, audio_rate in messages)
+        print(f"Playlist: {len(messages)} messages, {duration:.2f}s of audio "
+              f"+ {gap_seconds * max(len(messages) - 1, 0):.2f}s of gaps")
+        if not messages or not self.open():
+            return False
+        return self._send(self.playlist_blocks(messages, gap_seconds), start_time, len(messages),
+                          repeat_count, repeat_seconds, repeat_gap)
+
+    def multichannel_blocks(self, messages, offsets, gains=None):
+        """
+        Streams several messages at once, each on its own frequency offset.
+
+        Every message gets its own modulator and resamplers; the resulting FM
+        channels are shifted by vectorized complex oscillators and summed
+        (see fm_dsp.ChannelMixer). By default each channel gets 1/N of the
+        DAC amplitude, so the sum can never clip.
+
+        Args:
+            messages (list): (audio_data, audio_rate) pairs, e.g. from load_audio().
+            offsets (sequence): Frequency offset of each channel in Hz.
+            gains (sequence): Relative channel amplitudes. They are scaled down
+                if needed so they sum to at most 1, keeping the peak in range.
+
+        Returns:
+            generator: DAC-scaled baseband blocks of the combined signal.
+
+        Raises:
+            ValueError: If the offsets do not match the messages or the channels
+                do not fit the band (see check_channel_plan).
+        """
+        if len(offsets) != len(messages):
+            raise ValueError(f"Got {len(offsets)} channel offsets for {len(messages)} messages")
+        check_channel_plan(offsets, self.host_rate, self.fm_deviation, audio_target_rate=self.audio_target_rate)
+        if gains is not None:
+            gains = np.abs(np.asarray(gains, dtype=np.float64))
+            gains /= max(1.0, gains.sum()) # Worst-case peak of the sum is the sum of the gains
+        mixer = ChannelMixer(offsets, self.host_rate, gains)
+        streams = []
+        for audio_data, audio_rate in messages:
+            modulator = copy.deepcopy(self.modulator) # Same kind of modulator, with its own phase
+            modulator.reset()
+            audio_plan = get_resampling_plan(audio_rate, self.audio_target_rate, self.quality, self.plan_cache_dir)
+            streams.append(modulated_blocks(_normalized_audio(audio_data, audio_plan.create_resampler()),
+                                             modulator, self.sdr_plan.create_resampler(), self.engine))
+        print(f"Multiplexing {len(messages)} FM channels at "
+              + ", ".join(f"{offset / 1e3:+.1f}" for offset in offsets)
+              + f" kHz, each at {20 * np.log10(1.0 / mixer.gains.max()):.1f} dB below a single channel")
+        return (mixer.process(block) for block in _aligned_channels(streams))
+
+    def transmit_multichannel(self, sources, offsets=None, gains=None, repeat_count=None,
+                              repeat_seconds=None, repeat_gap=CYCLIC_GAP_SECONDS):
+        """
+        Transmits several messages simultaneously on separate frequencies (see multichannel_blocks).
+
+        Args:
+            sources (list): WAV file paths and/or (samples, sample_rate) tuples.
+            offsets (sequence): Frequency offset of each channel in Hz; evenly
+                spaced by CHANNEL_SPACING around the center frequency if None.
+            gains (sequence): Relative channel amplitudes, or None for equal ones.
+            repeat_count (int): Transmit the combined signal this many times from a cyclic buffer.
+            repeat_seconds (float): Repeat the combined signal from a cyclic buffer for this long.
+            repeat_gap (float): Seconds of carrier between repeats.
+
+        Returns:
+            bool: True if the channels were transmitted, False otherwise.
+        """
+        start_time = time.perf_counter()
+        messages = []
+        for source in sources:
+            audio = load_audio(*source) if isinstance(source, tuple) else load_audio(source)
+            if audio is None:
+                print(f"Error: could not load channel {len(messages) + 1}, nothing sent.")
+                return False
+            messages.append(audio)
+        if not messages:
+            print("Error: no channels to transmit.")
+            return False
+        if offsets is None:
+            offsets = even_channel_offsets(len(messages))
         try:
-             sdr.tx_destroy_buffer()
-        except Exception as buf_e:
-             print(f"Note: Could not destroy buffer (may not exist yet): {buf_e}")
+            fm_blocks = self.multichannel_blocks(messages, offsets, gains)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return False
+        if not self.open():
+            return False
+        return self._send(fm_blocks, start_time, len(messages), repeat_count, repeat_seconds, repeat_gap)
 
+    def _send(self, fm_blocks, start_time, messages, repeat_count, repeat_seconds, repeat_gap):
+        """Streams modulated blocks, or loops them from a cyclic buffer when repeats are asked for."""
+        transmission_successful = False
+        try:
+            if repeat_count is not None or repeat_seconds is not None:
+                # A short beacon is modulated once and looped by the device
+                loop = build_beacon_loop(np.concatenate(list(fm_blocks)), int(repeat_gap * self.host_rate))
+                transmission_successful = self.session.transmit_cyclic(loop, repeat_count, repeat_seconds,
+                                                                       self.chunk_size)
+                if transmission_successful:
+                    print(f"Repeats finished in {time.perf_counter() - start_time:.2f} seconds.")
+                return transmission_successful
+            # DSP runs ahead in a producer thread; a dedicated thread feeds the SDR
+            print(f"Starting threaded transmission (chunk size {self.chunk_size} samples, "
+                  f"ring of {self.transmitter.ring_size})...")
+            transmission_successful = self.transmitter.transmit(fm_blocks)
+            self.transmitter.print_stats()
+            if transmission_successful:
+                elapsed = time.perf_counter() - start_time
+                airtime = self.transmitter.stats['buffers'] * self.chunk_size / self.host_rate
+                self.stats['messages'] += messages
+                self.stats['elapsed'] += elapsed
+                self.stats['airtime'] += airtime
+                self.stats['first_tx_delay'] += self.transmitter.stats['first_tx_delay'] or 0.0
+                print(f"Transmission finished in {elapsed:.2f} seconds ({airtime:.2f}s of airtime).")
+        except Exception as e:
+            print(f"Error during transmission loop: {e}")
+            transmission_successful = False # Mark as failed
+        return transmission_successful
 
-        print("SDR configured:")
-        print(f"  TX LO Freq: {sdr.tx_lo / 1e6:.3f} MHz")
-        print(f"  Sample Rate: {sdr.sample_rate / 1e3:.0f} kHz")
-        print(f"  TX Gain: {sdr.tx_hardwaregain_chan0} dB")
+    def print_stats(self):
+        """Prints the one-off setup cost next to the average cost of a message."""
+        print(f"Plan setup: {self.setup_seconds * 1e3:.1f} ms once "
+              f"({self.stats['design_seconds'] * 1e3:.1f} ms rates/filters/buffers, "
+              f"{self.stats['open_seconds'] * 1e3:.1f} ms device connect and configuration)")
+        messages = self.stats['messages']
+        if messages:
+            print(f"Per message ({messages} sent): {self.stats['first_tx_delay'] / messages * 1e3:.1f} ms to first "
+                  f"buffer, {self.stats['elapsed'] / messages:.2f}s for "
+                  f"{self.stats['airtime'] / messages:.2f}s of airtime")
 
-    except Exception as e:
-        print(f"Error initializing SDR: {e}")
-        print("Ensure the PlutoSDR is connected and accessible via USB.")
-        print("Verify the IP address if using network mode.")
-        print("Check if libiio and pyadi-iio drivers/libraries are correctly installed.")
-        if sdr: del sdr # Attempt cleanup if object exists partially
-        return False # Indicate failure
-
-    # 6. Transmit Data
-    total_samples = len(fm_signal_sdr)
-    num_chunks = math.ceil(total_samples / chunk_size)
-    print(f"Starting transmission of {total_samples} samples in {num_chunks} chunks...")
-    print(f"Chunk size: {chunk_size} samples")
+    def close(self):
+        """Stops the DSP workers and releases the device if the plan opened its own session."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        if self.owns_session:
+            self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+# --- Transmission Function ---
+def transmit_audio(audio_file, sdr_uri=SDR_URI, center_freq=CENTER_FREQ,
+                   sample_rate=SAMPLE_RATE, tx_gain=TX_GAIN,
+                   fm_deviation=FM_DEVIATION, audio_target_rate=AUDIO_TARGET_RATE,
+                   chunk_size=CHUNK_SIZE, audio_rate=None, session=None, modulator=None,
+                   engine=FM_ENGINE, resampling_quality=DEFAULT_QUALITY,
+                   plan_cache_dir=DEFAULT_PLAN_CACHE_DIR, fir_interpolation=1, fir_config=None,
+                   repeat_count=None, repeat_seconds=None, repeat_gap=CYCLIC_GAP_SECONDS,
+                   iq_cache_dir=DEFAULT_IQ_CACHE_DIR, iq_cache_max_bytes=IQ_CACHE_MAX_BYTES,
+                   playlist_gap=PLAYLIST_GAP_SECONDS, channel_offsets=None, workers=DSP_WORKERS):
+    """
+    Performs FM modulation of an audio file or sample array and transmits it using PlutoSDR.
+
+    Builds a one-off TransmitPlan; to send many messages with the same
+    parameters, build the plan once and call its transmit() instead.
+
+    Args:
+        audio_file (str or np.ndarray): Path to the input WAV file, or the audio
+            samples themselves (requires audio_rate). Passing samples skips the
+            disk round trip entirely. A file is memory-mapped and read a block
+            at a time, so its length does not affect memory use. A list of
+            paths and/or (samples, sample_rate) tuples is sent as one continuous
+            playlist (see TransmitPlan.transmit_playlist), or with channel_offsets
+            as simultaneous channels (see TransmitPlan.transmit_multichannel).
+        sdr_uri (str): URI of the PlutoSDR device.
+        center_freq (float): Center frequency for transmission in Hz.
+        sample_rate (float): Sample rate for the SDR in Hz. With TX FIR interpolation
+            this is the rate after the FIR; the host generates sample_rate / fir_interpolation.
+        tx_gain (int): Transmission gain in dB.
+        fm_deviation (float): FM frequency deviation in Hz.
+        audio_target_rate (float): Intermediate sample rate for audio before SDR resampling.
+        chunk_size (int): Number of samples per transmission chunk.
+        audio_rate (int): Sample rate of audio_file when it is a sample array.
+        session (PlutoSession): Open SDR session to transmit on. When given, the
+            connection is reused and left open; otherwise a temporary one is created.
+        modulator (FMModulator): Modulator to use, e.g. an NCOModulator from
+            fm_dsp.create_modulator(). Defaults to the exact cos/sin modulator.
+        engine (str): "two-stage" or "direct" (see fm_signal_blocks).
+        resampling_quality (str): Resampling filter design, a key of fm_dsp.RESAMPLING_QUALITIES.
+        plan_cache_dir (str): Optional directory to persist resampling plans in.
+        fir_interpolation (int): Let the AD9361 TX FIR do the last interpolation by
+            2 or 4 instead of the host (1 disables it).
+        fir_config (str): .ftr filter configuration for the TX FIR. Its INT factor
+            overrides fir_interpolation; a default design is generated if None.
+        repeat_count (int): Transmit the message this many times from a cyclic
+            device buffer (see PlutoSession.transmit_cyclic) instead of streaming it once.
+        repeat_seconds (float): Repeat the message from a cyclic buffer for this long.
+        repeat_gap (float): Seconds of unmodulated carrier between repeats.
+        iq_cache_dir (str): Directory to cache modulated IQ in, so resending the
+            same audio with the same settings skips the DSP (see iq_cache).
+        iq_cache_max_bytes (int): Size cap of the IQ cache.
+        playlist_gap (float): Seconds of unmodulated carrier between playlist messages.
+        channel_offsets (list): Frequency offsets in Hz, one per entry of an audio_file
+            list, to send the entries at the same time instead of one after another.
+        workers (int): DSP worker processes; messages longer than two segments are
+            split across them (see parallel_fm). 1 modulates serially, 0 uses every core.
 
+    Returns:
+        bool: True if transmission was successful (or finished), False otherwise.
+    """
+    print("--- FM Voice Transmission ---")
+    if isinstance(audio_file, np.ndarray):
+        print(f"Audio: {len(audio_file)} in-memory samples at {audio_rate} Hz")
+    elif isinstance(audio_file, list) and channel_offsets is not None:
+        print(f"Channels: {len(audio_file)} messages sent simultaneously")
+    elif isinstance(audio_file, list):
+        print(f"Playlist: {len(audio_file)} messages, {playlist_gap:g}s apart")
+    else:
+        print(f"Audio file: {audio_file}")
+    print(f"Frequency: {center_freq / 1e6:.3f} MHz")
+    print(f"Sample Rate: {sample_rate / 1e3:.0f} kHz")
+    print(f"FM Deviation: {fm_deviation / 1e3:.1f} kHz")
+    print(f"TX Gain: {tx_gain} dB")
+    print(f"Sample Rate: {SAMPLE_RATE / 1e3:.0f} kHz")
+    print(f"FM Deviation: {FM_DEVIATION / 1e3:.1f} kHz")
+    print(f"TX Gain: {TX_GAIN} dB")
+    print("--------------------------")
+    print("WARNING: Ensure you comply with local radio regulations.")
+
+    # 1. Validate parameters, design filters and prepare the SDR configuration
     try:
-        # Enable TX channel 0
-        sdr.tx_enabled_channels = [0]
-
-        start_time = time.time()
-        for i in range(num_chunks):
-            start_idx = i * chunk_size
-            end_idx = min((i + 1) * chunk_size, total_samples)
-            chunk = fm_signal_sdr[start_idx:end_idx]
-
-            # The pyadi library usually handles padding the last chunk if needed,
-            # but ensure chunk_size is adequate (e.g., > 1024 and multiple of 4).
-            if len(chunk) == 0:
-                print("Warning: Generated empty chunk, skipping.")
-                continue
-
-            try:
-                sdr.tx(chunk)
-                # Optional: Add a small sleep if experiencing buffer issues/underruns
-                # time.sleep(0.001)
-            except Exception as tx_e:
-                print(f"Error sending chunk {i+1}/{num_chunks}: {tx_e}")
-                # Decide whether to break or continue
-                break # Stop transmission on error
-
-            if (i + 1) % 10 == 0 or i == num_chunks - 1: # Print progress periodically
-                 print(f"  Sent chunk {i+1}/{num_chunks} ({len(chunk)} samples)")
-
-
-        # Wait a short moment to ensure the last buffer is transmitted
-        time.sleep(0.5)
-        end_time = time.time()
-        print(f"Transmission finished in {end_time - start_time:.2f} seconds.")
-        transmission_successful = True # Mark as finished
+        plan = TransmitPlan(sdr_uri, center_freq, sample_rate, tx_gain, fm_deviation, audio_target_rate,
+                            chunk_size, session=session, modulator=modulator, engine=engine,
+                            resampling_quality=resampling_quality, plan_cache_dir=plan_cache_dir,
+                            fir_interpolation=fir_interpolation, fir_config=fir_config,
+                            iq_cache_dir=iq_cache_dir, iq_cache_max_bytes=iq_cache_max_bytes, workers=workers)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return False
 
-    except Exception as e:
-        print(f"Error during transmission loop: {e}")
-        transmission_successful = False # Mark as failed
+    # 2. Read, modulate and transmit (a caller-provided session stays open for the next message)
+    try:
+        if isinstance(audio_file, list) and channel_offsets is not None:
+            return plan.transmit_multichannel(audio_file, channel_offsets, repeat_count=repeat_count,
+                                              repeat_seconds=repeat_seconds, repeat_gap=repeat_gap)
+        if isinstance(audio_file, list):
+            return plan.transmit_playlist(audio_file, playlist_gap, repeat_count, repeat_seconds, repeat_gap)
+        return plan.transmit(audio_file, audio_rate, repeat_count, repeat_seconds, repeat_gap)
     finally:
-        # 7. Cleanup
-        if sdr:
-            print("Cleaning up SDR resources...")
-            try:
-                # Disable TX first
-                sdr.tx_enabled_channels = []
-                print("TX disabled.")
-                # Destroy buffer
-                sdr.tx_destroy_buffer()
-                print("TX buffer destroyed.")
-            except Exception as cleanup_e:
-                print(f"Error during SDR cleanup: {cleanup_e}")
-            finally:
-                 del sdr # Release SDR object
-                 print("SDR object released.")
-        else:
-            print("SDR not initialized, no cleanup needed.")
-        return transmission_successful # Return status
+        plan.close()
 
 # --- Main Execution Logic (when run as script) ---
 def main():
     """Parses arguments and runs the transmission when script is executed directly."""
-    # Basic execution using defaults defined at the top of the file
-    # More complex argparse could be added here if needed for direct execution flexibility
+    parser = argparse.ArgumentParser(description="Transmit a WAV file as FM using a PlutoSDR or a stand-in backend.")
+    parser.add_argument("audio_files", nargs='*', default=[AUDIO_FILE],
+                        help=f"WAV file(s) to transmit; several are sent as one continuous playlist "
+                             f"(default: '{AUDIO_FILE}')")
+    parser.add_argument("--gap", type=float, default=PLAYLIST_GAP_SECONDS,
+                        help=f"Seconds of carrier between playlist messages (default: {PLAYLIST_GAP_SECONDS:g})")
+    parser.add_argument("--multichannel", action="store_true",
+                        help="Send the WAV files simultaneously, each on its own frequency offset")
+    parser.add_argument("--channel-offsets", type=float, nargs="+", default=None, metavar="HZ",
+                        help="Offset of each channel from the center frequency in Hz (implies --multichannel)")
+    parser.add_argument("--channel-spacing", type=float, default=CHANNEL_SPACING,
+                        help=f"Spacing of evenly placed channels in Hz (default: {CHANNEL_SPACING:.0f})")
+    parser.add_argument("--sample-rate", type=float, default=SAMPLE_RATE,
+                        help=f"SDR sample rate in Hz (default: {SAMPLE_RATE:.0f})")
+    parser.add_argument("--auto-rate", action="store_true",
+                        help="Use the lowest sample rate that fits the FM signal (Carson's rule)")
+    parser.add_argument("--allow-fir", action="store_true",
+                        help=f"With --auto-rate, interpolate rates below {PLUTO_MIN_RATE_NO_FIR / 1e6:.2f} MHz "
+                             "with our own AD9361 TX FIR instead of pyadi-iio's")
+    parser.add_argument("--fir-interpolation", type=int, choices=FIR_INTERPOLATIONS, default=1,
+                        help="Let the AD9361 TX FIR interpolate by 2 or 4 instead of the host "
+                             "(default: 1, chosen automatically with --auto-rate --allow-fir)")
+    parser.add_argument("--fir-config", default=None,
+                        help="TX FIR configuration (.ftr) to load; its INT factor sets the interpolation")
+    parser.add_argument("--sdr-uri", default=SDR_URI,
+                        help=f"Device URI (default: {SDR_URI}); also accepts sim:, null:, "
+                             "file:<path.cfile> and sigmf:<basename>")
+    parser.add_argument("--modulator", choices=MODULATOR_MODES, default="exact",
+                        help="FM modulator: exact cos/sin, or an NCO lookup table with a float "
+                             "('lut') or fixed-point ('fixed') phase accumulator (default: exact)")
+    parser.add_argument("--lut-size", type=int, default=LUT_SIZE,
+                        help=f"NCO lookup table size, a power of two (default: {LUT_SIZE})")
+    parser.add_argument("--engine", choices=FM_ENGINES, default=FM_ENGINE,
+                        help="Modulate at the intermediate audio rate and resample the FM signal "
+                             "('two-stage'), or interpolate the audio and modulate at the SDR rate "
+                             f"('direct') (default: {FM_ENGINE})")
+    parser.add_argument("--resampling-quality", choices=list(RESAMPLING_QUALITIES), default=DEFAULT_QUALITY,
+                        help=f"Resampling filter design (default: {DEFAULT_QUALITY})")
+    parser.add_argument("--plan-cache", default=DEFAULT_PLAN_CACHE_DIR,
+                        help="Directory to persist resampling filter plans in (default: memory only)")
+    parser.add_argument("--repeat", type=int, default=None, metavar="N",
+                        help="Transmit the message N times from a cyclic device buffer (a beacon)")
+    parser.add_argument("--repeat-seconds", type=float, default=None, metavar="S",
+                        help="Repeat the message from a cyclic device buffer for S seconds")
+    parser.add_argument("--repeat-gap", type=float, default=CYCLIC_GAP_SECONDS,
+                        help=f"Seconds of carrier between repeats (default: {CYCLIC_GAP_SECONDS})")
+    parser.add_argument("--iq-cache", default=DEFAULT_IQ_CACHE_DIR,
+                        help="Directory to cache modulated IQ in; resending the same audio streams it from disk")
+    parser.add_argument("--iq-cache-size", type=float, default=IQ_CACHE_MAX_BYTES / 2**20,
+                        help=f"IQ cache size cap in MB (default: {IQ_CACHE_MAX_BYTES / 2**20:.0f})")
+    parser.add_argument("--workers", type=int, default=DSP_WORKERS,
+                        help="DSP worker processes for long messages; 0 uses every core (default: serial)")
+    args = parser.parse_args()
+
     print("--- Running FM Transmitter Script ---")
-    if transmit_audio(AUDIO_FILE):
+    sample_rate = args.sample_rate
+    fir_interpolation = read_fir_config(args.fir_config)['interpolation'] if args.fir_config else args.fir_interpolation
+    if args.auto_rate:
+        host_rate = select_sample_rate(FM_DEVIATION)
+        print_rate_selection(host_rate, reference_rate=args.sample_rate)
+        if args.allow_fir and host_rate < PLUTO_MIN_RATE_NO_FIR:
+            fir_interpolation = max(fir_interpolation, fir_interpolation_for(host_rate))
+        sample_rate = host_rate * fir_interpolation
+    modulation_rate = sample_rate / fir_interpolation if args.engine == "direct" else AUDIO_TARGET_RATE
+    modulator = create_modulator(args.modulator, FM_DEVIATION, modulation_rate, table_size=args.lut_size)
+    audio = args.audio_files[0] if len(args.audio_files) == 1 else list(args.audio_files)
+    offsets = args.channel_offsets
+    if args.multichannel and offsets is None:
+        offsets = even_channel_offsets(len(args.audio_files), args.channel_spacing)
+    if offsets is not None:
+        audio = list(args.audio_files)
+    if transmit_audio(audio, sdr_uri=args.sdr_uri, sample_rate=sample_rate,
+                      modulator=modulator, engine=args.engine,
+                      resampling_quality=args.resampling_quality, plan_cache_dir=args.plan_cache,
+                      fir_interpolation=fir_interpolation, fir_config=args.fir_config,
+                      repeat_count=args.repeat, repeat_seconds=args.repeat_seconds, repeat_gap=args.repeat_gap,
+                      iq_cache_dir=args.iq_cache, iq_cache_max_bytes=int(args.iq_cache_size * 2**20),
+                      playlist_gap=args.gap, channel_offsets=offsets, workers=args.workers):
          print("Script finished successfully.")
     else:
          print("Script finished with errors.")
-         import sys
          sys.exit(1)
 
 
@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Pluggable transmit backends.
+
+Every backend exposes the parts of adi.Pluto that the transmit path uses
+(configuration attributes, tx() and tx_destroy_buffer()), so the same code
+can drive real hardware, write IQ files or run with no device at all.
+tx_interleaved() sends buffers that are already in the device's int16 format.
+open_backend() picks one from the device URI:
+
+    ip:192.168.2.1, usb:...   real PlutoSDR (pyadi-iio)
+    sim:                      SimulatedPluto, paced in real time
+    null:                     NullSink, discards samples as fast as they come
+    file:out.cfile            FileSink, raw complex64 (GNU Radio .cfile)
+    sigmf:out                 FileSink writing out.sigmf-data + out.sigmf-meta
+"""
+
+import json
+import threading
+import time
+
+import numpy as np
+
+from pluto_fir import PLUTO_MIN_RATE, PLUTO_MIN_RATE_NO_FIR, PLUTO_MAX_RATE, read_fir_config
+
+try:
+    import adi
+except ImportError: # Only needed for real hardware
+    adi = None
+
+KERNEL_BUFFERS = 4 # Buffers the Pluto driver queues before tx() blocks (pyadi default)
+MAX_BUFFER_SAMPLES = 2**22 # Largest single TX buffer (16 MB of int16 I/Q) to ask the Pluto to allocate
+DAC_FULL_SCALE = 2**15 # IQ samples handed to tx() are scaled to the Pluto DAC range
+
+def open_backend(uri):
+    """
+    Creates the transmit backend for a device URI.
+
+    Args:
+        uri (str): Device URI; see the module docstring for the supported schemes.
+
+    Returns:
+        A backend object with the adi.Pluto transmit interface.
+    """
+    scheme, _, target = uri.partition(":")
+    if scheme == "sim":
+        return SimulatedPluto(uri)
+    if scheme == "null":
+        return NullSink(uri)
+    if scheme == "file":
+        return FileSink(target or "tx_output.cfile")
+    if scheme == "sigmf":
+        return FileSink(target or "tx_output", sigmf=True)
+    if adi is None:
+        raise RuntimeError("pyadi-iio is not installed; use a sim:, null:, file: or sigmf: URI instead")
+    return adi.Pluto(uri=uri)
+
+def to_interleaved_int16(samples, out=None):
+    """
+    Rounds complex samples to interleaved int16 I/Q, saturating at the DAC range.
+
+    A plain float-to-int16 assignment truncates toward zero, which biases the
+    quantization error, and wraps values past full scale around to the
+    opposite sign.
+
+    Args:
+        samples (np.ndarray): Complex samples scaled to the DAC range.
+        out (np.ndarray): int16 array of 2 * len(samples) values to write into.
+
+    Returns:
+        np.ndarray: out, or a new array, holding [I0, Q0, I1, Q1, ...].
+    """
+    if out is None:
+        out = np.empty(2 * len(samples), dtype=np.int16)
+    pairs = out.reshape(-1, 2)
+    limits = np.iinfo(np.int16)
+    pairs[:, 0] = np.clip(np.rint(samples.real), limits.min, limits.max)
+    pairs[:, 1] = np.clip(np.rint(samples.imag), limits.min, limits.max)
+    return out
+
+def tx_interleaved(sdr, iq):
+    """
+    Sends one buffer of interleaved int16 I/Q without converting it again.
+
+    pyadi-iio's tx() takes complex samples and on every call splits them into
+    a new interleaved int16 array, then copies that into a bytearray for
+    libiio. A buffer that is already interleaved int16 is written to the
+    libiio buffer directly instead. libiio's Buffer.write() sizes the copy by
+    len() of what it is given, so it gets a byte view of the samples.
+
+    Args:
+        sdr: A TxBackend or adi.Pluto.
+        iq (np.ndarray): Contiguous int16 samples [I0, Q0, I1, Q1, ...]. Complex
+            samples are rounded and saturated with to_interleaved_int16() first.
+
+    Raises:
+        RuntimeError: libiio accepted fewer bytes than the buffer holds.
+    """
+    if np.iscomplexobj(iq):
+        iq = to_interleaved_int16(iq)
+    iq = np.ascontiguousarray(iq, dtype=np.int16)
+    if isinstance(sdr, TxBackend):
+        sdr.tx_interleaved(iq)
+        return
+    txbuf = getattr(sdr, '_tx__txbuf', False) # pyadi-iio's private libiio buffer
+    if txbuf is False:
+        # Not a pyadi-iio layout we know; let tx() convert
+        sdr.tx(iq[0::2] + 1j * iq[1::2])
+        return
+    if txbuf is None:
+        # First buffer since tx_destroy_buffer(): create it the way tx() would
+        sdr.disable_dds()
+        sdr._tx_buffer_size = len(iq) // 2
+        sdr._tx_init_channels()
+        txbuf = sdr._tx__txbuf
+    written = txbuf.write(iq.view(np.uint8))
+    if written != iq.nbytes:
+        raise RuntimeError(f"libiio took {written} of {iq.nbytes} bytes of the TX buffer")
+    txbuf.push()
+
+class TxBackend:
+    """
+    Base class for non-hardware backends.
+
+    Holds the configuration attributes PlutoSession writes and counts what
+    passes through tx(). Like the AD9361, it refuses to transmit at a sample
+    rate the device could not run at with the TX FIR configuration that is
+    loaded and enabled. Its sample_rate setter behaves like pyadi-iio's, and
+    _set_iio_attr() writes the AD9361 attributes underneath it directly. With
+    tx_cyclic_buffer set, tx() uploads one buffer that the "device" repeats
+    until tx_destroy_buffer(). Subclasses override _send() and
+    _cyclic_played() and, if they hold resources, close().
+    """
+
+    realtime = False # True if tx() is paced by a (simulated) DAC clock
+
+    def __init__(self, uri):
+        self.uri = uri
+        self.tx_lo = 0
+        self.tx_hardwaregain_chan0 = 0
+        self.tx_cyclic_buffer = False
+        self.tx_enabled_channels = [0]
+        self.fir_config = None
+        self._filter = None
+        self._fir_enabled = False # AD9361 filter_fir_en
+        self.sample_rate = 1000000
+        self.max_buffer_samples = MAX_BUFFER_SAMPLES
+        self.stats = {'buffers': 0, 'samples': 0, 'cyclic_repeats': 0.0}
+        self._first_tx = None
+        self._cyclic = None # (data, num_samples, upload time) of the looping buffer
+
+    @property
+    def sample_rate(self):
+        """Baseband (host) sample rate in Hz."""
+        return self._sample_rate
+
+    @sample_rate.setter
+    def sample_rate(self, rate):
+        # As pyadi-iio: nothing below 521 kHz, and the FIR is replaced by its own
+        # design for the rate, interpolating where the rate needs it
+        if rate < PLUTO_MIN_RATE:
+            raise ValueError(f"Sample rates below {PLUTO_MIN_RATE:.0f} are not supported")
+        builtin = rate < PLUTO_MIN_RATE_NO_FIR
+        self.fir_config = {'interpolation': 4, 'decimation': 4, 'tx_coefficients': None} if builtin else None
+        self._filter = None
+        self._fir_enabled = builtin
+        self._sample_rate = rate
+
+    def _set_iio_attr(self, channel_name, attr_name, output, value):
+        """Writes an AD9361 channel attribute directly, bypassing pyadi-iio's property logic."""
+        if (channel_name, attr_name) == ("voltage0", "filter_fir_en"):
+            self._fir_enabled = bool(value)
+        elif (channel_name, attr_name) == ("voltage0", "sampling_frequency"):
+            self._sample_rate = value
+        else:
+            raise ValueError(f"{self.__class__.__name__} has no attribute {attr_name} on channel {channel_name}")
+
+    @property
+    def filter(self):
+        """Path of the loaded FIR configuration (.ftr), as in pyadi-iio."""
+        return self._filter
+
+    @filter.setter
+    def filter(self, path):
+        self.fir_config = read_fir_config(path)
+        self._filter = path
+
+    @property
+    def fir_interpolation(self):
+        """Interpolation the TX FIR currently applies (1 when it is disabled)."""
+        return self.fir_config['interpolation'] if self._fir_enabled and self.fir_config else 1
+
+    def check_rates(self):
+        """
+        Verifies that the sample rate and TX FIR setup line up.
+
+        Raises:
+            ValueError: If the AD9361 could not run the configured sample rate.
+        """
+        if self._fir_enabled and self.fir_config is None:
+            raise ValueError("TX FIR enabled without a filter configuration loaded")
+        interpolation = self.fir_interpolation
+        if not PLUTO_MIN_RATE_NO_FIR <= self.sample_rate * interpolation <= PLUTO_MAX_RATE:
+            raise ValueError(f"Sample rate {self.sample_rate / 1e3:.1f} kHz is not supported with TX FIR "
+                             f"interpolation {interpolation} (needs "
+                             f"{PLUTO_MIN_RATE_NO_FIR / interpolation / 1e3:.1f} kHz "
+                             f"to {PLUTO_MAX_RATE / interpolation / 1e6:.2f} MHz)")
+
+    def _count(self, num_samples):
+        """Updates the sample counters for one buffer."""
+        if self._first_tx is None:
+            self._first_tx = time.perf_counter()
+        self.stats['buffers'] += 1
+        self.stats['samples'] += num_samples
+
+    @staticmethod
+    def _to_wire(data):
+        """Converts complex samples to interleaved int16 bytes the way pyadi-iio's tx() does."""
+        wire = np.empty(2 * len(data), dtype=np.int16)
+        wire[0::2] = np.real(data)
+        wire[1::2] = np.imag(data)
+        return bytearray(wire)
+
+    def tx(self, data):
+        """Takes complex samples, paying the same conversion cost as pyadi-iio."""
+        self._to_wire(data)
+        self._submit(data, len(data))
+
+    def tx_interleaved(self, iq):
+        """Takes interleaved int16 I/Q (see tx_interleaved())."""
+        self._submit(iq, len(iq) // 2)
+
+    def _submit(self, data, num_samples):
+        """Validates a buffer, then streams it or loads it as the cyclic buffer."""
+        self.check_rates()
+        if num_samples > self.max_buffer_samples:
+            raise ValueError(f"Buffer of {num_samples} samples exceeds the {self.max_buffer_samples}-sample device limit")
+        if not self.tx_cyclic_buffer:
+            self._send(data, num_samples)
+        elif self._cyclic is not None:
+            raise RuntimeError("A cyclic buffer is already loaded; call tx_destroy_buffer() first")
+        else:
+            self._cyclic = (data, num_samples, time.perf_counter())
+
+    def _send(self, data, num_samples):
+        """Streams one buffer (complex or interleaved int16)."""
+        self._count(num_samples)
+
+    def tx_destroy_buffer(self):
+        """Stops a looping cyclic buffer, accounting for every repeat it played."""
+        if self._cyclic is None:
+            return
+        data, num_samples, start = self._cyclic
+        self._cyclic = None
+        repeats = (time.perf_counter() - start) * self.sample_rate / num_samples
+        self.stats['cyclic_repeats'] += repeats
+        self._cyclic_played(data, num_samples, repeats)
+
+    def _cyclic_played(self, data, num_samples, repeats):
+        """Counts the samples a cyclic buffer played while it looped `repeats` times."""
+        if self._first_tx is None:
+            self._first_tx = time.perf_counter() - repeats * num_samples / self.sample_rate
+        self.stats['buffers'] += 1
+        self.stats['samples'] += int(repeats * num_samples)
+
+    def close(self):
+        """Releases any resources held by the backend."""
+        pass
+
+    def print_stats(self):
+        """Prints how many samples went through and how fast relative to real time."""
+        samples = self.stats['samples']
+        elapsed = time.perf_counter() - self._first_tx if self._first_tx else 0.0
+        airtime = samples / float(self.sample_rate)
+        rate = f"{samples / elapsed / 1e6:.2f} MS/s, {airtime / elapsed:.1f}x real time" if elapsed > 0 else "n/a"
+        print(f"{self.__class__.__name__} ({self.uri}): {self.stats['buffers']} buffers, "
+              f"{samples} samples ({airtime:.2f}s of airtime) in {elapsed:.2f}s [{rate}]")
+        if self.stats['cyclic_repeats']:
+            print(f"  Cyclic buffer looped {self.stats['cyclic_repeats']:.1f} times with no host involvement")
+        if self.fir_interpolation > 1:
+            print(f"  TX FIR x{self.fir_interpolation}: {self.sample_rate / 1e3:.1f} kS/s from the host, "
+                  f"{self.sample_rate * self.fir_interpolation / 1e3:.1f} kS/s into the half-band interpolators")
+
+class NullSink(TxBackend):
+    """Discards samples as fast as they arrive; measures raw DSP throughput."""
+
+class FileSink(TxBackend):
+    """
+    Writes transmitted IQ to disk instead of the air.
+
+    Samples are stored as complex64 normalized to the DAC full scale, either
+    as a raw .cfile or as a SigMF recording with its metadata file.
+    """
+
+    def __init__(self, path, sigmf=False):
+        """
+        Args:
+            path (str): Output file (.cfile), or SigMF base name when sigmf is True.
+            sigmf (bool): Write path.sigmf-data and path.sigmf-meta.
+        """
+        super().__init__(("sigmf:" if sigmf else "file:") + path)
+        self.sigmf = sigmf
+        if sigmf:
+            base = path[:-len(".sigmf-data")] if path.endswith(".sigmf-data") else path
+            self.data_path = base + ".sigmf-data"
+            self.meta_path = base + ".sigmf-meta"
+        else:
+            self.data_path = path
+            self.meta_path = None
+        self._file = open(self.data_path, "wb")
+
+    def _send(self, data, num_samples):
+        self._count(num_samples)
+        self._write(data)
+
+    def _write(self, data):
+        """Appends complex or interleaved int16 samples to the data file as cf32."""
+        if data.dtype == np.int16:
+            (data.astype(np.float32) / DAC_FULL_SCALE).view(np.complex64).tofile(self._file)
+        else:
+            (np.asarray(data, dtype=np.complex64) / DAC_FULL_SCALE).astype(np.complex64).tofile(self._file)
+
+    def _cyclic_played(self, data, num_samples, repeats):
+        """Writes the looped buffer once per complete repeat."""
+        for _ in range(int(repeats)):
+            self._count(num_samples)
+            self._write(data)
+
+    def close(self):
+        """Closes the data file and writes the SigMF metadata."""
+        if self._file.closed:
+            return
+        self._file.close()
+        if self.meta_path:
+            meta = {
+                "global": {
+                    "core:datatype": "cf32_le",
+                    "core:sample_rate": float(self.sample_rate),
+                    "core:version": "1.0.0",
+                    "core:description": "FM transmission captured from transmit_fm",
+                },
+                "captures": [{"core:sample_start": 0, "core:frequency": float(self.tx_lo)}],
+                "annotations": [],
+            }
+            with open(self.meta_path, "w") as f:
+                json.dump(meta, f, indent=2)
+        print(f"Wrote {self.stats['samples']} IQ samples to '{self.data_path}'")
+
+class SimulatedPluto(TxBackend):
+    """
+    Simulated PlutoSDR that consumes samples in real time.
+
+    tx() blocks like the real driver once KERNEL_BUFFERS buffers are queued,
+    and the simulated DAC plays them out at sample_rate. If the host falls
+    behind and the queue drains, an underrun is recorded.
+    """
+
+    realtime = True
+
+    def __init__(self, uri="sim:", kernel_buffers=KERNEL_BUFFERS):
+        """
+        Args:
+            uri (str): Device URI; only used in reports.
+            kernel_buffers (int): Number of buffers queued before tx() blocks.
+        """
+        super().__init__(uri)
+        self.kernel_buffers = kernel_buffers
+        self.stats.update({'underruns': 0, 'underrun_seconds': 0.0})
+        self._play_end = None # Wall time at which the queued samples finish playing
+        self._lock = threading.Lock()
+
+    def _send(self, data, num_samples):
+        """Queues samples for the simulated DAC, blocking while the queue is full."""
+        duration = num_samples / float(self.sample_rate)
+        with self._lock:
+            now = time.perf_counter()
+            if self._play_end is None:
+                self._play_end = now
+            elif self._play_end < now:
+                # The DAC ran out of samples before this buffer arrived
+                self.stats['underruns'] += 1
+                self.stats['underrun_seconds'] += now - self._play_end
+                self._play_end = now
+
+            # Block until there is room for this buffer in the kernel queue
+            wait = self._play_end - now - (self.kernel_buffers - 1) * duration
+            if wait > 0:
+                time.sleep(wait)
+            self._play_end += duration
+            self._count(num_samples)
+
+    def tx_destroy_buffer(self):
+        """Drops any queued samples, like the real driver."""
+        super().tx_destroy_buffer()
+        with self._lock:
+            self._play_end = None
+
+    def print_stats(self):
+        super().print_stats()
+        print(f"  DAC underruns: {self.stats['underruns']} ({self.stats['underrun_seconds'] * 1e3:.1f} ms of dead air)")